@@ -0,0 +1,153 @@
+"""
+Time to first token of the answer pipeline against the local fake LLM server (fake_llm_server.py).
+
+A synthetic corpus (corpus.py) is ingested with the offline hash embedder into a temporary DB,
+then two measurements run through the real Assembler / ChatClient code:
+    pipeline   Assembler.answer per question: retrieve ms, time to first token (retrieval
+               included), the model's own TTFT, total ms, and how many HTTP connections the
+               pooled client opened after one warm-up request (0: every answer reused it)
+    prefix     the same retrieved chunks asked --variants times with their ranking shuffled
+               (a paraphrased question reranks the same sources): cached prompt tokens and
+               model TTFT with pack_context(order="source") vs order="relevance"
+
+    python benchmarks/answer_latency.py
+    python benchmarks/answer_latency.py --chunks 5k --questions 50 --output answer.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "src", "utils")]
+
+from config import Config                           # noqa: E402
+from metrics import set_log_level                   # noqa: E402
+import corpus                                       # noqa: E402
+import fake_llm_server                              # noqa: E402
+
+
+def percentiles(values):
+    if not values:
+        return {}
+    return {"p50": round(float(np.percentile(values, 50)), 2), "p95": round(float(np.percentile(values, 95)), 2),
+            "mean": round(float(np.mean(values)), 2)}
+
+
+def run_pipeline(Assembler, questions, server):
+    # warm up: client import / creation and the first connection are not what is measured
+    from api import ChatClient
+    ChatClient.complete([{"role": "user", "content": "warm up"}], max_tokens=1)
+    server.reset()
+    rows = []
+    for question in questions:
+        stream = Assembler.answer(question)
+        for _ in stream:
+            pass
+        rows.append(stream.stats)
+    return {
+        "questions": len(rows),
+        "retrieve_ms": percentiles([r["retrieve_ms"] for r in rows]),
+        "ttft_ms": percentiles([r["ttft_ms"] for r in rows]),
+        "llm_ttft_ms": percentiles([r["llm_ttft_ms"] for r in rows]),
+        "total_ms": percentiles([r["total_ms"] for r in rows]),
+        "context_tokens": percentiles([r["context_tokens"] for r in rows]),
+        "http_connections": server.stats["connections"],
+    }
+
+
+def run_prefix(Assembler, questions, server, variants, order, seed):
+    from answer import pack_context, build_messages
+    from api import ChatClient
+    server.reset()
+    rng = random.Random(seed)
+    ttft, cached, prompt = [], 0, 0
+    for question in questions:
+        records = Assembler.query_text(question, Config.ANSWER_N_RESULTS, columnar=True)
+        for _ in range(variants):
+            ranking = list(range(len(records)))
+            rng.shuffle(ranking)
+            packed = pack_context(records.take(ranking), order=order)
+            stats = {}
+            for _ in ChatClient.stream(build_messages(question, packed), stats=stats):
+                pass
+            ttft.append(stats["llm_ttft_ms"])
+            cached += stats["cached_tokens"]
+            prompt += stats["prompt_tokens"]
+    return {"order": order, "requests": len(ttft), "llm_ttft_ms": percentiles(ttft),
+            "cached_share": round(cached / prompt, 3) if prompt else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", default="2k", help="corpus size, e.g. 2k, 50k")
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--variants", type=int, default=3, help="ranking shuffles per question (prefix run)")
+    parser.add_argument("--ttft-ms", type=float, default=150.0, help="fake server base time to first token")
+    parser.add_argument("--prefill-us-per-token", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "eco_rag_answer"))
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+    set_log_level("WARNING")
+
+    server = fake_llm_server.start(ttft_ms=args.ttft_ms, prefill_us_per_token=args.prefill_us_per_token,
+                                   token_ms=args.token_ms)
+    # before api.py is imported: it reads the endpoint at import time
+    Config.BASE_URL, Config.API_KEY, Config.MODEL = server.base_url, "fake", "fake"
+    Config.EMBEDDING_MODEL = "hash:256"
+    db_dir = tempfile.mkdtemp(prefix="answer-", dir=os.makedirs(args.workdir, exist_ok=True) or args.workdir)
+    Config.DB_PATH = os.path.join(db_dir, "db")
+    Config.EMBED_CACHE_PATH = os.path.join(db_dir, "embeddings.sqlite3")
+    Config.MANIFEST_PATH = os.path.join(db_dir, "manifest.sqlite3")
+    Config.LEXICAL_INDEX_PATH = os.path.join(db_dir, "bm25.sqlite3")
+    Config.DEDUP_INDEX_PATH = os.path.join(db_dir, "dedup.sqlite3")
+    from assembler import Assembler
+
+    n_chunks = corpus.parse_scale(args.chunks)
+    corpus_dir = os.path.join(args.workdir, f"corpus-{args.chunks}-{args.seed}")
+    corpus.generate(corpus_dir, n_chunks, args.seed)
+    start = time.perf_counter()
+    Assembler.store_directory(corpus_dir)
+    ingest_s = time.perf_counter() - start
+
+    rng = random.Random(args.seed)
+    files = list(corpus.iter_files(corpus_dir))
+    questions = []
+    for path in rng.sample(files, min(args.questions, len(files))):
+        with open(path, encoding="utf-8") as f:
+            lines = [line for line in f.read().splitlines() if len(line) > 40]
+        questions.append(rng.choice(lines)[:60])
+
+    report = {
+        "chunks": Assembler.db.count(), "ingest_s": round(ingest_s, 2),
+        "fake_server": {"ttft_ms": args.ttft_ms, "prefill_us_per_token": args.prefill_us_per_token,
+                        "token_ms": args.token_ms},
+        "pipeline": run_pipeline(Assembler, questions, server),
+        "prefix": [run_prefix(Assembler, questions, server, args.variants, order, args.seed)
+                   for order in ("source", "relevance")],
+    }
+    pipeline = report["pipeline"]
+    print(f"{report['chunks']} chunks, {pipeline['questions']} questions, "
+          f"{pipeline['http_connections']} new HTTP connection(s) after warm-up")
+    for key in ("retrieve_ms", "ttft_ms", "llm_ttft_ms", "total_ms", "context_tokens"):
+        print(f"  {key:<16} p50 {pipeline[key]['p50']:>9.2f}   p95 {pipeline[key]['p95']:>9.2f}")
+    print(f"prefix reuse, {args.variants} rankings per question:")
+    for row in report["prefix"]:
+        print(f"  order={row['order']:<10} cached {row['cached_share']:>6.1%}   "
+              f"llm ttft p50 {row['llm_ttft_ms']['p50']:>8.2f} ms")
+    Assembler.close()
+    server.shutdown()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
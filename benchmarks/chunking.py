@@ -0,0 +1,106 @@
+"""
+Chunker benchmark: native single-pass splitter vs langchain's RecursiveCharacterTextSplitter
+on the .md / .txt files under data/ (same chunk size / overlap, as the ingest path calls them).
+
+    python benchmarks/chunking.py                 # table
+    python benchmarks/chunking.py --json          # machine readable
+    python benchmarks/chunking.py --scale 20      # every file repeated 20x, large dump case
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "src", "utils")]
+
+from config import Config                           # noqa: E402
+from chunker import ChunkerFactory                  # noqa: E402
+
+# punctuation a chunk should end with, never start with
+_CLOSING = set("。！？；，、：.,;:!?）)」』”’")
+
+
+def load_corpus(data_dir, scale):
+    corpus = []
+    for dirpath, dirnames, filenames in os.walk(data_dir):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            ext = os.path.splitext(filename)[1]
+            if ext in (".md", ".txt"):
+                with open(os.path.join(dirpath, filename), encoding="utf-8", errors="ignore") as f:
+                    text = f.read()
+                corpus.append((ext, "\n\n".join([text] * scale)))
+    return corpus
+
+
+def run_engine(corpus, engine, chunk_size, chunk_overlap):
+    chunks = []
+    start = time.perf_counter()
+    for ext, text in corpus:
+        chunker = ChunkerFactory._get_chunker(ext)
+        for chunk, span in chunker.iter_spans(text, chunk_size, chunk_overlap, engine=engine):
+            chunks.append((ext, text, chunk, span))
+    return time.perf_counter() - start, chunks
+
+
+def summarize(seconds, chunks, n_chars):
+    lengths = [len(chunk) for _, _, chunk, _ in chunks]
+    with_offsets = [(text, chunk, span) for _, text, chunk, span in chunks if "start_offset" in span]
+    return {
+        "seconds": round(seconds, 4),
+        "mb_per_second": round(n_chars / 1e6 / seconds, 2),
+        "chunks": len(chunks),
+        "mean_chars": round(sum(lengths) / max(1, len(lengths)), 1),
+        "max_chars": max(lengths, default=0),
+        "starts_with_punctuation": sum(1 for _, _, chunk, _ in chunks if chunk[:1] in _CLOSING),
+        "offsets_checked": len(with_offsets),
+        "offsets_wrong": sum(
+            1 for text, chunk, span in with_offsets
+            if text[span["start_offset"]:span["end_offset"]] != chunk
+        ),
+        "with_heading_path": sum(1 for _, _, _, span in chunks if span.get("heading_path")),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--data", default=str(Config.DATA_DIR))
+    parser.add_argument("--scale", type=int, default=1, help="repeat every file this many times")
+    parser.add_argument("--repeat", type=int, default=3, help="best of n runs")
+    parser.add_argument("--chunk-size", type=int, default=Config.CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=Config.CHUNK_OVERLAP)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.data, args.scale)
+    n_chars = sum(len(text) for _, text in corpus)
+    # chunker prints a line per file, keep the report readable
+    devnull = open(os.devnull, "w")
+    results = {"files": len(corpus), "chars": n_chars,
+               "chunk_size": args.chunk_size, "chunk_overlap": args.chunk_overlap}
+    for engine in ("langchain", "native"):
+        runs = []
+        for _ in range(args.repeat):
+            stdout, sys.stdout = sys.stdout, devnull
+            try:
+                runs.append(run_engine(corpus, engine, args.chunk_size, args.chunk_overlap))
+            finally:
+                sys.stdout = stdout
+        seconds, chunks = min(runs, key=lambda r: r[0])
+        results[engine] = summarize(seconds, chunks, n_chars)
+    results["speedup"] = round(results["langchain"]["seconds"] / results["native"]["seconds"], 2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{results['files']} files, {n_chars / 1e6:.1f}M chars, "
+          f"chunk_size={args.chunk_size} overlap={args.chunk_overlap}")
+    for engine in ("langchain", "native"):
+        print(f"  {engine:<10} {results[engine]}")
+    print(f"  speedup    {results['speedup']}x")
+
+
+if __name__ == "__main__":
+    main()
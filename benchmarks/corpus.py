@@ -0,0 +1,155 @@
+"""
+Synthetic corpus generator for the benchmarks.
+
+Writes markdown (and some plain text) files whose sections are sized so that
+the chunker makes about one chunk per section: a corpus of N sections gives
+about N chunks at the configured CHUNK_SIZE. The content is pseudo-random
+but reproducible from the seed, a mix of latin words and CJK sentences.
+
+    python benchmarks/corpus.py 10k /tmp/corpus-10k        # generate once
+    python benchmarks/corpus.py 1M  /tmp/corpus-1M --seed 7
+
+A finished corpus directory has a corpus.json description; generate() reuses
+it when the same parameters are asked for again.
+"""
+import os
+import sys
+import json
+import random
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "src", "utils")]
+
+from config import Config                           # noqa: E402
+
+_SYLLABLES = ["ka", "ri", "to", "men", "sa", "lo", "vek", "tor", "em", "bed", "da", "ta",
+              "qu", "er", "y", "in", "dex", "re", "ward", "po", "li", "cy", "ag", "ent"]
+# common CJK characters, sentences are drawn from these
+_HANZI = ("的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经"
+          "十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严")
+_CJK_ENDS = "。。。！？；"
+_LATIN_ENDS = ".....!?;"
+
+
+def _word(rng):
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(1, 3)))
+
+
+def _latin_sentence(rng):
+    words = [_word(rng) for _ in range(rng.randint(6, 18))]
+    words[0] = words[0].capitalize()
+    if rng.random() < 0.2:
+        words.insert(rng.randrange(len(words)), f"{rng.randint(0, 999)}.{rng.randint(0, 99)}")
+    return " ".join(words) + rng.choice(_LATIN_ENDS)
+
+
+def _cjk_sentence(rng):
+    parts = []
+    for _ in range(rng.randint(1, 3)):
+        parts.append("".join(rng.choice(_HANZI) for _ in range(rng.randint(6, 20))))
+    return "，".join(parts) + rng.choice(_CJK_ENDS)
+
+
+def _paragraph(rng, n_chars, cjk_ratio):
+    sentences, size = [], 0
+    while size < n_chars:
+        s = _cjk_sentence(rng) if rng.random() < cjk_ratio else _latin_sentence(rng)
+        sentences.append(s)
+        size += len(s) + 1
+    return " ".join(sentences)[:n_chars].rstrip()
+
+
+def _section_chars(rng, chunk_size):
+    # 50-85% of a chunk: the cut falls on the section boundary, one chunk per section
+    return int(chunk_size * rng.uniform(0.5, 0.85))
+
+
+def write_file(path, rng, sections, chunk_size, markdown, cjk_ratio):
+    """
+    One file of `sections` sections (markdown: '## title' headings, text: blank lines)
+    Returns the number of characters written
+    """
+    parts = []
+    if markdown:
+        parts.append(f"# {_word(rng).capitalize()} {_word(rng)}")
+    for i in range(sections):
+        body = _paragraph(rng, _section_chars(rng, chunk_size), cjk_ratio)
+        if markdown:
+            level = "##" if i % 4 == 0 else "###"
+            body = f"{level} {i + 1} {_word(rng).capitalize()} {_word(rng)}\n\n{body}"
+        parts.append(body)
+    text = "\n\n".join(parts) + "\n"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return len(text)
+
+
+def parse_scale(value):
+    """
+    '10k' -> 10000, '1M' -> 1000000, '2500' -> 2500
+    """
+    value = str(value).strip()
+    factor = {"k": 1_000, "m": 1_000_000}.get(value[-1:].lower(), 1)
+    return int(float(value[:-1] if factor > 1 else value) * factor)
+
+
+def generate(root, n_chunks, seed=0, chunks_per_file=100, chunk_size=Config.CHUNK_SIZE,
+             text_ratio=0.2, cjk_ratio=0.5):
+    """
+    Write a corpus of about n_chunks chunks under root (files spread over subdirectories).
+    Reuses root if it already holds a corpus made with the same parameters.
+    Returns the corpus description {'chunks', 'files', 'chars', 'seed', ...}
+    """
+    params = {"chunks": n_chunks, "seed": seed, "chunks_per_file": chunks_per_file,
+              "chunk_size": chunk_size, "text_ratio": text_ratio, "cjk_ratio": cjk_ratio}
+    description_path = os.path.join(root, "corpus.json")
+    if os.path.exists(description_path):
+        with open(description_path, encoding="utf-8") as f:
+            description = json.load(f)
+        if all(description.get(k) == v for k, v in params.items()):
+            return description
+
+    rng = random.Random(seed)
+    n_files = max(1, -(-n_chunks // chunks_per_file))
+    chars = 0
+    for i in range(n_files):
+        sections = min(chunks_per_file, n_chunks - i * chunks_per_file)
+        markdown = rng.random() >= text_ratio
+        subdir = os.path.join(root, f"D{i // 1000:03d}")
+        os.makedirs(subdir, exist_ok=True)
+        path = os.path.join(subdir, f"f{i:07d}{'.md' if markdown else '.txt'}")
+        chars += write_file(path, rng, sections, chunk_size, markdown, cjk_ratio)
+
+    description = dict(params, files=n_files, chars=chars)
+    with open(description_path, "w", encoding="utf-8") as f:
+        json.dump(description, f, indent=2)
+    return description
+
+
+def iter_files(root):
+    """
+    Corpus files in a stable order
+    """
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith((".md", ".txt")):
+                yield os.path.join(dirpath, filename)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scale", help="number of chunks, e.g. 10k, 100k, 1M")
+    parser.add_argument("root", help="output directory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunks-per-file", type=int, default=100)
+    parser.add_argument("--chunk-size", type=int, default=Config.CHUNK_SIZE)
+    args = parser.parse_args()
+    description = generate(args.root, parse_scale(args.scale), args.seed,
+                           args.chunks_per_file, args.chunk_size)
+    print(json.dumps(description, indent=2))
+
+
+if __name__ == "__main__":
+    main()
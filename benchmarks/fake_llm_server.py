@@ -0,0 +1,177 @@
+"""
+Local fake of an OpenAI-compatible chat endpoint, for the answer pipeline benchmark and manual tests.
+
+POST /v1/chat/completions (streamed as server-sent events, or one JSON response)
+GET  /v1/models
+Latency model: time to first token = --ttft-ms + --prefill-us-per-token for every prompt token
+that is not in its prefix cache, then one token every --token-ms. The prefix cache works like
+the providers' prompt caching: prompts are hashed in blocks of 64 (approximate) tokens from the
+start, the matching blocks are reported as usage.prompt_tokens_details.cached_tokens.
+Connections are kept alive (HTTP/1.1), GET /stats tells how many a client opened.
+
+    python benchmarks/fake_llm_server.py --port 8765
+    BASE_URL=http://127.0.0.1:8765/v1 API_KEY=x MODEL=fake python src/utils/api.py
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "src", "utils")]
+
+from textSplitter import approx_token_starts        # noqa: E402
+
+CACHE_BLOCK = 64
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, port=0, ttft_ms=150.0, prefill_us_per_token=50.0, token_ms=10.0, reply_tokens=40):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.ttft_ms = ttft_ms
+        self.prefill_us_per_token = prefill_us_per_token
+        self.token_ms = token_ms
+        self.reply_tokens = reply_tokens
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}/v1"
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Forget the prefix cache and the counters
+        """
+        with self.lock:
+            self.prefixes = set()
+            self.stats = {"connections": 0, "requests": 0, "prompt_tokens": 0, "cached_tokens": 0}
+
+    def prompt_cache(self, prompt):
+        """
+        (prompt tokens, cached tokens) of a prompt, its blocks are cached afterwards
+        """
+        starts = approx_token_starts(prompt)
+        cuts = [starts[i] for i in range(CACHE_BLOCK, len(starts), CACHE_BLOCK)]
+        keys = [hashlib.sha1(prompt[:cut].encode("utf-8")).digest() for cut in cuts]
+        with self.lock:
+            hits = 0
+            while hits < len(keys) and keys[hits] in self.prefixes:
+                hits += 1
+            self.prefixes.update(keys)
+            cached = hits * CACHE_BLOCK
+            self.stats["requests"] += 1
+            self.stats["prompt_tokens"] += len(starts)
+            self.stats["cached_tokens"] += cached
+        return len(starts), cached
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.stats["connections"] += 1
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.endswith("/models"):
+            self._json({"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "eco_rag"}]})
+        elif self.path.endswith("/stats"):
+            with self.server.lock:
+                self._json(dict(self.server.stats))
+        else:
+            self._json({"error": {"message": "not found"}}, 404)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._json({"error": {"message": "not found"}}, 404)
+            return
+        server = self.server
+        messages = body.get("messages", [])
+        prompt = "".join(f"{m.get('role')}\n{m.get('content')}\n" for m in messages)
+        prompt_tokens, cached = server.prompt_cache(prompt)
+        n_tokens = min(server.reply_tokens, body.get("max_tokens") or server.reply_tokens)
+        tokens = [f" token{i}" if i else "[1]" for i in range(n_tokens)]
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": n_tokens,
+                 "total_tokens": prompt_tokens + n_tokens, "prompt_tokens_details": {"cached_tokens": cached}}
+        model = body.get("model") or "fake"
+        time.sleep((server.ttft_ms + (prompt_tokens - cached) * server.prefill_us_per_token / 1000) / 1000)
+
+        if not body.get("stream"):
+            self._json({"id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()),
+                        "model": model, "usage": usage,
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": "".join(tokens)}}]})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(tokens):
+            if i:
+                time.sleep(server.token_ms / 1000)
+            self._event(self._chunk(model, {"role": "assistant", "content": token} if i == 0 else {"content": token}))
+        self._event(self._chunk(model, {}, finish_reason="stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            self._event({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [], "usage": usage})
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    @staticmethod
+    def _chunk(model, delta, finish_reason=None):
+        return {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+    def _event(self, payload):
+        self._write_chunk(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start(port=0, **options):
+    """
+    Run a FakeLLMServer in a background thread, server.base_url is the OpenAI base_url
+    """
+    server = FakeLLMServer(port, **options)
+    threading.Thread(target=server.serve_forever, daemon=True, name="fake-llm").start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft-ms", type=float, default=150.0)
+    parser.add_argument("--prefill-us-per-token", type=float, default=50.0)
+    parser.add_argument("--token-ms", type=float, default=10.0)
+    parser.add_argument("--reply-tokens", type=int, default=40)
+    args = parser.parse_args()
+    server = FakeLLMServer(args.port, args.ttft_ms, args.prefill_us_per_token, args.token_ms, args.reply_tokens)
+    print(f"Fake OpenAI-compatible server on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
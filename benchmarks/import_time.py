@@ -0,0 +1,103 @@
+"""
+Import-time guard: cold-start cost of the package entry points.
+
+Every target is imported in a fresh interpreter (python -X importtime),
+the best of --repeat runs is compared with its budget, and heavy
+dependencies that must stay lazy are checked against sys.modules.
+
+    python benchmarks/import_time.py            # table, exit code 1 if a budget is broken
+    python benchmarks/import_time.py --json     # machine readable
+    IMPORT_BUDGET_SCALE=2 python benchmarks/import_time.py   # slower machine
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+HEAVY = ["chromadb", "langchain_text_splitters", "huggingface_hub", "tqdm", "pydantic",
+         "openai", "torch", "transformers", "onnxruntime", "PyPDF2"]
+
+# statement -> (budget in ms, modules that must not be imported)
+TARGETS = {
+    "import utils": (50, HEAVY + ["numpy"]),
+    "import chunker": (50, HEAVY + ["numpy"]),
+    "import loader": (50, HEAVY + ["numpy"]),
+    "import lexicalIndex": (50, HEAVY + ["numpy"]),
+    "from utils import Assembler": (250, HEAVY),
+}
+
+_PROBE = """
+import sys, time, json
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(sys.modules)}}))
+"""
+
+
+def measure(statement):
+    """
+    One fresh interpreter: returns (ms, loaded modules, slowest imports by self time)
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([SRC, os.path.join(SRC, "utils")]))
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _PROBE.format(statement=statement)],
+        capture_output=True, text=True, env=env, cwd=SRC
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"{statement!r} failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    slowest = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        slowest.append((int(self_us) / 1000, name.strip()))
+    slowest.sort(reverse=True)
+    return result["ms"], set(result["modules"]), slowest[:5]
+
+
+def run(repeat=5, scale=1.0):
+    report = []
+    for statement, (budget, forbidden) in TARGETS.items():
+        runs = [measure(statement) for _ in range(repeat)]
+        best_ms, modules, slowest = min(runs, key=lambda r: r[0])
+        leaked = sorted(m for m in forbidden if m in modules)
+        report.append({
+            "statement": statement,
+            "best_ms": round(best_ms, 1),
+            "budget_ms": round(budget * scale, 1),
+            "leaked": leaked,
+            "slowest": [(round(ms, 1), name) for ms, name in slowest],
+            "ok": best_ms <= budget * scale and not leaked,
+        })
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+    scale = float(os.getenv("IMPORT_BUDGET_SCALE", "1"))
+
+    report = run(args.repeat, scale)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for r in report:
+            status = "ok  " if r["ok"] else "FAIL"
+            print(f"{status} {r['statement']:<30} {r['best_ms']:>7.1f} ms  (budget {r['budget_ms']} ms)")
+            if r["leaked"]:
+                print(f"     imports heavy modules eagerly: {', '.join(r['leaked'])}")
+            if not r["ok"]:
+                print(f"     slowest: {r['slowest']}")
+    sys.exit(0 if all(r["ok"] for r in report) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Ingestion and query benchmark on a synthetic corpus (see corpus.py).
+
+Stages, each timed on its own with the same code the Assembler uses:
+    load      DataLoaderFactory.iter_load            per file
+    chunk     ChunkerFactory.iter_chunks             per file
+    embed     EmbedderFactory.embed (--embedder spec, offline hash:384 by default)   per EMBED_STREAM_GROUP chunks
+    upsert    RecordBatch + VectorDatabase.add_documents, INGEST_WRITE_BATCH records per call
+    vector_query    VectorDatabase.query_with_vector, one query per call
+    batch_query     VectorDatabase.query_with_vectors, all queries in one call
+    metadata_query  VectorDatabase.query_by_metadata on file_path
+    delete          VectorDatabase.delete_by_files, one file per call
+Files stream through load -> chunk -> embed -> upsert, so memory stays flat at 1M chunks.
+Every stage reports items/s and per-call latency percentiles; the results go to JSON.
+
+    python benchmarks/ingest_query.py                                  # 10k chunks
+    python benchmarks/ingest_query.py --scales 10k,100k,1M --output bench.json
+    python benchmarks/ingest_query.py --compare before.json            # flag regressions
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import platform
+import argparse
+import subprocess
+import contextlib
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "src", "utils")]
+
+from config import Config                           # noqa: E402
+from loader import DataLoaderFactory                # noqa: E402
+from chunker import ChunkerFactory                  # noqa: E402
+from embedder import EmbedderFactory                # noqa: E402
+from recordBatch import RecordBatch                 # noqa: E402
+from vectorDatabase import VectorDatabase           # noqa: E402
+from metrics import set_log_level                   # noqa: E402
+import corpus                                       # noqa: E402
+
+STAGES = ["load", "chunk", "embed", "upsert", "vector_query", "batch_query", "metadata_query", "delete"]
+
+
+class StageTimer:
+    """
+    Calls, items and per-call latency of one stage
+    """
+    def __init__(self):
+        self.latencies = []
+        self.items = 0
+
+    @contextlib.contextmanager
+    def time(self, items=1):
+        start = time.perf_counter()
+        yield
+        self.add(time.perf_counter() - start, items)
+
+    def add(self, seconds, items):
+        self.latencies.append(seconds)
+        self.items += items
+
+    def to_dict(self):
+        seconds = sum(self.latencies)
+        ms = np.asarray(self.latencies) * 1000 if self.latencies else np.zeros(1)
+        return {
+            "calls": len(self.latencies),
+            "items": self.items,
+            "seconds": round(seconds, 4),
+            "items_per_second": round(self.items / seconds, 1) if seconds else None,
+            "latency_ms": {
+                "mean": round(float(ms.mean()), 3),
+                "p50": round(float(np.percentile(ms, 50)), 3),
+                "p95": round(float(np.percentile(ms, 95)), 3),
+                "p99": round(float(np.percentile(ms, 99)), 3),
+                "max": round(float(ms.max()), 3),
+            },
+        }
+
+
+def ingest(files, db, timers, embedder, data_dir, n_queries):
+    """
+    Stream every file through load -> chunk -> embed -> upsert.
+    Returns (chunk count, sample of stored vectors used as queries)
+    """
+    write_batch, group = Config.INGEST_WRITE_BATCH, Config.EMBED_STREAM_GROUP
+    pending, pending_count, samples, n_chunks = [], 0, [], 0
+    # keep a few times n_queries vectors spread over the corpus
+    keep_every = 1
+
+    def flush():
+        batch = RecordBatch.concat(pending)
+        for i in range(0, len(batch), write_batch):
+            part = batch[i:i + write_batch]
+            with timers["upsert"].time(len(part)):
+                if not db.add_documents(**part.to_db_format()):
+                    raise RuntimeError("upsert failed")
+        pending.clear()
+
+    for file_path in files:
+        ext = os.path.splitext(file_path)[1]
+        with timers["load"].time():
+            segments = list(DataLoaderFactory.iter_load(file_path, parallel=False))
+        start = time.perf_counter()
+        chunks = list(ChunkerFactory.iter_chunks(segments, ext))
+        timers["chunk"].add(time.perf_counter() - start, len(chunks))
+        rel_path = Config.get_relative_path(file_path, data_dir)
+        for first in range(0, len(chunks), group):
+            part = chunks[first:first + group]
+            with timers["embed"].time(len(part)):
+                vectors = EmbedderFactory.embed([chunk for chunk, _ in part], model=embedder, cache=False)
+            items = [(first + i, chunk, vector, attrs) for i, ((chunk, attrs), vector) in enumerate(zip(part, vectors))]
+            pending.append(RecordBatch.from_chunks(file_path, rel_path, items))
+            pending_count += len(items)
+            for i in range(len(vectors)):
+                if (n_chunks + i) % keep_every == 0:
+                    samples.append(np.asarray(vectors[i], dtype=np.float32))
+            n_chunks += len(items)
+            if len(samples) > 4 * n_queries:
+                # thin out, the corpus is larger than expected
+                samples, keep_every = samples[::2], keep_every * 2
+        if pending_count >= write_batch:
+            flush()
+            pending_count = 0
+    if pending:
+        flush()
+    return n_chunks, samples
+
+
+def query(db, timers, samples, n_queries, n_results, rel_paths, seed):
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(samples), size=min(n_queries, len(samples)), replace=False)
+    # a query close to a stored chunk, not identical to it
+    queries = np.stack([samples[i] for i in picks])
+    queries += rng.normal(0, 0.05, queries.shape).astype(np.float32)
+    for q in queries:
+        with timers["vector_query"].time():
+            db.query_with_vector(q.tolist(), n_results=n_results)
+    with timers["batch_query"].time(len(queries)):
+        db.query_with_vectors(queries, n_results=n_results)
+    for i in rng.choice(len(rel_paths), size=min(n_queries, len(rel_paths)), replace=False):
+        with timers["metadata_query"].time():
+            db.query_by_metadata({"file_path": rel_paths[i]}, n_results=n_results)
+
+
+def delete(db, timers, rel_paths, fraction, seed):
+    rng = np.random.default_rng(seed + 1)
+    n = max(1, int(len(rel_paths) * fraction))
+    for i in rng.choice(len(rel_paths), size=n, replace=False):
+        start = time.perf_counter()
+        deleted = db.delete_by_files([rel_paths[i]])
+        timers["delete"].add(time.perf_counter() - start, deleted)
+
+
+def run_scale(n_chunks, args, workdir):
+    corpus_dir = os.path.join(workdir, f"corpus-{n_chunks}-{args.seed}")
+    t0 = time.perf_counter()
+    description = corpus.generate(corpus_dir, n_chunks, args.seed, args.chunks_per_file, Config.CHUNK_SIZE)
+    generate_seconds = time.perf_counter() - t0
+    files = list(corpus.iter_files(corpus_dir))
+    rel_paths = [Config.get_relative_path(f, corpus_dir) for f in files]
+
+    db_path = tempfile.mkdtemp(prefix="db-", dir=workdir)
+    timers = {stage: StageTimer() for stage in STAGES}
+    try:
+        db = VectorDatabase("benchmark", path=db_path)
+        start = time.perf_counter()
+        stored, samples = ingest(files, db, timers, args.embedder, corpus_dir, args.queries)
+        ingest_seconds = time.perf_counter() - start
+        query(db, timers, samples, args.queries, args.n_results, rel_paths, args.seed)
+        delete(db, timers, rel_paths, args.delete_fraction, args.seed)
+        remaining = db.count()
+    finally:
+        from registry import ClientRegistry
+        ClientRegistry.close(("chroma", db_path))
+        shutil.rmtree(db_path, ignore_errors=True)
+
+    return {
+        "chunks": stored,
+        "corpus": dict(description, generate_seconds=round(generate_seconds, 2)),
+        "ingest_seconds": round(ingest_seconds, 3),
+        "ingest_chunks_per_second": round(stored / ingest_seconds, 1),
+        "remaining_after_delete": remaining,
+        "stages": {stage: timers[stage].to_dict() for stage in STAGES},
+    }
+
+
+def environment(embedder):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "embedder": embedder,
+        "chunk_size": Config.CHUNK_SIZE,
+        "chunk_overlap": Config.CHUNK_OVERLAP,
+        "chunk_engine": Config.CHUNK_ENGINE,
+        "write_batch": Config.INGEST_WRITE_BATCH,
+        "embed_group": Config.EMBED_STREAM_GROUP,
+    }
+
+
+def compare(report, baseline, threshold):
+    """
+    Stages whose throughput dropped or p95 latency grew by more than threshold (0.2 = 20%)
+    """
+    regressions = []
+    for scale, result in report["scales"].items():
+        old = baseline.get("scales", {}).get(scale)
+        if not old:
+            continue
+        for stage, new_stats in result["stages"].items():
+            old_stats = old["stages"].get(stage)
+            if not old_stats or not old_stats["items_per_second"] or not new_stats["items_per_second"]:
+                continue
+            ratio = new_stats["items_per_second"] / old_stats["items_per_second"]
+            p95_ratio = new_stats["latency_ms"]["p95"] / max(old_stats["latency_ms"]["p95"], 1e-6)
+            if ratio < 1 - threshold or p95_ratio > 1 + threshold:
+                regressions.append({"scale": scale, "stage": stage,
+                                    "throughput_ratio": round(ratio, 3), "p95_ratio": round(p95_ratio, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="10k", help="comma separated chunk counts, e.g. 10k,100k,1M")
+    parser.add_argument("--embedder", default="hash:384",
+                        help="EMBEDDING_MODEL spec: hash:<dim> (offline), local:BAAI/bge-m3, BAAI/bge-m3")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--delete-fraction", type=float, default=0.1, help="share of files deleted one by one")
+    parser.add_argument("--chunks-per-file", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "eco_rag_bench"),
+                        help="generated corpora are kept here and reused")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="baseline JSON report to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="regression threshold for --compare")
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    report = {"environment": environment(args.embedder), "scales": {}}
+    # the library logs every file / upsert, keep the report readable
+    set_log_level("WARNING")
+    for scale in args.scales.split(","):
+        n_chunks = corpus.parse_scale(scale)
+        print(f"== {scale} ({n_chunks} chunks)", file=sys.stderr)
+        result = run_scale(n_chunks, args, args.workdir)
+        report["scales"][scale] = result
+        for stage, stats in result["stages"].items():
+            print(f"   {stage:<15} {stats['items_per_second'] or 0:>12.1f} items/s   "
+                  f"p50 {stats['latency_ms']['p50']:>9.3f} ms   p95 {stats['latency_ms']['p95']:>9.3f} ms",
+                  file=sys.stderr)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.threshold)
+        for r in report["regressions"]:
+            print(f"REGRESSION {r}", file=sys.stderr)
+        exit_code = 1 if report["regressions"] else 0
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
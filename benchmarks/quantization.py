@@ -0,0 +1,149 @@
+"""
+Recall vs memory of the compact vector storage modes (utils/quantization.py).
+
+A synthetic embedding set (normalized, clustered like sentence embeddings) is
+stored in a QuantizedIndex per mode; held-out queries are searched and compared
+with the exact float32 top-k:
+    float32       exact search over the float rows (what chroma keeps in memory)
+    int8          scalar quantization, 1 byte per dimension
+    pq<m>         product quantization, m bytes per vector
+each quantized mode with and without the exact float re-scoring of the best
+--candidates hits. Resident memory counts what stays in RAM (codes, scales,
+id map); the float32 rows are memory-mapped and only read for re-scoring.
+
+    python benchmarks/quantization.py                                  # 100k x 1024
+    python benchmarks/quantization.py --n 1M --dim 1024 --output quant.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+import argparse
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "src", "utils")]
+
+from config import Config                           # noqa: E402
+from quantization import QuantizedIndex, normalize  # noqa: E402
+from metrics import set_log_level                   # noqa: E402
+from corpus import parse_scale                      # noqa: E402
+
+
+def synthetic(n, dim, n_queries, clusters, seed):
+    """
+    n vectors + n_queries held-out queries around `clusters` random centers
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+
+    def sample(count):
+        out = np.empty((count, dim), dtype=np.float32)
+        for start in range(0, count, 65536):
+            size = min(65536, count - start)
+            picks = rng.integers(0, clusters, size)
+            out[start:start + size] = centers[picks] + 1.5 * rng.standard_normal((size, dim)).astype(np.float32)
+        return normalize(out)
+    return sample(n), sample(n_queries)
+
+
+def exact_top(data, queries, k, block=65536):
+    """
+    Ground truth: exact top-k rows by cosine (blocked matmul + argpartition)
+    """
+    best_rows = np.empty((len(queries), 0), dtype=np.int64)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    for start in range(0, len(data), block):
+        scores = queries @ data[start:start + block].T
+        top = np.argpartition(-scores, min(k, scores.shape[1]) - 1, axis=1)[:, :k]
+        best_rows = np.concatenate([best_rows, top + start], axis=1)
+        best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+        keep = np.argsort(-best_scores, axis=1)[:, :k]
+        best_rows = np.take_along_axis(best_rows, keep, axis=1)
+        best_scores = np.take_along_axis(best_scores, keep, axis=1)
+    return best_rows
+
+
+def recall(found, truth):
+    return float(np.mean([len(set(f) & set(t)) / len(t) for f, t in zip(found, truth)]))
+
+
+def run_mode(method, data, queries, truth, args, workdir, pq_subvectors=None):
+    path = os.path.join(workdir, f"{method}{pq_subvectors or ''}")
+    shutil.rmtree(path, ignore_errors=True)
+    start = time.perf_counter()
+    index = QuantizedIndex(path, method, pq_subvectors=pq_subvectors or Config.PQ_SUBVECTORS)
+    for i in range(0, len(data), 10000):
+        index.add([str(j) for j in range(i, min(i + 10000, len(data)))], data[i:i + 10000])
+    index.train()
+    build = time.perf_counter() - start
+    memory = index.memory_bytes()
+    name = method if method == "int8" else f"pq{pq_subvectors}"
+
+    rows = []
+    for candidates in (args.k, args.candidates):
+        latencies, found = [], []
+        for q in queries:
+            t0 = time.perf_counter()
+            ids, _ = index.search(q, args.k, candidates=candidates)[0]
+            latencies.append(time.perf_counter() - t0)
+            found.append([int(i) for i in ids])
+        rows.append({
+            "mode": name if candidates == args.k else f"{name}+rescore{candidates}",
+            "recall": round(recall(found, truth), 4),
+            "bytes_per_vector": round(memory["per_vector"], 1),
+            "resident_mb_per_1M": round(memory["per_vector"] * 1e6 / 2 ** 20, 1),
+            "query_ms_p50": round(float(np.percentile(latencies, 50)) * 1000, 2),
+            "build_s": round(build, 2),
+        })
+    index.close()
+    shutil.rmtree(path, ignore_errors=True)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", default="100k", help="stored vectors, e.g. 100k, 1M")
+    parser.add_argument("--dim", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=Config.RESCORE_CANDIDATES)
+    parser.add_argument("--clusters", type=int, default=1000)
+    parser.add_argument("--pq", default="64,128", help="comma separated PQ sub-vector counts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "eco_rag_quant"))
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+    set_log_level("WARNING")
+
+    n = parse_scale(args.n)
+    data, queries = synthetic(n, args.dim, args.queries, args.clusters, args.seed)
+    start = time.perf_counter()
+    truth = exact_top(data, queries, args.k)
+    flat_ms = (time.perf_counter() - start) / len(queries) * 1000
+
+    rows = [{"mode": "float32", "recall": 1.0, "bytes_per_vector": args.dim * 4 + 44.0,
+             "resident_mb_per_1M": round((args.dim * 4 + 44) * 1e6 / 2 ** 20, 1),
+             "query_ms_p50": round(flat_ms, 2), "build_s": 0.0}]
+    os.makedirs(args.workdir, exist_ok=True)
+    rows += run_mode("int8", data, queries, truth, args, args.workdir)
+    for m in (int(x) for x in args.pq.split(",") if x):
+        if args.dim % m == 0:
+            rows += run_mode("pq", data, queries, truth, args, args.workdir, m)
+
+    header = f"{'mode':<20} {'recall@' + str(args.k):>10} {'B/vector':>10} {'MB per 1M':>10} {'p50 ms':>8} {'build s':>8}"
+    print(f"n={n} dim={args.dim} queries={args.queries}")
+    print(header)
+    for row in rows:
+        print(f"{row['mode']:<20} {row['recall']:>10.4f} {row['bytes_per_vector']:>10.1f} "
+              f"{row['resident_mb_per_1M']:>10.1f} {row['query_ms_p50']:>8.2f} {row['build_s']:>8.2f}")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"n": n, "dim": args.dim, "k": args.k, "candidates": args.candidates, "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Row-streaming ingestion of tables and JSON records (.csv / .jsonl / .json / .xlsx loaders).
+
+A synthetic product catalog is written in every format, then for each size and format:
+    load     DataLoaderFactory.iter_load -> ChunkerFactory.iter_chunks over the whole file:
+             rows/s and the peak of Python allocations (tracemalloc), flat in the row count
+    ingest   Assembler.sync_file with the offline hash embedder into a temporary DB, in a child
+             process: rows/s and peak RSS over the process after start-up (DB, BM25 index and
+             caches included). Records are written group by group (write-through, the default for
+             these loaders); --compare also runs each file with its records held until the end,
+             as text files are
+    python benchmarks/table_ingest.py
+    python benchmarks/table_ingest.py --rows 10k,200k --formats csv,jsonl --compare --output tables.json
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import resource
+import tempfile
+import argparse
+import tracemalloc
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "src", "utils")]
+
+from config import Config                           # noqa: E402
+from metrics import set_log_level                   # noqa: E402
+import corpus                                       # noqa: E402
+
+FORMATS = ["csv", "jsonl", "json", "xlsx"]
+COLUMNS = ["sku", "name", "category", "brand", "price", "stock", "description"]
+WORDS = ["轻薄", "防水", "耐用", "便携", "智能", "静音", "节能", "高清", "无线", "快充",
+         "steel", "cotton", "wireless", "compact", "premium", "classic", "outdoor", "kids"]
+CATEGORIES = ["家电", "服装", "数码", "厨具", "户外", "图书", "玩具", "美妆"]
+
+
+def catalog(n_rows, seed=0):
+    rng = random.Random(seed)
+    for i in range(n_rows):
+        yield {
+            "sku": f"SKU{i:08d}",
+            "name": " ".join(rng.choice(WORDS) for _ in range(3)) + f" {i}",
+            "category": rng.choice(CATEGORIES),
+            "brand": f"brand{rng.randrange(500)}",
+            "price": round(rng.uniform(1, 5000), 2),
+            "stock": rng.randrange(1000),
+            "description": "，".join(rng.choice(WORDS) for _ in range(rng.randint(10, 40))),
+        }
+
+
+def write_catalog(path, fmt, n_rows, seed=0):
+    if os.path.exists(path):
+        return
+    rows = catalog(n_rows, seed)
+    if fmt == "csv":
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    elif fmt == "jsonl":
+        with open(path, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    elif fmt == "json":
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("[\n")
+            for i, row in enumerate(rows):
+                f.write((",\n" if i else "") + json.dumps(row, ensure_ascii=False, indent=2))
+            f.write("\n]\n")
+    elif fmt == "xlsx":
+        from openpyxl import Workbook
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet("catalog")
+        sheet.append(COLUMNS)
+        for row in rows:
+            sheet.append([row[c] for c in COLUMNS])
+        workbook.save(path)
+
+
+def run_load(path, ext):
+    from loader import DataLoaderFactory
+    from chunker import ChunkerFactory
+
+    def chunks():
+        return ChunkerFactory.iter_chunks(DataLoaderFactory.iter_load(path), ext)
+    start = time.perf_counter()
+    n_chunks = sum(1 for _ in chunks())
+    seconds = time.perf_counter() - start
+    tracemalloc.start()
+    for _ in chunks():
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"chunks": n_chunks, "seconds": round(seconds, 3), "peak_alloc_mb": round(peak / 2**20, 2)}
+
+
+def run_ingest(path, write_through, backend):
+    """
+    One sync_file in a fresh process, so that its peak RSS is its own
+    """
+    code = ("import sys, json, table_ingest; "
+            f"print(json.dumps(table_ingest.ingest_child({path!r}, {write_through!r}, {backend!r})))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=os.path.dirname(os.path.abspath(__file__)),
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def ingest_child(path, write_through, backend):
+    set_log_level("WARNING")
+    db_dir = tempfile.mkdtemp(prefix="tables-")
+    Config.EMBEDDING_MODEL = "hash:256"
+    Config.VECTOR_BACKEND = backend
+    # rows are only deduplicated exactly, the same for the held-per-file run
+    Config.DEDUP_MODE = "exact"
+    Config.DB_PATH = os.path.join(db_dir, "db")
+    Config.EMBED_CACHE_PATH = os.path.join(db_dir, "embeddings.sqlite3")
+    Config.MANIFEST_PATH = os.path.join(db_dir, "manifest.sqlite3")
+    Config.LEXICAL_INDEX_PATH = os.path.join(db_dir, "bm25.sqlite3")
+    Config.DEDUP_INDEX_PATH = os.path.join(db_dir, "dedup.sqlite3")
+    from loader import DataLoaderFactory
+    from assembler import Assembler
+    if not write_through:
+        DataLoaderFactory.streams = staticmethod(lambda file_path: False)
+    Assembler.db.count()
+    base_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    result = Assembler.sync_file(path)
+    seconds = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    Assembler.close()
+    return {"write_through": write_through, "embedded": result["embedded"], "seconds": round(seconds, 3),
+            "rows_per_second": round(result["embedded"] / seconds, 1),
+            "peak_rss_growth_mb": round((peak_kb - base_kb) / 1024, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="10k,50k", help="comma separated catalog sizes, e.g. 10k,1M")
+    parser.add_argument("--formats", default=",".join(FORMATS))
+    parser.add_argument("--backend", default="memmap", help="VECTOR_BACKEND of the ingest runs")
+    parser.add_argument("--compare", action="store_true", help="also ingest with the records held per file")
+    parser.add_argument("--no-ingest", action="store_true", help="loader runs only")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "eco_rag_tables"))
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+    set_log_level("WARNING")
+    os.makedirs(args.workdir, exist_ok=True)
+
+    report = []
+    for size in args.rows.split(","):
+        n_rows = corpus.parse_scale(size)
+        for fmt in args.formats.split(","):
+            path = os.path.join(args.workdir, f"catalog-{n_rows}-{args.seed}.{fmt}")
+            write_catalog(path, fmt, n_rows, args.seed)
+            row = {"rows": n_rows, "format": fmt, "file_mb": round(os.path.getsize(path) / 2**20, 1),
+                   "load": run_load(path, "." + fmt), "ingest": []}
+            if not args.no_ingest:
+                for write_through in ([True, False] if args.compare else [True]):
+                    row["ingest"].append(run_ingest(path, write_through, args.backend))
+            report.append(row)
+            load = row["load"]
+            print(f"{n_rows:>9} rows {fmt:<6} {row['file_mb']:>7.1f} MB   load {n_rows / load['seconds']:>9.0f} rows/s"
+                  f"   peak alloc {load['peak_alloc_mb']:>6.2f} MB")
+            for ingest in row["ingest"]:
+                mode = "write-through" if ingest["write_through"] else "held per file"
+                print(f"{'':>33}ingest {ingest['rows_per_second']:>8.0f} rows/s   "
+                      f"peak RSS +{ingest['peak_rss_growth_mb']:>7.1f} MB   ({mode})")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
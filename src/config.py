@@ -14,11 +14,125 @@ class Config:
     ROOT_DIR = Path(__file__).parent.parent.resolve()
     DATA_DIR = ROOT_DIR / "data"
     DB_PATH = ROOT_DIR / "db"
+    CACHE_DIR = ROOT_DIR / "cache"
     TEST_FILE_PATH = DATA_DIR / "C1" / "markdown" / "easy-rl-chapter1.md"
     
     CHUNK_SIZE = 1000
     CHUNK_OVERLAP = 200
-    EMBEDDING_MODEL = "BAAI/bge-m3"
+    CHUNK_ENGINE = "native"         # "native" (utils/textSplitter.py) or "langchain"
+    CHUNK_UNIT = "chars"            # CHUNK_SIZE in "chars", "tokens" (approximate) or "model" (embedding tokenizer)
+    # "BAAI/bge-m3" (HF Inference API), "local:BAAI/bge-m3" (in-process), "hash:256" (offline test model)
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-m3")
+    
+    # PDF loading
+    PDF_PARALLEL_MIN_PAGES = 64           # use a process pool from this many pages on
+    PDF_PAGES_PER_TASK = 16
+    PDF_WORKERS = os.cpu_count() or 2
+
+    # Tabular / JSON loading (.csv, .xlsx, .json, .jsonl: read row by row)
+    TABLE_ROWS_PER_CHUNK = 1              # rows per segment ("column: value" lines), one chunk unless it outgrows CHUNK_SIZE
+    TABLE_METADATA_COLUMNS = None         # columns copied into the chunk metadata, None = every scalar column
+    TABLE_METADATA_MAX_CHARS = 256        # longer text values are cut in the metadata (the chunk has them in full)
+
+    # Embedding requests
+    EMBED_BATCH_SIZE = 32           # max chunks per request
+    EMBED_MAX_BATCH_CHARS = 16000   # max characters per request (rough token cap)
+    EMBED_MAX_WORKERS = 4           # concurrent requests
+    EMBED_MAX_RETRIES = 3
+    EMBED_BACKOFF = 1.0             # seconds, doubled on every retry
+    EMBED_STREAM_GROUP = 128        # chunks embedded together while a file is still being chunked
+    
+    # Local embedding backend
+    LOCAL_EMBED_RUNTIME = "torch"         # "torch" or "onnx"
+    LOCAL_EMBED_QUANTIZE = False          # int8 dynamic quantization
+    LOCAL_EMBED_MAX_LENGTH = 512          # tokens per chunk
+    LOCAL_EMBED_MAX_BATCH_TOKENS = 8192   # padded tokens per forward pass
+    LOCAL_EMBED_POOLING = "cls"           # "cls" (bge) or "mean"
+    LOCAL_EMBED_THREADS = None            # None lets torch/onnxruntime decide
+    
+    # Embedding cache
+    EMBED_CACHE_ENABLED = True
+    EMBED_CACHE_PATH = CACHE_DIR / "embeddings.sqlite3"
+    EMBED_CACHE_MAX_ENTRIES = 500_000
+    
+    # Incremental ingestion
+    MANIFEST_PATH = CACHE_DIR / "manifest.sqlite3"
+    
+    # Query path
+    QUERY_EMBED_CACHE_SIZE = 10_000       # query text -> vector, in memory
+    QUERY_EMBED_CACHE_TTL = 24 * 3600     # seconds
+    QUERY_RESULT_CACHE_SIZE = 1_000       # 0 disables the result cache
+    QUERY_RESULT_CACHE_TTL = 300          # seconds, also dropped when the collection changes
+    QUERY_LATENCY_BUDGET_MS = 500         # warn when a query takes longer
+    
+    # Lexical (BM25) index for hybrid search
+    LEXICAL_INDEX_ENABLED = True
+    LEXICAL_INDEX_PATH = CACHE_DIR / "bm25.sqlite3"
+    BM25_K1 = 1.5
+    BM25_B = 0.75
+    HYBRID_RRF_K = 60                     # reciprocal rank fusion constant
+    
+    # Near-duplicate chunks at ingest (utils/dedup.py)
+    # "exact" (same normalized text), "near" (SimHash too, opt-in) or "off".
+    # a linked chunk is read as its canonical record: with "near" that is the other file's
+    # slightly different text (and vector), under this file's path, chunk index and offsets
+    DEDUP_MODE = "exact"
+    DEDUP_INDEX_PATH = CACHE_DIR / "dedup.sqlite3"
+    DEDUP_MAX_HAMMING = 3                 # simhash bits two near-duplicates may differ in (at most 3)
+    DEDUP_MIN_CHARS = 64                  # shorter chunks are only matched exactly
+    DEDUP_SHINGLE = 4                     # characters per shingle
+    
+    # Vector store backend
+    VECTOR_BACKEND = "chroma"             # "chroma" or "memmap" (utils/memmapDatabase.py, exact search without chroma)
+    
+    # Compact vector storage (utils/quantization.py, utils/quantizedDatabase.py)
+    VECTOR_STORAGE = "float32"            # "float32" (full vectors), "int8" or "pq" (quantized index)
+    RESCORE_CANDIDATES = 100              # quantized hits re-scored with the exact float vectors
+    PQ_SUBVECTORS = 64                    # pq: bytes per vector, must divide the embedding dimension
+    PQ_TRAIN_SIZE = 20_000                # pq: vectors stored before the codebooks are trained
+    QUANTIZED_SEARCH_BLOCK = 16_384       # rows scored per NumPy block
+    QUANTIZED_COMPACT_RATIO = 0.3         # rewrite the files when this share of rows is deleted
+    QUANTIZED_FILTER_MASKS = 16           # row masks of recent `where` filters kept until rows change
+    
+    # Sharded collections (utils/shardedDatabase.py)
+    # the layout is recorded next to the DB on first use, changing it needs an export + import
+    SHARD_BY = None                       # None (one collection), "hash" (of the record id) or "subdir" (C1, C2, ...)
+    SHARD_COUNT = 4                       # "hash": number of shards
+    SHARD_PATHS = False                   # True: every shard in its own directory (own chromadb client)
+    SHARD_WORKERS = 8                     # threads fanning a query / write out to the shards
+    
+    # Reranking (utils/reranker.py, Assembler.query_reranked)
+    RERANK_METHOD = "mmr"                 # "mmr", "cross" (cross-encoder), "cross+mmr" or "none"
+    RERANK_CANDIDATES = 40                # over-fetched from the vector search before reranking
+    RERANK_BUDGET_MS = 300                # cross-encoder time budget per query, None for no limit
+    RERANK_MODEL = "BAAI/bge-reranker-base"
+    RERANK_BATCH_SIZE = 16                # (query, chunk) pairs per cross-encoder forward pass
+    RERANK_MAX_LENGTH = 512
+    MMR_LAMBDA = 0.7                      # 1 = relevance only, 0 = diversity only
+    
+    # Answer generation (utils/answer.py, chat model through utils/api.py)
+    LLM_TIMEOUT = 60                      # seconds per request
+    LLM_MAX_RETRIES = 2                   # connection errors / 429 / 5xx before the first token
+    LLM_TEMPERATURE = 0.3
+    LLM_MAX_TOKENS = 1024
+    LLM_STREAM_USAGE = True               # ask for token usage (incl. cached prompt tokens) at the end of a stream
+    ANSWER_N_RESULTS = 8                  # chunks retrieved per question
+    ANSWER_CONTEXT_TOKENS = 3000          # context budget in approximate tokens (textSplitter.approx_token_starts)
+    ANSWER_RERANK = True                  # retrieve with query_reranked (MMR) instead of query_text
+    
+    # Directory ingestion pipeline
+    INGEST_LOAD_WORKERS = os.cpu_count() or 2   # processes for load + chunk
+    INGEST_EMBED_WORKERS = 2                    # files embedded at the same time
+    INGEST_QUEUE_SIZE = 8                       # files buffered between stages
+    INGEST_WRITE_BATCH = 1000                   # records per DB upsert
+    
+    # Async serving (utils/asyncAssembler.py)
+    ASYNC_DB_WORKERS = 16                 # threads running blocking chroma / sqlite / file calls
+    
+    # Logging / metrics (utils/metrics.py)
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")  # DEBUG shows per-file / per-batch messages and spans
+    METRICS_SPAN_HISTORY = 1000                 # recent spans kept for the JSON export
+    METRICS_LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
     
     @staticmethod
     def get_relative_path(file_path, data_dir=DATA_DIR):
@@ -0,0 +1,267 @@
+import os
+import uuid
+import numpy as np
+from typing import Dict, Optional, Any
+
+# === Columnar records ===
+# Parallel arrays over a chromadb result (or a batch of new chunks), no pydantic
+# validation on the hot path. Rows are cheap views, RAGRecord only when asked.
+
+
+def make_record_id(source_name, source_type, file_path, chunk_index) -> str:
+    """
+    Deterministic record id, same scheme as RAGRecord's validator
+    """
+    unique_id_str = f"{source_name}_{source_type}_{file_path}_{chunk_index}"
+    return str(uuid.uuid5(uuid.NAMESPACE_DNS, unique_id_str))
+
+
+class RecordBatch:
+    __slots__ = ("ids", "documents", "metadatas", "distances", "embeddings", "scores")
+
+    def __init__(self, ids, documents=None, metadatas=None, distances=None, embeddings=None, scores=None):
+        """
+        ids / documents / metadatas / distances / scores: lists of the same length (or None)
+        embeddings: float32 array of shape (n, dim) or None
+        """
+        self.ids = list(ids)
+        self.documents = documents
+        self.metadatas = metadatas
+        self.distances = distances
+        self.embeddings = embeddings
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            def cut(column):
+                return None if column is None else column[i]
+            return RecordBatch(self.ids[i], cut(self.documents), cut(self.metadatas), cut(self.distances),
+                               cut(self.embeddings), cut(self.scores))
+        if i < 0:
+            i += len(self.ids)
+        if not 0 <= i < len(self.ids):
+            raise IndexError(i)
+        return RecordView(self, i)
+
+    def __iter__(self):
+        return (RecordView(self, i) for i in range(len(self.ids)))
+
+    def __repr__(self):
+        return f"RecordBatch({len(self.ids)} records)"
+
+    # --- building ---
+
+    @staticmethod
+    def empty():
+        return RecordBatch([], [], [], [], None)
+
+    @staticmethod
+    def from_results(results: Dict[str, Any], query_index: int = 0) -> 'RecordBatch':
+        """
+        Wrap a chromadb get()/query() result without copying the rows.
+        For query() results (lists of lists) query_index picks the query.
+        """
+        ids = results.get('ids') or []
+        nested = bool(ids) and isinstance(ids[0], list)
+
+        def column(key):
+            value = results.get(key)
+            if value is None:
+                return None
+            if nested:
+                return value[query_index] if query_index < len(value) else None
+            return value
+
+        ids = column('ids') or []
+        embeddings = column('embeddings')
+        if embeddings is not None and len(embeddings):
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+        else:
+            embeddings = None
+        return RecordBatch(ids, column('documents'), column('metadatas'), column('distances'), embeddings)
+
+    @staticmethod
+    def per_query(results: Dict[str, Any]) -> list['RecordBatch']:
+        """
+        One RecordBatch per query of a multi-vector query() result
+        """
+        ids = results.get('ids') or []
+        return [RecordBatch.from_results(results, q) for q in range(len(ids))]
+
+    @staticmethod
+    def from_chunks(file_path, rel_path, items) -> 'RecordBatch':
+        """
+        Build new records for ingestion.
+        items: iterable of (chunk_index, chunk, embedding, attributes)
+        chunks whose embedding failed (None) are skipped
+        """
+        source_name = os.path.basename(file_path)
+        source_type = os.path.splitext(file_path)[1].lstrip('.')
+        ids, documents, metadatas, vectors = [], [], [], []
+        for idx, chunk, embedding, attrs in items:
+            if embedding is None:
+                continue
+            metadata = {"source_name": source_name, "source_type": source_type,
+                        "file_path": rel_path, "chunk_index": idx}
+            metadata.update((k, v) for k, v in attrs.items() if v is not None)
+            ids.append(make_record_id(source_name, source_type, rel_path, idx))
+            documents.append(chunk)
+            metadatas.append(metadata)
+            vectors.append(embedding)
+        embeddings = np.asarray(vectors, dtype=np.float32) if vectors else None
+        return RecordBatch(ids, documents, metadatas, None, embeddings)
+
+    @staticmethod
+    def from_rag_records(records) -> 'RecordBatch':
+        formatted = [r.to_db_format() for r in records]
+        vectors = [r["vector"] for r in formatted]
+        embeddings = np.asarray(vectors, dtype=np.float32) if vectors and vectors[0] is not None else None
+        return RecordBatch(
+            [r["id"] for r in formatted], [r["document"] for r in formatted],
+            [r["metadata"] for r in formatted],
+            [r.distance for r in records], embeddings, [r.score for r in records]
+        )
+
+    @staticmethod
+    def concat(batches) -> 'RecordBatch':
+        batches = [b for b in batches if len(b)]
+        if not batches:
+            return RecordBatch.empty()
+        if len(batches) == 1:
+            return batches[0]
+
+        def join(key):
+            columns = [getattr(b, key) for b in batches]
+            if any(c is None for c in columns):
+                return None
+            return [x for c in columns for x in c]
+
+        embeddings = None
+        if all(b.embeddings is not None for b in batches):
+            embeddings = np.concatenate([b.embeddings for b in batches])
+        return RecordBatch(join("ids"), join("documents"), join("metadatas"),
+                           join("distances"), embeddings, join("scores"))
+
+    def copy(self) -> 'RecordBatch':
+        """
+        Batch with its own columns and metadata dicts, e.g. to hand out a cached batch
+        """
+        return RecordBatch(
+            self.ids, None if self.documents is None else list(self.documents),
+            None if self.metadatas is None else [dict(m) if m else m for m in self.metadatas],
+            None if self.distances is None else list(self.distances),
+            None if self.embeddings is None else self.embeddings.copy(),
+            None if self.scores is None else list(self.scores)
+        )
+
+    def take(self, indices) -> 'RecordBatch':
+        """
+        New batch with the rows at indices, in that order
+        """
+        def pick(column):
+            return None if column is None else [column[i] for i in indices]
+        embeddings = None if self.embeddings is None else self.embeddings[list(indices)]
+        return RecordBatch(pick(self.ids), pick(self.documents), pick(self.metadatas),
+                           pick(self.distances), embeddings, pick(self.scores))
+
+    # --- converting ---
+
+    def to_records(self) -> list:
+        """
+        Full RAGRecord objects (pydantic), for callers that want them
+        """
+        from shcema import RAGRecord, RAGMetadata, ExtraAttributes
+        records = []
+        for i, record_id in enumerate(self.ids):
+            metadata_dict = dict(self.metadatas[i] or {}) if self.metadatas else {}
+            attributes = ExtraAttributes(**{
+                key: metadata_dict.pop(key) for key in ExtraAttributes.model_fields if key in metadata_dict
+            })
+            metadata = RAGMetadata(
+                source_name=metadata_dict.get('source_name', 'unknown'),
+                source_type=metadata_dict.get('source_type', 'unknown'),
+                attributes=attributes
+            )
+            records.append(RAGRecord(
+                id=record_id,
+                document=self.documents[i] if self.documents else "",
+                vector=self.embeddings[i].tolist() if self.embeddings is not None else None,
+                distance=self.distances[i] if self.distances else None,
+                score=self.scores[i] if self.scores else None,
+                metadata=metadata
+            ))
+        return records
+
+    def to_db_format(self) -> Dict[str, Any]:
+        """
+        Columns as VectorDatabase.add_documents takes them
+        """
+        return {
+            "ids": self.ids,
+            "texts": self.documents,
+            "embeddings": self.embeddings,
+            "metadatas": self.metadatas,
+        }
+
+
+class RecordView:
+    """
+    One row of a RecordBatch, attribute access like RAGRecord without building it
+    """
+    __slots__ = ("_batch", "_i")
+
+    def __init__(self, batch: RecordBatch, i: int):
+        self._batch = batch
+        self._i = i
+
+    @property
+    def id(self) -> str:
+        return self._batch.ids[self._i]
+
+    @property
+    def document(self) -> Optional[str]:
+        return self._batch.documents[self._i] if self._batch.documents else None
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        return (self._batch.metadatas[self._i] or {}) if self._batch.metadatas else {}
+
+    @property
+    def distance(self) -> Optional[float]:
+        return self._batch.distances[self._i] if self._batch.distances else None
+
+    @property
+    def score(self) -> Optional[float]:
+        return self._batch.scores[self._i] if self._batch.scores else None
+
+    @property
+    def vector(self) -> Optional[np.ndarray]:
+        return self._batch.embeddings[self._i] if self._batch.embeddings is not None else None
+
+    @property
+    def file_path(self) -> Optional[str]:
+        return self.metadata.get("file_path")
+
+    @property
+    def chunk_index(self) -> int:
+        return self.metadata.get("chunk_index", 0)
+
+    def to_record(self):
+        return self._batch.take([self._i]).to_records()[0]
+
+    def print(self):
+        print(f"{'-'*20} RAG Record {'-'*20}")
+        print(f"ID: {self.id}")
+        print(f"Document:\n {(self.document or '')[:50]}...")
+        if self.distance is not None:
+            print(f"Distance: {self.distance}")
+        if self.score is not None:
+            print(f"Score: {self.score}")
+        print(f"Metadata: {self.metadata}")
+        print(f"{'-'*52}")
+
+    def __repr__(self):
+        return f"RecordView(id={self.id!r}, distance={self.distance})"
@@ -1,14 +1,21 @@
 import json
-import uuid
 import time
 from typing import Dict, Optional, Any
 from pydantic import BaseModel, Field, model_validator
+from recordBatch import RecordBatch, make_record_id
 
 # === ExtraAttributes ===
 class ExtraAttributes(BaseModel):
     file_path: Optional[str] = None
     url: Optional[str] = None
     chunk_index: int = 0
+    page_number: Optional[int] = None   # 1-based, for paged sources like pdf
+    start_offset: Optional[int] = None  # chunk = segment_text[start_offset:end_offset]
+    end_offset: Optional[int] = None    # (segment = the page for pdf, the whole file otherwise)
+    heading_path: Optional[str] = None  # markdown sections, e.g. "第1章 强化学习基础 > 1.1 强化学习概述"
+    row_number: Optional[int] = None    # tables / json records: 1-based row (first of the group), segment = the rows
+    rows: Optional[int] = None          # rows in the chunk when TABLE_ROWS_PER_CHUNK > 1
+    sheet_name: Optional[str] = None    # xlsx
 
 # === Metadata ===
 class RAGMetadata(BaseModel):
@@ -27,6 +34,7 @@ class RAGRecord(BaseModel):
     document: str
     vector: Optional[list[float]] = None
     distance: Optional[float] = None
+    score: Optional[float] = None   # fused score of hybrid search
     metadata: RAGMetadata
     
     @model_validator(mode='after')
@@ -35,16 +43,24 @@ class RAGRecord(BaseModel):
         Automatically generate a deterministic ID based on metadata if ID is missing.
         """
         if self.id is None:
-            unique_id_str = f"{self.metadata.source_name}_{self.metadata.source_type}_{self.metadata.attributes.file_path}_{self.metadata.attributes.chunk_index}"
-            self.id = str(uuid.uuid5(uuid.NAMESPACE_DNS, unique_id_str))
+            self.id = make_record_id(
+                self.metadata.source_name,
+                self.metadata.source_type,
+                self.metadata.attributes.file_path,
+                self.metadata.attributes.chunk_index
+            )
         return self
 
     def to_db_format(self) -> Dict[str, Any]:
-        # put themt to json
-        meta_dict = self.metadata.model_dump(exclude={"attributes"})
-        attr_dict = self.metadata.attributes.model_dump(exclude_none=True)
         # Flatten attributes into metadata for easier querying
-        meta_dict.update(attr_dict)
+        # (built by hand, model_dump twice per record is slow on big ingests)
+        meta_dict = {
+            "source_name": self.metadata.source_name,
+            "source_type": self.metadata.source_type,
+        }
+        for key, value in self.metadata.attributes.__dict__.items():
+            if value is not None:
+                meta_dict[key] = value
         
         return {
             "id": self.id,
@@ -64,6 +80,8 @@ class RAGRecord(BaseModel):
             print(f"Vector (first 5 dims): {self.vector[:5]}...")
         if self.distance is not None:
             print(f"Distance: {self.distance}")
+        if self.score is not None:
+            print(f"Score: {self.score}")
         print("Metadata:")
         self.metadata.print_metadata()
         print(f"{'-'*52}")
@@ -73,44 +91,18 @@ class RAGRecord(BaseModel):
         """
         Transform query results from vector DB back to RAGRecord objects
         *note: vector is not included in results, we use distance instead*
+        for results of several query vectors only the first query is used,
+        see get_records_per_query
+        prefer RecordBatch.from_results on hot paths, it skips pydantic
         """
-        records = []
-        documents = results.get('documents', [])
-        metadatas = results.get('metadatas', [])
-        distances = results.get('distances', [])
-        ids = results.get('ids', [])
-
-        # Handle ChromaDB's list of lists format (if query returns multiple results lists)
-        if documents and isinstance(documents[0], list):
-            documents = documents[0]
-            metadatas = metadatas[0] if metadatas else []
-            distances = distances[0] if distances else []
-            ids = ids[0] if ids else []
+        return RecordBatch.from_results(results).to_records()
 
-        for idx, doc in enumerate(documents):
-            metadata_dict = metadatas[idx] if idx < len(metadatas) else {}
-            record_id = ids[idx] if idx < len(ids) else None
-            record_distance = distances[idx] if idx < len(distances) else None
-
-            # Reconstruct ExtraAttributes
-            attributes = ExtraAttributes(
-                file_path=metadata_dict.pop('file_path', None),
-                url=metadata_dict.pop('url', None),
-                chunk_index=metadata_dict.pop('chunk_index', 0)
-            )
-            metadata = RAGMetadata(
-                source_name=metadata_dict.get('source_name', 'unknown'),
-                source_type=metadata_dict.get('source_type', 'unknown'),
-                attributes=attributes
-            )
-            record = RAGRecord(
-                id=record_id, # Use the ID from DB
-                document=doc,
-                distance=record_distance,
-                metadata=metadata
-            )
-            records.append(record)
-        return records
+    @staticmethod
+    def get_records_per_query(results: Dict[str, Any]) -> list[list['RAGRecord']]:
+        """
+        Transform results of a multi-vector query into one list of RAGRecords per query
+        """
+        return [batch.to_records() for batch in RecordBatch.per_query(results)]
 
     @staticmethod
     def sort_by_distance(records: list['RAGRecord']) -> list['RAGRecord']:
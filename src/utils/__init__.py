@@ -1,6 +1,16 @@
-from .assembler import Assembler
-
-
+# Assembler / AsyncAssembler are imported on first access, `import utils` alone stays cheap
+# (python -X importtime, see benchmarks/import_time.py)
 __all__ = [
     "Assembler",
-]
\ No newline at end of file
+    "AsyncAssembler",
+]
+
+
+def __getattr__(name):
+    if name == "Assembler":
+        from .assembler import Assembler
+        return Assembler
+    if name == "AsyncAssembler":
+        from .asyncAssembler import AsyncAssembler
+        return AsyncAssembler
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
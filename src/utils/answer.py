@@ -0,0 +1,169 @@
+import time
+from config import Config
+from textSplitter import approx_token_starts
+from metrics import Metrics, get_logger
+
+###########################################
+# Retrieval-augmented answers, streamed (Assembler.answer / AsyncAssembler.answer)
+#   retrieve  Assembler.query_reranked (or query_text), ANSWER_N_RESULTS chunks
+#   pack      best chunks first into ANSWER_CONTEXT_TOKENS approximate tokens;
+#             text a chunk shares with an already packed neighbour (CHUNK_OVERLAP) is cut,
+#             repeated text dropped, touching pieces of one file joined
+#   prompt    fixed system prompt, then the packed blocks in (file, position) order, question last:
+#             the same sources always give the same prompt bytes, so the provider's
+#             prefix cache (DeepSeek / OpenAI prompt caching) hits across questions
+#   stream    text deltas from api.ChatClient; time to first token (retrieval included)
+#             in answer_ttft_seconds, the model's own in llm_ttft_seconds
+N_RESULTS = Config.ANSWER_N_RESULTS
+CONTEXT_TOKENS = Config.ANSWER_CONTEXT_TOKENS
+###########################################
+
+logger = get_logger("answer")
+
+SYSTEM_PROMPT = (
+    "You answer questions about a document collection. Use only the numbered context passages "
+    "in the user message and cite them like [1]. If they do not contain the answer, say so. "
+    "Answer in the language of the question."
+)
+
+
+def count_tokens(text):
+    return len(approx_token_starts(text))
+
+
+def pack_context(records, budget=CONTEXT_TOKENS, order="source"):
+    """
+    Fit retrieved records (best first) into a token budget
+    order: "source" (file, position: stable prompt prefix) or "relevance" (retrieval order)
+    Returns:
+        {'context': text, 'sources': [{'n', 'file_path', 'page_number', 'row_number', 'ids'}], 'tokens': n,
+         'chunks': packed records, 'dropped': records left out}
+    """
+    pieces, covered, seen = [], {}, set()
+    used = dropped = 0
+    for rank, record in enumerate(records):
+        meta = record.metadata
+        text, start = record.document or "", meta.get("start_offset")
+        # offsets count from the start of the segment: the page, the row (tables) or the file
+        key = (record.file_path, _segment(meta))
+        if start is not None and meta.get("end_offset") == start + len(text):
+            text, start = _cut_overlap(text, start, covered.get(key, []))
+        tokens = count_tokens(text)
+        if not text.strip() or text.strip() in seen or used + tokens > budget:
+            # a smaller chunk further down may still fit
+            dropped += 1
+            continue
+        seen.add(text.strip())
+        used += tokens
+        if start is not None:
+            covered.setdefault(key, []).append((start, start + len(text)))
+        pieces.append({"rank": rank, "id": record.id, "file_path": record.file_path or "",
+                       "page_number": meta.get("page_number"), "row_number": meta.get("row_number"),
+                       "segment": _segment(meta), "start": start,
+                       "chunk_index": record.chunk_index, "text": text})
+
+    if order == "source":
+        pieces.sort(key=lambda p: (p["file_path"], p["segment"],
+                                   p["start"] if p["start"] is not None else p["chunk_index"]))
+    blocks = _join_touching(pieces) if order == "source" else [dict(p, ids=[p["id"]]) for p in pieces]
+
+    sources, parts = [], []
+    for n, block in enumerate(blocks, start=1):
+        where = (block["file_path"] + (f" p.{block['page_number']}" if block["page_number"] else "")
+                 + (f" row {block['row_number']}" if block["row_number"] else ""))
+        parts.append(f"[{n}] {where}\n{block['text']}")
+        sources.append({"n": n, "file_path": block["file_path"], "page_number": block["page_number"],
+                        "row_number": block["row_number"], "ids": block["ids"]})
+    return {"context": "\n\n".join(parts), "sources": sources, "tokens": used,
+            "chunks": len(pieces), "dropped": dropped}
+
+
+def build_messages(question, packed):
+    """
+    Chat messages: the stable part first, the question last
+    """
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": f"Context:\n\n{packed['context']}\n\nQuestion: {question}"},
+    ]
+
+
+def _segment(meta):
+    return (meta.get("sheet_name") or "", meta.get("page_number") or 0, meta.get("row_number") or 0)
+
+
+def _cut_overlap(text, start, spans):
+    """
+    Drop the part of a chunk ([start, start + len(text)) of its segment) that packed chunks cover
+    """
+    end = start + len(text)
+    for s, e in sorted(spans):
+        if s <= start and e >= end:
+            return "", start
+        if s <= start < e:
+            text, start = text[e - start:], e
+        elif start < s < end <= e:
+            text, end = text[:s - start], s
+    return text, start
+
+
+def _join_touching(pieces):
+    # neighbouring chunks of one file read as one passage once their overlap is cut
+    blocks = []
+    for piece in pieces:
+        last = blocks[-1] if blocks else None
+        if (last is not None and piece["start"] is not None and last["end"] == piece["start"]
+                and (last["file_path"], last["segment"]) == (piece["file_path"], piece["segment"])):
+            last["text"] += piece["text"]
+            last["end"] += len(piece["text"])
+            last["ids"].append(piece["id"])
+        else:
+            end = piece["start"] + len(piece["text"]) if piece["start"] is not None else None
+            blocks.append(dict(piece, end=end, ids=[piece["id"]]))
+    return blocks
+
+
+class AnswerStream:
+    """
+    The answer as it is generated: iterate (sync) or async iterate over the text deltas.
+    .sources / .records are known before the first token, .text and .stats are complete at the end:
+        stream = Assembler.answer("什么是强化学习？")
+        for text in stream:
+            print(text, end="")
+        print(stream.sources, stream.stats["ttft_ms"])
+    """
+    def __init__(self, deltas, records, packed, stats, start):
+        self.records = records
+        self.packed = packed
+        self.sources = packed["sources"]
+        self.stats = stats
+        self.text = ""
+        self._deltas = deltas
+        self._start = start
+        stats.update(context_tokens=packed["tokens"], chunks=packed["chunks"], dropped=packed["dropped"])
+
+    def __iter__(self):
+        for delta in self._deltas:
+            self._received(delta)
+            yield delta
+        self._done()
+
+    async def __aiter__(self):
+        async for delta in self._deltas:
+            self._received(delta)
+            yield delta
+        self._done()
+
+    def _received(self, delta):
+        if not self.text:
+            ttft = time.perf_counter() - self._start
+            self.stats["ttft_ms"] = ttft * 1000
+            Metrics.observe("answer_ttft_seconds", ttft)
+        self.text += delta
+
+    def _done(self):
+        total = time.perf_counter() - self._start
+        self.stats["total_ms"] = total * 1000
+        Metrics.observe("answer_seconds", total)
+        Metrics.inc("answers_total")
+        logger.debug("Answer: %s", self.stats)
@@ -1,10 +1,132 @@
-from openai import OpenAI
+import json
+import time
 from config import Config
+from registry import get_llm_client, get_async_llm_client
+from metrics import Metrics, get_logger
 
 ###########################################
 # We use deepseek API for main LLM services
+# (any OpenAI-compatible endpoint works: BASE_URL / API_KEY / MODEL)
+# one pooled client per endpoint (registry), answers are streamed as text deltas;
+# time to first token goes to llm_ttft_seconds, cached prompt tokens to
+# llm_prompt_cached_tokens_total (DeepSeek / OpenAI prompt caching)
 API_KEY = Config.API_KEY
 BASE_URL = Config.BASE_URL
 MODEL = Config.MODEL
+TEMPERATURE = Config.LLM_TEMPERATURE
+MAX_TOKENS = Config.LLM_MAX_TOKENS
+STREAM_USAGE = Config.LLM_STREAM_USAGE
 ############################################
 
+logger = get_logger("api")
+
+
+class ChatClient:
+    @staticmethod
+    def stream(messages, model=None, stats=None, **params):
+        """
+        Stream a chat completion
+        stats: optional dict, filled with llm_ttft_ms, llm_total_ms and the token usage
+        params: extra completion parameters (temperature, max_tokens, ...)
+        Yields:
+            text deltas as they arrive
+        """
+        model = model or MODEL
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        try:
+            # raw server-sent events, read to the end of the body: the client's own Stream stops at
+            # [DONE] and closes the response unfinished, which costs the pooled connection
+            with get_llm_client(BASE_URL, API_KEY).chat.completions.with_streaming_response.create(
+                **ChatClient._request(messages, model, params)
+            ) as response:
+                for line in response.iter_lines():
+                    delta = ChatClient._read_line(line, stats, start, model)
+                    if delta:
+                        yield delta
+        except Exception:
+            Metrics.inc("llm_errors_total", model=model)
+            raise
+        ChatClient._finish(stats, start, model)
+
+    @staticmethod
+    async def astream(messages, model=None, stats=None, **params):
+        """
+        ChatClient.stream for the event loop (AsyncOpenAI client of the running loop)
+        """
+        model = model or MODEL
+        stats = {} if stats is None else stats
+        start = time.perf_counter()
+        try:
+            async with get_async_llm_client(BASE_URL, API_KEY).chat.completions.with_streaming_response.create(
+                **ChatClient._request(messages, model, params)
+            ) as response:
+                async for line in response.iter_lines():
+                    delta = ChatClient._read_line(line, stats, start, model)
+                    if delta:
+                        yield delta
+        except Exception:
+            Metrics.inc("llm_errors_total", model=model)
+            raise
+        ChatClient._finish(stats, start, model)
+
+    @staticmethod
+    def complete(messages, model=None, stats=None, **params):
+        """
+        The whole answer as one string (streamed underneath, so stats has the TTFT too)
+        """
+        return "".join(ChatClient.stream(messages, model, stats, **params))
+
+    # --- internals ---
+
+    @staticmethod
+    def _request(messages, model, params):
+        request = {"model": model, "messages": messages, "stream": True,
+                   "temperature": TEMPERATURE, "max_tokens": MAX_TOKENS}
+        if STREAM_USAGE:
+            request["stream_options"] = {"include_usage": True}
+        request.update(params)
+        return request
+
+    @staticmethod
+    def _read_line(line, stats, start, model):
+        if not line.startswith("data:"):
+            return None
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return None
+        chunk = json.loads(data)
+        if chunk.get("error"):
+            raise RuntimeError(f"LLM stream error: {chunk['error']}")
+        usage = chunk.get("usage")
+        if usage:
+            cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+            if cached is None:
+                cached = usage.get("prompt_cache_hit_tokens")      # DeepSeek
+            stats.update(prompt_tokens=usage.get("prompt_tokens", 0),
+                         completion_tokens=usage.get("completion_tokens", 0), cached_tokens=cached or 0)
+        if not chunk.get("choices"):
+            return None
+        delta = (chunk["choices"][0].get("delta") or {}).get("content")
+        if delta and "llm_ttft_ms" not in stats:
+            ttft = time.perf_counter() - start
+            stats["llm_ttft_ms"] = ttft * 1000
+            Metrics.observe("llm_ttft_seconds", ttft, model=model)
+        return delta
+
+    @staticmethod
+    def _finish(stats, start, model):
+        seconds = time.perf_counter() - start
+        stats["llm_total_ms"] = seconds * 1000
+        Metrics.observe("llm_stream_seconds", seconds, model=model)
+        if "completion_tokens" in stats:
+            Metrics.inc("llm_prompt_tokens_total", stats["prompt_tokens"], model=model)
+            Metrics.inc("llm_prompt_cached_tokens_total", stats["cached_tokens"], model=model)
+            Metrics.inc("llm_completion_tokens_total", stats["completion_tokens"], model=model)
+        logger.debug("LLM stream %s: %s", model, stats)
+
+
+if __name__ == "__main__":
+    for text in ChatClient.stream([{"role": "user", "content": "用一句话介绍强化学习"}]):
+        print(text, end="", flush=True)
+    print()
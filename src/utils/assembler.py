@@ -1,118 +1,1027 @@
 import os
-import uuid
+import json
+import time
+import threading
+import numpy as np
+from contextvars import ContextVar
 from config import Config
-from shcema import RAGRecord, RAGMetadata, ExtraAttributes
+from recordBatch import RecordBatch, make_record_id
 from loader import DataLoaderFactory
 from chunker import ChunkerFactory
-from embedder import HuggingFaceEmbedder            
-from vectorDatabase import VectorDatabase
+from embedder import EmbedderFactory, MODEL_SPEC
+from manifest import IngestManifest
+from syncJob import SyncJob
+from embeddingCache import EmbeddingCache
+from dedup import DedupIndex, signature
+from lexicalIndex import match_where
+from registry import (ClientRegistry, shared, get_vector_db, get_manifest, get_lexical_index,
+                      get_dedup_index, get_query_cache)
+from export import export_collection, import_collection
+from metrics import Metrics, get_logger
 
 
 
 # This is the interface for outer files
 # provide APIs to finish one whole process like:
 # v  1.store_file:     filepath -> load -> chunk -> embed -> assemble records -> DB
-# x  2.query_file:     filepath -> query file in DB -> return results
-# x  3.delete_file:    filepath -> find records in DB -> delete records
+# v  2.sync_file:      filepath -> compare with manifest -> embed changed chunks -> DB
+#                       (duplicates of stored chunks are linked to them, not stored again)
+# v  3.store_directory: dirpath -> pipeline of store_file over every file
+# x  4.query_file:     filepath -> query file in DB -> return results
+# x  5.delete_file:    filepath -> find records in DB -> delete records
+#                       (delete_files / delete_directory for many files in one batch)
+# v  6.query_text:     text -> (cached) embed -> ANN search -> records
+# v  7.query_texts:    texts -> batched embed -> one multi-vector search -> records per text
+# v  8.query_hybrid:   text -> vector search + BM25 search -> reciprocal rank fusion -> records
+# v  9.export_collection: DB -> paged reads -> jsonl + npy (import_collection for the way back)
+# v 10.query_reranked: text -> over-fetched vector search -> MMR / cross-encoder rerank -> records
+# v 11.metrics:        counters / latency histograms / recent spans of every stage -> JSON or Prometheus
+# v 12.answer:         question -> query_reranked -> token-budgeted context -> streamed LLM answer
 ##############################################
 
+logger = get_logger("assembler")
+
+# chunk attributes that only say where the chunk sits in its file
+POSITION_KEYS = ("start_offset", "end_offset")
+
+# per-stage timings (ms) of the last query, one value per thread / asyncio task
+query_timings = ContextVar("query_timings", default={})
+
+
+class per_context:
+    """
+    Class attribute read from a ContextVar: concurrent threads / asyncio tasks each see their own value
+    """
+    def __init__(self, var):
+        self.var = var
+    
+    def __get__(self, obj, owner):
+        return self.var.get()
+
+
 class Assembler:
-    db = VectorDatabase()
+    # opened on first use and shared process-wide, Assembler.close() releases them
+    db = shared(get_vector_db)
+    manifest = shared(get_manifest)
+    lexical = shared(get_lexical_index)
+    dedup = shared(get_dedup_index)
+    query_embeddings = shared(lambda: get_query_cache("embeddings"))
+    query_results = shared(lambda: get_query_cache("results"))
+    # every change of the DB, manifest, dedup and BM25 indexes that spans them (write, commit,
+    # promote, delete) holds it: syncs embed concurrently but change the stores one at a time
+    write_lock = threading.RLock()
+    # per-stage timings (ms) of the last query of the calling thread / task (query_timings)
+    last_timings = per_context(query_timings)
     
     @staticmethod
-    def store_file(filepath):
+    def close():
+        """
+        Save and close every shared client (DB, manifest, caches, models),
+        the next call opens them again
+        """
+        ClientRegistry.close()
+    
+    @staticmethod
+    def store_file(filepath, incremental=False):
         """
         Store file to vdb.
         filepath: should be absolute path.
+        incremental: only re-embed and upsert chunks that changed since the last store
         """
-        records = Assembler._get_records(filepath)
-        Assembler._records_to_db(records, Assembler.db)
+        return Assembler.sync_file(filepath, force=not incremental)
+    
+    @staticmethod
+    def sync_file(filepath, force=False):
+        """
+        Bring the records of one file in line with its current content.
+            - unchanged file (same mtime/size or same content hash) -> skipped
+            - otherwise only chunks whose text changed are embedded and upserted
+            - records past the new last chunk are deleted in one batch
+        force: treat every chunk as changed (a full store)
+        Returns:
+            a dict like {'status': 'updated', 'embedded': 3, 'unchanged': 40, 'deleted': 2}
+        """
+        with Metrics.span("sync_file", attrs={"file": Config.get_relative_path(filepath)}) as span:
+            job = Assembler._check_file(filepath, force)
+            if job is None:
+                result = {"status": "skipped", "embedded": 0, "unchanged": 0, "deleted": 0}
+            else:
+                job.chunks = Assembler._iter_chunks(filepath)
+                Assembler._prepare_records(job)
+                result = Assembler._store_file(job)
+                if result is None:
+                    result = {"status": "failed", "embedded": 0, "unchanged": 0, "deleted": 0}
+                else:
+                    Assembler.lexical.save()
+            span.update(result)
+        Metrics.inc("files_synced_total", status=result["status"])
+        return result
+    
+    @staticmethod
+    def store_directory(dirpath=Config.DATA_DIR, incremental=True, **kwargs):
+        """
+        Store every supported file under dirpath through the streaming pipeline
+        (process pool loading -> concurrent embedding -> batched upserts).
+        incremental: skip files already stored and unchanged, so an interrupted
+                     run picks up where it stopped
+        kwargs: passed to IngestPipeline (load_workers, embed_workers, queue_size, write_batch)
+        Returns:
+            per-stage throughput stats
+        """
+        from pipeline import IngestPipeline
+        return IngestPipeline(dirpath, incremental=incremental, **kwargs).run()
     
     @staticmethod
     def delete_file(filepath):
         """
         Delete file from vdb.
         filepath: should be absolute path.
+        Returns:
+            number of deleted records
         """
-        rel_path = Config.get_relative_path(filepath)
-        where = {"file_path": rel_path}
-        Assembler.db.delete_documents(where)
+        return Assembler.delete_files([filepath])["deleted"]
+    
+    @staticmethod
+    def delete_files(filepaths):
+        """
+        Delete many files in one go: the record ids the manifest lists for them,
+        plus an ids-only file_path scan for records it does not list
+        (files stored before the manifest existed, chunks left by an earlier failure).
+        Returns:
+            {'files': number of files, 'deleted': number of records}
+        """
+        with Assembler.write_lock:
+            rel_paths = list(dict.fromkeys(Config.get_relative_path(fp) for fp in filepaths))
+            known = Assembler.manifest.get_record_ids(rel_paths)
+            ids = [record_id for record_ids in known.values() for record_id in record_ids]
+            for start in range(0, len(rel_paths), 500):
+                ids.extend(Assembler.db.get_ids({"file_path": {"$in": rel_paths[start:start + 500]}}))
+            ids = list(dict.fromkeys(ids))
+            # records that chunks of other files link to (dedup) move to one of those files,
+            # links of these files into other files' records are not theirs to delete
+            Assembler._promote_shared(ids, set(rel_paths))
+            shared_ids = Assembler.manifest.get_referrers(ids, exclude_files=rel_paths)
+            ids = [record_id for record_id in ids if record_id not in shared_ids]
+            deleted = Assembler.db.delete_by_ids(ids)
         
+            Assembler.manifest.remove_files(rel_paths)
+            Assembler.dedup.remove_files(rel_paths)
+            if Config.LEXICAL_INDEX_ENABLED:
+                for rel_path in rel_paths:
+                    Assembler.lexical.remove_file(rel_path)
+                Assembler.lexical.save()
+            Metrics.inc("files_deleted_total", len(rel_paths))
+            logger.info("Deleted %d records of %d files", deleted, len(rel_paths))
+            return {"files": len(rel_paths), "deleted": deleted}
+    
     @staticmethod
-    def query_file(filepath):
+    def delete_directory(dirpath):
+        """
+        Delete every stored file under dirpath (absolute path), whether or not
+        it still exists on disk: files from the manifest plus files found on disk
+        """
+        rel_dir = Config.get_relative_path(dirpath)
+        stored = Assembler.manifest.list_files(None if rel_dir == "." else rel_dir)
+        filepaths = [os.path.join(Config.DATA_DIR, rel_path) for rel_path in stored]
+        for root, _, filenames in os.walk(dirpath):
+            filepaths.extend(os.path.join(root, filename) for filename in filenames)
+        return Assembler.delete_files(filepaths)
+    
+    @staticmethod
+    def query_file(filepath, include=("documents", "metadatas"), page_size=1000):
         """
         Query file from vdb.
         Args:
             filepath: should be absolute path.
+            include: fields to fetch besides ids ("documents", "metadatas", "embeddings")
         Returns:
             A dictionary with query results, *no distance included* since we query by filters
             like {'document_ids': [...], 'documents': [...], 'metadatas': [...]}
+            (use iter_file to walk a large file without holding all of it)
         """
-        rel_path = Config.get_relative_path(filepath)
-        where = {"file_path": rel_path}
-        results = Assembler.db.query_by_metadata(where, n_results=99999999)
-        print(f"Found {len(results.get('documents', []))} documents for file: {rel_path}")
+        results = {"ids": []}
+        results.update((key, []) for key in include)
+        for page in Assembler.iter_file(filepath, include, page_size):
+            for key in results:
+                results[key].extend(page[key])
+        logger.debug("Found %d documents for file: %s", len(results['ids']), Config.get_relative_path(filepath))
         return results
     
+    @staticmethod
+    def iter_file(filepath, include=("documents", "metadatas"), page_size=1000):
+        """
+        Records of one file, page by page: its own records, then the chunks linked to
+        records of other chunks (dedup) with their metadata in this file
+        Yields:
+            chromadb get() results of at most page_size records
+        """
+        rel_path = Config.get_relative_path(filepath)
+        yield from Assembler.db.iter_pages({"file_path": rel_path}, page_size, include)
+        linked = Assembler._linked_records([rel_path], include)
+        for start in range(0, len(linked), page_size):
+            page = linked[start:start + page_size]
+            yield {"ids": page.ids, **{key: getattr(page, key) for key in include}}
+    
+    @staticmethod
+    def export_collection(jsonl_path, where=None, include_vectors=True, page_size=1000):
+        """
+        Stream the collection to jsonl_path (+ vectors as .npy next to it), constant memory
+        """
+        return export_collection(Assembler.db, jsonl_path, where, include_vectors, page_size)
+    
+    @staticmethod
+    def import_collection(jsonl_path, batch_size=1000):
+        """
+        Load an export_collection dump back into the DB
+        (run rebuild_lexical_index afterwards for hybrid search)
+        """
+        return import_collection(Assembler.db, jsonl_path, batch_size)
+    
     @staticmethod
     def query_with_vector(vector, n_results=5, where=None):
         """
         Query similar documents based on **one** query vector
         """
-        results = Assembler.db.query_with_vector(vector, n_results, where)
+        with Metrics.span("query", kind="vector"):
+            results = Assembler.db.query_with_vector(vector, n_results, where)
         # results['documents'] is a list of lists, so we check the length of the first list
         doc_count = len(results.get('documents', [[]])[0])
-        print(f"Found {doc_count} documents for the query vector.")
+        logger.debug("Found %d documents for the query vector.", doc_count)
         return results
     
+    @staticmethod
+    def query_with_vectors(vectors, n_results=5, where=None, columnar=False):
+        """
+        Query similar documents for many query vectors in one DB round trip
+        columnar: RecordBatch results instead of RAGRecord lists (no pydantic, see recordBatch.py)
+        Returns:
+            list (one per query vector) of lists of RAGRecord, of RecordBatch with columnar=True
+        """
+        if not len(vectors):
+            return []
+        with Metrics.span("query", attrs={"queries": len(vectors)}, kind="vectors"):
+            results = Assembler.db.query_with_vectors(vectors, n_results, where)
+            records = RecordBatch.per_query(results)
+            scope = Assembler._scoped_files(where)
+            if scope:
+                linked = Assembler._linked_records(scope, ("documents", "metadatas", "embeddings"), where)
+                records = [Assembler._with_linked(batch, linked, vector, n_results)
+                           for batch, vector in zip(records, vectors)]
+        logger.debug("Found %d documents for %d query vectors.", sum(len(r) for r in records), len(records))
+        return records if columnar else [batch.to_records() for batch in records]
+    
+    @staticmethod
+    def query_texts(texts, n_results=5, where=None, columnar=False):
+        """
+        Batched query_text: embeds all texts in one call and searches them together
+        Returns:
+            list (one per text) of lists of RAGRecord, of RecordBatch with columnar=True
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+        with Metrics.span("query", attrs={"queries": len(texts)}, kind="texts"):
+            vectors = EmbedderFactory.embed(texts)
+            missing = [t for t, v in zip(texts, vectors) if v is None]
+            if missing:
+                raise RuntimeError(f"Failed to embed {len(missing)} queries, e.g. {missing[0][:30]}...")
+            return Assembler.query_with_vectors(vectors, n_results, where, columnar)
+    
+    @staticmethod
+    def query_text(text, n_results=5, where=None, use_cache=True, columnar=False):
+        """
+        Query similar documents for a text, embedding included.
+        Query vectors are kept in an LRU/TTL cache, results too (keyed on the
+        collection version, so any write to the DB invalidates them).
+        Timings of every stage end up in Assembler.last_timings (of this thread / asyncio task).
+        columnar: return a RecordBatch (the hot path: no pydantic, iterate for rows)
+        Returns:
+            list of RAGRecord sorted by distance, a RecordBatch with columnar=True
+            (the caller's own copy, the cached one is never handed out)
+        """
+        timings = {"embed_cached": False, "result_cached": False}
+        start = time.perf_counter()
+        
+        query_key = Assembler._query_key(text)
+        vector, timings["embed_cached"] = Assembler._query_vector(text, use_cache)
+        t_embed = time.perf_counter()
+        timings["embed_ms"] = (t_embed - start) * 1000
+        
+        result_key = Assembler._result_key(query_key, n_results, where)
+        records = Assembler.query_results.get(result_key) if use_cache else None
+        if records is not None:
+            timings["result_cached"] = True
+            timings["search_ms"] = timings["hydrate_ms"] = 0.0
+            Metrics.inc("query_cache_hits_total", cache="result")
+        else:
+            records = Assembler._vector_search(vector, n_results, where, timings=timings)
+            Assembler.query_results.put(result_key, records)
+        
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        query_timings.set(timings)
+        Assembler._observe_query("text", timings)
+        return records.copy() if columnar else records.to_records()
+    
+    @staticmethod
+    def query_hybrid(text, n_results=5, where=None, candidates=None, rrf_k=Config.HYBRID_RRF_K, columnar=False):
+        """
+        Hybrid search: vector search and BM25 search, fused with reciprocal rank fusion
+            score(doc) = sum over both lists of 1 / (rrf_k + rank)
+        candidates: results taken from each side before fusion, default 4 * n_results
+        Returns:
+            list of RAGRecord with `score` set, best first (a RecordBatch with columnar=True)
+            (distance is None for records only the BM25 side found)
+        """
+        candidates = candidates or 4 * n_results
+        dense = Assembler.query_text(text, candidates, where, columnar=True)
+        timings = dict(Assembler.last_timings)
+        
+        t0 = time.perf_counter()
+        sparse = Assembler.lexical.search(text, candidates, where)
+        scope = Assembler._scoped_files(where)
+        linked = Assembler._linked_records(scope, ("documents", "metadatas"), where) if scope else RecordBatch.empty()
+        if len(linked):
+            sparse = sorted(sparse + Assembler.lexical.search(text, candidates, ids=set(linked.ids)),
+                            key=lambda hit: -hit[1])[:candidates]
+        t1 = time.perf_counter()
+        
+        scores = {}
+        for rank, record_id in enumerate(dense.ids):
+            scores[record_id] = scores.get(record_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+        for rank, (record_id, _) in enumerate(sparse):
+            scores[record_id] = scores.get(record_id, 0.0) + 1.0 / (rrf_k + rank + 1)
+        best = sorted(scores, key=scores.get, reverse=True)[:n_results]
+        
+        known = set(dense.ids) | set(linked.ids)
+        missing = [record_id for record_id in best if record_id not in known]
+        fetched = RecordBatch.from_results(Assembler.db.get_by_ids(missing)) if missing else RecordBatch.empty()
+        fetched = RecordBatch.concat([linked, fetched])
+        fetched.distances = [None] * len(fetched)
+        # dense rows first: a record both sides found keeps its distance
+        merged = RecordBatch.concat([fetched, dense])
+        rows = {record_id: i for i, record_id in enumerate(merged.ids)}
+        records = merged.take([rows[record_id] for record_id in best if record_id in rows])
+        records.scores = [scores[record_id] for record_id in records.ids]
+        
+        timings["sparse_ms"] = (t1 - t0) * 1000
+        timings["fuse_ms"] = (time.perf_counter() - t1) * 1000
+        timings["total_ms"] += timings["sparse_ms"] + timings["fuse_ms"]
+        query_timings.set(timings)
+        Assembler._observe_query("hybrid", timings)
+        return records if columnar else records.to_records()
+    
+    @staticmethod
+    def query_reranked(text, n_results=5, where=None, candidates=Config.RERANK_CANDIDATES,
+                       method=Config.RERANK_METHOD, budget_ms=Config.RERANK_BUDGET_MS,
+                       lambda_=Config.MMR_LAMBDA):
+        """
+        Over-fetch `candidates` records by vector search (stored embeddings included),
+        then rerank down to n_results (see reranker.Reranker):
+            "mmr"        diversify, near-duplicate / overlapping chunks don't fill the top-k
+            "cross"      local cross-encoder relevance, within budget_ms
+            "cross+mmr"  both
+        Returns:
+            RecordBatch with `scores` set, best first
+        """
+        from reranker import Reranker
+        start = time.perf_counter()
+        vector, embed_cached = Assembler._query_vector(text)
+        t_embed = time.perf_counter()
+        candidates = Assembler._vector_search(vector, max(candidates, n_results), where,
+                                              include=["documents", "metadatas", "distances", "embeddings"])
+        t_search = time.perf_counter()
+        records = Reranker.rerank(text, vector, candidates, n_results, method, budget_ms, lambda_)
+        t_rerank = time.perf_counter()
+        timings = {
+            "embed_cached": embed_cached,
+            "embed_ms": (t_embed - start) * 1000,
+            "search_ms": (t_search - t_embed) * 1000,
+            "rerank_ms": (t_rerank - t_search) * 1000,
+            "total_ms": (t_rerank - start) * 1000,
+        }
+        query_timings.set(timings)
+        Assembler._observe_query("reranked", timings)
+        return records
+    
+    @staticmethod
+    def answer(question, n_results=Config.ANSWER_N_RESULTS, where=None, budget_tokens=Config.ANSWER_CONTEXT_TOKENS,
+               rerank=Config.ANSWER_RERANK, model=None, **params):
+        """
+        Retrieve, pack the chunks into budget_tokens (see answer.pack_context) and stream
+        the chat model's answer. The request is sent when iteration starts.
+        params: extra completion parameters (temperature, max_tokens, ...)
+        Returns:
+            AnswerStream: iterate for the text deltas, .sources for the cited passages,
+            .stats for retrieve / time-to-first-token / total ms and token usage
+        """
+        from answer import AnswerStream, pack_context, build_messages
+        from api import ChatClient
+        start = time.perf_counter()
+        records = (Assembler.query_reranked(question, n_results, where) if rerank
+                   else Assembler.query_text(question, n_results, where, columnar=True))
+        packed = pack_context(records, budget_tokens)
+        stats = {"retrieve_ms": (time.perf_counter() - start) * 1000}
+        deltas = ChatClient.stream(build_messages(question, packed), model, stats, **params)
+        return AnswerStream(deltas, records, packed, stats, start)
+    
+    @staticmethod
+    def rebuild_lexical_index(page_size=1000):
+        """
+        Rebuild the BM25 index from everything in the vector DB
+        (for collections stored before the index existed)
+        """
+        Assembler.lexical.rebuild(Assembler.db.iter_pages(page_size=page_size, include=["documents", "metadatas"]))
+        Assembler.lexical.save()
+        logger.info("Lexical index rebuilt with %d documents", len(Assembler.lexical))
+    
+    @staticmethod
+    def rebuild_dedup_index(page_size=1000):
+        """
+        Rebuild the near-duplicate index from everything in the vector DB
+        (for collections stored before it existed, or after DEDUP_MODE was "off")
+        """
+        Assembler.dedup.clear()
+        near = Config.DEDUP_MODE == "near"
+        for page in Assembler.db.iter_pages(page_size=page_size, include=["documents", "metadatas"]):
+            Assembler.dedup.add(
+                (record_id, (meta or {}).get("file_path", ""), signature(document, near))
+                for record_id, document, meta in zip(page["ids"], page["documents"], page["metadatas"])
+            )
+        logger.info("Dedup index rebuilt with %d records", len(Assembler.dedup))
+    
+    @staticmethod
+    def metrics(format="json"):
+        """
+        Counters, latency histograms and recent spans of every stage (load, chunk, embed, db, queries...)
+        format: "json" (dict) or "prometheus" (text exposition format)
+        """
+        return Metrics.to_prometheus() if format == "prometheus" else Metrics.to_json()
+    
+    @staticmethod
+    def _query_vector(text, use_cache=True):
+        """
+        Query embedding through the in-memory query cache
+        Returns:
+            (vector, whether it came from the cache)
+        """
+        query_key = Assembler._query_key(text)
+        vector = Assembler.query_embeddings.get(query_key) if use_cache else None
+        if vector is not None:
+            Metrics.inc("query_cache_hits_total", cache="embedding")
+            return vector, True
+        vector = EmbedderFactory.embed([text])[0]
+        if vector is None:
+            Metrics.inc("query_errors_total", kind="text")
+            raise RuntimeError(f"Failed to embed query: {text[:30]}...")
+        Assembler.query_embeddings.put(query_key, vector)
+        return vector, False
+    
+    @staticmethod
+    def _query_key(text):
+        # vectors of one text differ between models, the model spec is part of every query cache key
+        return MODEL_SPEC, EmbeddingCache.normalize(text)
+    
+    @staticmethod
+    def _result_key(query_key, n_results, where):
+        # db.version only counts this process's writes; every sync / delete, from any process,
+        # also writes the manifest (and a file-scoped result depends on its links, see dedup).
+        # DB writes that bypass the manifest in another process (import_collection) are only
+        # seen once the entry expires (QUERY_RESULT_CACHE_TTL)
+        return query_key + (n_results, json.dumps(where, sort_keys=True), Assembler.db.version,
+                            Assembler.manifest.revision())
+    
+    @staticmethod
+    def _vector_search(vector, n_results, where, include=None, timings=None):
+        """
+        One vector search, chunks of the files `where` pins that are linked to other records
+        (dedup) included (see _linked_records)
+        Returns:
+            RecordBatch sorted by distance
+        """
+        start = time.perf_counter()
+        kwargs = {"include": include} if include else {}
+        results = Assembler.db.query_with_vector(vector, n_results, where, **kwargs)
+        t_search = time.perf_counter()
+        records = RecordBatch.from_results(results)
+        scope = Assembler._scoped_files(where)
+        if scope:
+            linked = Assembler._linked_records(scope, ("documents", "metadatas", "embeddings"), where)
+            records = Assembler._with_linked(records, linked, vector, n_results)
+        if timings is not None:
+            timings["search_ms"] = (t_search - start) * 1000
+            timings["hydrate_ms"] = (time.perf_counter() - t_search) * 1000
+        return records
+    
+    @staticmethod
+    def _scoped_files(where):
+        """
+        Files a metadata filter pins (file_path equality / $eq / $in, also under $and), None if it doesn't
+        """
+        files = []
+        for key, cond in (where or {}).items():
+            if key == "$and":
+                files.extend(f for c in cond for f in Assembler._scoped_files(c) or [])
+            elif key == "file_path":
+                if isinstance(cond, str):
+                    files.append(cond)
+                elif isinstance(cond, dict) and "$eq" in cond:
+                    files.append(cond["$eq"])
+                elif isinstance(cond, dict) and "$in" in cond:
+                    files.extend(cond["$in"])
+        return files or None
+    
+    @staticmethod
+    def _linked_records(rel_paths, include=("documents", "metadatas"), where=None):
+        """
+        Chunks of rel_paths linked to the record of another chunk (dedup) have no record of their own:
+        they are read through the manifest as that record (id, document, embedding)
+        with the metadata of the linking chunk (its file, chunk_index and offsets).
+        The document is the canonical text: for a near-duplicate (DEDUP_MODE "near") it differs
+        a little from the text at those offsets.
+        where: filter on that metadata
+        Returns:
+            RecordBatch, one row per linking chunk
+        """
+        rows = [row for row in Assembler.manifest.get_shared(rel_paths)
+                if row[2] != Assembler._own_record_id(row[0], row[1])]
+        if not rows:
+            return RecordBatch.empty()
+        fetch = ["metadatas"] + [key for key in ("documents", "embeddings") if key in include]
+        found = RecordBatch.from_results(
+            Assembler.db.get_by_ids(list(dict.fromkeys(row[2] for row in rows)), include=fetch)
+        )
+        at = {record_id: i for i, record_id in enumerate(found.ids)}
+        picks, metadatas = [], []
+        for rel_path, idx, record_id, position in rows:
+            if record_id not in at:
+                continue
+            metadata = {k: v for k, v in found.metadatas[at[record_id]].items() if k not in POSITION_KEYS}
+            metadata.update(source_name=os.path.basename(rel_path),
+                            source_type=os.path.splitext(rel_path)[1].lstrip("."),
+                            file_path=rel_path, chunk_index=idx, **(json.loads(position) if position else {}))
+            if where and not match_where(metadata, where):
+                continue
+            picks.append(at[record_id])
+            metadatas.append(metadata)
+        linked = found.take(picks)
+        linked.metadatas = metadatas
+        return linked
+    
+    @staticmethod
+    def _with_linked(records, linked, vector, n_results):
+        """
+        Hits of one query vector with the linked records (with embeddings) merged in by cosine distance
+        """
+        fresh, seen = [], set(records.ids)
+        for i, record_id in enumerate(linked.ids):
+            if record_id not in seen:
+                seen.add(record_id)
+                fresh.append(i)
+        if not fresh:
+            return records
+        extra = linked.take(fresh)
+        q = np.asarray(vector, dtype=np.float32)
+        norms = np.linalg.norm(extra.embeddings, axis=1) * (np.linalg.norm(q) or 1.0)
+        extra.distances = (1.0 - extra.embeddings @ q / np.where(norms > 0, norms, 1.0)).tolist()
+        if records.embeddings is None and len(records):
+            extra.embeddings = None
+        if records.documents is None:
+            extra.documents = None
+        merged = RecordBatch.concat([records, extra])
+        return merged.take(sorted(range(len(merged)), key=lambda i: merged.distances[i])[:n_results])
+    
+    @staticmethod
+    def _observe_query(kind, timings):
+        """
+        Query latency histograms (total and per stage) and the slow query log
+        """
+        Metrics.observe("query_seconds", timings["total_ms"] / 1000, kind=kind)
+        for stage in ("embed", "search", "hydrate", "sparse", "fuse", "rerank"):
+            if f"{stage}_ms" in timings:
+                Metrics.observe("query_stage_seconds", timings[f"{stage}_ms"] / 1000, kind=kind, stage=stage)
+        if timings["total_ms"] > Config.QUERY_LATENCY_BUDGET_MS:
+            Metrics.inc("query_slow_total", kind=kind)
+            logger.warning("Slow %s query (%.0fms > %sms): %s",
+                           kind, timings["total_ms"], Config.QUERY_LATENCY_BUDGET_MS, timings)
+    
+    @staticmethod
+    def _check_file(filepath, force=False):
+        """
+        First step of a sync: compare the file with its manifest entry.
+        Returns None if the file can be skipped, otherwise a SyncJob
+        that the next steps fill in.
+        """
+        rel_path = Config.get_relative_path(filepath)
+        stat = os.stat(filepath)
+        entry = Assembler.manifest.get_file(rel_path)
+        
+        # an empty content hash marks chunks that failed to embed, the file is synced again
+        if (not force and entry and entry["content_hash"]
+                and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size):
+            logger.debug("|%s| unchanged, skipped", rel_path)
+            return None
+        content_hash = IngestManifest.hash_file(filepath)
+        if not force and entry and entry["content_hash"] == content_hash:
+            Assembler.manifest.touch_file(rel_path, stat.st_mtime_ns, stat.st_size)
+            logger.debug("|%s| content unchanged, skipped", rel_path)
+            return None
+        # row-streamed files (csv, xlsx, json...) may be huge: records go to the DB group by group
+        return SyncJob(filepath, rel_path, force, stat.st_mtime_ns, stat.st_size, content_hash,
+                       write_through=DataLoaderFactory.streams(filepath))
+    
+    @staticmethod
+    def _prepare_records(job):
+        """
+        Second step: diff job.chunks (iterable of (chunk, attributes)) against the manifest,
+        embed only changed chunks and build their records into job.records.
+        job.chunks may be a generator: changed chunks are embedded in groups
+        while the rest of the file is still being loaded / chunked.
+        job.write_through: every group is upserted and committed as soon as it is embedded
+        (_write_group), nothing of it is kept; job.records stays empty.
+        """
+        batches = []
+        for group in Assembler._changed_groups(job):
+            batch = Assembler._group_records(job, group, EmbedderFactory.embed([chunk for _, chunk, _ in group]))
+            if job.write_through:
+                Assembler._write_group(job, group, batch)
+            else:
+                batches.append(batch)
+        return Assembler._finish_records(job, batches)
+    
+    @staticmethod
+    def _write_group(job, group, batch):
+        """
+        Write-through: upsert one embedded group and commit it, the group is not kept
+        """
+        with Assembler.write_lock:
+            done = [idx for idx, _, _ in group]
+            Assembler._promote_replaced(job, done)
+            if not Assembler._records_to_db(batch, Assembler.db):
+                raise RuntimeError(f"Failed to write {len(batch)} records of {job.rel_path}")
+            Assembler._commit_chunks(job, done, batch)
+    
+    @staticmethod
+    def _changed_groups(job):
+        """
+        Hash every chunk of job.chunks and compare with the manifest (read EMBED_STREAM_GROUP
+        chunks at a time). Unchanged chunks and duplicates (dedup) go to the job to be committed,
+        the others are yielded as groups of (chunk_index, chunk, attributes) to embed,
+        at most EMBED_STREAM_GROUP per group, as soon as a group is full
+        """
+        rel_path, window_size = job.rel_path, Config.EMBED_STREAM_GROUP
+        if Config.DEDUP_MODE != "off":
+            job.local = DedupIndex(":memory:")
+        # rows of a table share their column names and differ in a few values:
+        # near-duplicate matching would link different rows, they are only matched exactly
+        near = Config.DEDUP_MODE == "near" and not job.write_through
+        window, window_end, pending = {}, 0, []
+        for idx, (chunk, attrs) in enumerate(job.chunks):
+            if idx >= window_end:
+                window_end = idx + window_size
+                window = Assembler.manifest.get_chunks(rel_path, idx, window_end)
+            old = window.get(idx)
+            job.n_chunks = idx + 1
+            h, position = Assembler._chunk_hash(chunk, attrs), Assembler._chunk_position(attrs)
+            if not job.force and old is not None and old[0] == h:
+                # a linked record keeps the offsets of the file that owns it
+                if position != old[2] and old[1] == Assembler._own_record_id(rel_path, idx):
+                    job.moved[old[1]] = position
+                job.rows.append((idx, h, old[1], position))
+            else:
+                job.stats["changed"] += 1
+                sig = signature(chunk, near) if job.local is not None else None
+                link = Assembler._find_duplicate(job, idx, sig) if sig is not None else None
+                if link is not None:
+                    record_id, kind, other = link
+                    job.links[idx] = (record_id, kind, sig, h, position, old, other)
+                else:
+                    job.inflight[idx] = (h, position, sig, old)
+                    if sig is not None:
+                        job.local.add([(str(idx), rel_path, sig)])
+                    pending.append((idx, chunk, attrs))
+                    if len(pending) >= window_size:
+                        yield pending
+                        pending = []
+            if job.write_through and (len(job.rows) >= window_size or len(job.links) >= window_size):
+                Assembler._commit_chunks(job)
+        if pending:
+            yield pending
+        if job.write_through:
+            # the rest, once the last group is written
+            Assembler._commit_chunks(job)
+    
+    @staticmethod
+    def _find_duplicate(job, idx, sig):
+        """
+        The record a changed chunk duplicates (dedup): a record of another file, a chunk of this
+        file being embedded, or the record of an earlier chunk of this file that stays as it is
+        Returns:
+            (record_id, "exact" | "near", chunk index of the chunk in flight or None), or None
+        """
+        rel_path = job.rel_path
+        match = Assembler.dedup.match(sig, exclude_file=rel_path)
+        if match is not None:
+            return match + (None,)
+        match = job.local.match(sig)
+        if match is not None:
+            other = int(match[0])
+            return Assembler._own_record_id(rel_path, other), match[1], other
+        match = Assembler.dedup.match(sig, only_file=rel_path)
+        # records of the chunks changed in this sync are rewritten or dropped
+        if match is not None and any(file_path == rel_path and j < idx and j not in job.inflight and j not in job.links
+                                     for file_path, j, _ in Assembler.manifest.get_referrers([match[0]]).get(match[0], [])):
+            return match + (None,)
+        return None
+    
+    @staticmethod
+    def _commit_chunks(job, done=(), batch=None):
+        """
+        The one commit routine of a sync: what is ready in the job goes to the manifest
+            done       chunks in flight whose records are in the DB now (batch) or failed to embed
+            links      duplicates whose canonical record is no longer in flight
+            rows       unchanged chunks (and offset moves)
+        The new records are indexed (dedup, BM25), the records nothing points at any more deleted.
+        A held file commits once, a row-streamed one a group at a time.
+        """
+        with Assembler.write_lock:
+            rel_path, stats = job.rel_path, job.stats
+            if not job.started:
+                # the file hash stays empty until _commit_file: an interrupted sync is done again
+                Assembler.manifest.begin_file(rel_path, job.mtime_ns, job.size)
+                job.started = True
+            stored = {}
+            if batch is not None:
+                stored = {meta["chunk_index"]: record_id for record_id, meta in zip(batch.ids, batch.metadatas)}
+            signatures = []
+            for idx in done:
+                h, position, sig, old = job.inflight.pop(idx)
+                if idx in stored:
+                    job.rows.append((idx, h, stored[idx], position))
+                    if sig is not None:
+                        signatures.append((stored[idx], rel_path, sig))
+                    continue
+                stats["failed"] += 1
+                if old is not None:
+                    # failed to embed: the old record stays under an empty hash, the next sync retries it
+                    job.rows.append((idx, "", old[1], old[2]))
+            if job.local is not None and done:
+                job.local.remove([str(idx) for idx in done])
+            stats["embedded"] += len(stored)
+            Assembler.dedup.add(signatures)
+            if Config.LEXICAL_INDEX_ENABLED and stored:
+                Assembler.lexical.add(batch.ids, batch.documents, batch.metadatas)
+        
+            # a canonical record may have changed or gone since the lookup (its file synced / deleted
+            # meanwhile): such chunks are left out like failed ones, the next sync embeds them
+            links = [(idx, job.links.pop(idx)) for idx, link in list(job.links.items()) if link[6] not in job.inflight]
+            confirmed = Assembler.dedup.confirm([(link[0], link[2]) for _, link in links]) if links else []
+            dropped = []
+            for (idx, (record_id, kind, _, h, position, old, _)), ok in zip(links, confirmed):
+                if ok:
+                    job.rows.append((idx, h, record_id, position))
+                    stats["linked"] += 1
+                    Metrics.inc("chunks_deduplicated_total", kind=kind)
+                    if old is not None and old[1] != record_id:
+                        dropped.append(old[1])
+                    continue
+                stats["failed"] += 1
+                if old is not None:
+                    job.rows.append((idx, "", old[1], old[2]))
+            # records other files link to move to them before this file lets go of them
+            Assembler._promote_shared(dropped, {rel_path})
+            Assembler.manifest.put_chunks(rel_path, job.rows)
+            stats["moved"] += Assembler._move_records(job.moved)
+            job.rows, job.moved = [], {}
+            Assembler._drop_records(job, dropped)
+    
+    @staticmethod
+    def _drop_records(job, record_ids):
+        # records no manifest row points at any more
+        referrers = Assembler.manifest.get_referrers(record_ids) if record_ids else {}
+        orphan_ids = [record_id for record_id in dict.fromkeys(record_ids) if record_id not in referrers]
+        if not orphan_ids:
+            return
+        Assembler.db.delete_by_ids(orphan_ids)
+        Assembler.dedup.remove(orphan_ids)
+        if Config.LEXICAL_INDEX_ENABLED:
+            Assembler.lexical.remove(orphan_ids)
+        job.stats["deleted"] += len(orphan_ids)
+    
+    @staticmethod
+    def _own_record_id(rel_path, idx):
+        # the id chunk idx of the file gets when it is stored under its own name
+        return make_record_id(os.path.basename(rel_path), os.path.splitext(rel_path)[1].lstrip("."), rel_path, idx)
+    
+    @staticmethod
+    def _group_records(job, group, embeddings):
+        return Assembler._build_records(
+            job.filepath,
+            [(idx, chunk, emb, attrs) for (idx, chunk, attrs), emb in zip(group, embeddings)]
+        )
+    
+    @staticmethod
+    def _finish_records(job, batches):
+        job.records = RecordBatch.concat(batches)
+        job.chunks = None  # texts live in the records now
+        return job
+    
+    @staticmethod
+    def _store_file(job):
+        """
+        Write the records of a prepared job (held file) and commit it
+        Returns:
+            the result of _commit_file, None if the records could not be written
+        """
+        with Assembler.write_lock:
+            if not job.write_through:
+                Assembler._promote_replaced(job, list(job.inflight))
+                if not Assembler._records_to_db(job.records, Assembler.db):
+                    return None
+            return Assembler._commit_file(job)
+    
+    @staticmethod
+    def _promote_replaced(job, idxs):
+        # records other files link to are moved away before these chunks overwrite them
+        Assembler._promote_shared([job.inflight[idx][3][1] for idx in idxs if job.inflight[idx][3] is not None],
+                                  {job.rel_path})
+    
+    @staticmethod
+    def _promote_shared(record_ids, leaving):
+        """
+        Records owned by the files in `leaving` that chunks of other files still link to (dedup)
+        are copied, embedding included, to the record id of the first exact duplicate linking
+        to it and the exact links move over; the owner is then free to overwrite or delete its record.
+        Near-duplicate links are dropped instead (their own text differs): those chunks are
+        forgotten and their files left due for a sync, which embeds them under their own text.
+        Returns:
+            number of records copied
+        """
+        referrers = Assembler.manifest.get_referrers(record_ids)
+        if not any(file_path not in leaving for chunks in referrers.values() for file_path, _, _ in chunks):
+            return 0
+        records = RecordBatch.from_results(
+            Assembler.db.get_by_ids(list(referrers), include=["documents", "metadatas", "embeddings"])
+        )
+        moves, copies, requeued = [], [], []
+        for record in records:
+            if record.file_path not in leaving:
+                continue  # a link of a leaving file into a record it does not own
+            chunks = referrers[record.id]
+            owner_hash = next((h for file_path, idx, h in chunks
+                               if (file_path, idx) == (record.file_path, record.chunk_index)), None)
+            others = [chunk for chunk in chunks if chunk[0] not in leaving]
+            # same chunk hash as the owner's chunk: same text and attributes, the copy is that chunk's own record
+            exact = [chunk for chunk in others if owner_hash and chunk[2] == owner_hash]
+            requeued.extend(chunk[:2] for chunk in others if chunk not in exact)
+            if not exact:
+                continue
+            rel_path, chunk_index, _ = exact[0]
+            # offsets point into the old owner's text
+            attrs = {k: v for k, v in record.metadata.items() if k not in
+                     ("source_name", "source_type", "file_path", "chunk_index", "start_offset", "end_offset")}
+            copy = Assembler._build_records(os.path.join(Config.DATA_DIR, rel_path),
+                                            [(chunk_index, record.document, record.vector, attrs)])
+            moves.append((record.id, copy.ids[0], rel_path))
+            copies.append(copy)
+        if requeued:
+            Assembler.manifest.requeue(requeued)
+            Metrics.inc("dedup_requeued_total", len(requeued))
+            logger.info("%d near-duplicate chunks lost their record, due for a sync: %s",
+                        len(requeued), sorted({file_path for file_path, _ in requeued}))
+        if not copies:
+            return 0
+        copies = RecordBatch.concat(copies)
+        if not Assembler._records_to_db(copies, Assembler.db):
+            raise RuntimeError(f"Failed to move {len(copies)} shared records")
+        for old_id, new_id, rel_path in moves:
+            Assembler.manifest.relink(old_id, new_id, exclude_files=leaving)
+            Assembler.dedup.reassign(old_id, new_id, rel_path)
+        if Config.LEXICAL_INDEX_ENABLED:
+            Assembler.lexical.add(copies.ids, copies.documents, copies.metadatas)
+        Metrics.inc("dedup_promoted_total", len(copies))
+        logger.debug("Moved %d shared records out of %s", len(copies), sorted(leaving))
+        return len(copies)
+    
+    @staticmethod
+    def _chunk_hash(chunk, attrs):
+        # attributes are part of the record too, a chunk moving to another page must be rewritten;
+        # offsets are left out: text inserted above a chunk only moves it (see _chunk_position)
+        attrs = {k: v for k, v in (attrs or {}).items() if k not in POSITION_KEYS}
+        if attrs:
+            chunk = chunk + "\x00" + json.dumps(attrs, sort_keys=True)
+        return IngestManifest.hash_text(chunk)
+    
+    @staticmethod
+    def _chunk_position(attrs):
+        position = {k: attrs[k] for k in POSITION_KEYS if k in (attrs or {})}
+        return json.dumps(position, sort_keys=True) if position else ""
+    
+    @staticmethod
+    def _move_records(moved):
+        """
+        Chunks whose text is unchanged but whose offsets moved: only the metadata of their
+        records is rewritten, nothing is embedded again.
+        moved: {record_id: position (JSON of the new offsets)}
+        """
+        if not moved:
+            return 0
+        found = Assembler.db.get_by_ids(list(moved), include=["metadatas"])
+        metadatas = [{**metadata, **json.loads(moved[record_id])}
+                     for record_id, metadata in zip(found["ids"], found["metadatas"])]
+        if not Assembler.db.update_metadatas(found["ids"], metadatas):
+            raise RuntimeError(f"Failed to update the offsets of {len(metadatas)} records")
+        return len(metadatas)
+    
+    @staticmethod
+    def _commit_file(job):
+        """
+        Last step, once the records of job are in the DB: commit what is left (the whole file
+        for a held one), drop the chunks past the new end of the file a window at a time
+        and record the file's hash in the manifest
+        """
+        with Assembler.write_lock:
+            Assembler._commit_chunks(job, list(job.inflight), job.records)
+            rel_path, n_chunks, stats = job.rel_path, job.n_chunks, job.stats
+            while True:
+                tail = Assembler.manifest.get_chunks(rel_path, n_chunks, limit=Config.EMBED_STREAM_GROUP)
+                if not tail:
+                    break
+                record_ids = [record_id for _, record_id, _ in tail.values()]
+                Assembler._promote_shared(record_ids, {rel_path})
+                Assembler.manifest.delete_chunks(rel_path, n_chunks, max(tail) + 1)
+                Assembler._drop_records(job, record_ids)
+            if job.force:
+                # records stored before the manifest existed
+                Assembler.db.delete_documents(
+                    {"$and": [{"file_path": rel_path}, {"chunk_index": {"$gte": n_chunks}}]}
+                )
+                if Config.LEXICAL_INDEX_ENABLED:
+                    Assembler.lexical.remove_file(rel_path, from_chunk=n_chunks)
+            # if some chunks failed to embed, leave the file hash empty so the next sync retries them
+            Assembler.manifest.finish_file(rel_path, job.content_hash if not stats["failed"] else "",
+                                           job.mtime_ns, job.size)
+            if job.local is not None:
+                job.local.close()
+        
+            result = {
+                "status": "updated",
+                "embedded": stats["embedded"],
+                "linked": stats["linked"],
+                "unchanged": n_chunks - stats["changed"],
+                "moved": stats["moved"],
+                "deleted": stats["deleted"],
+            }
+            Metrics.inc("chunks_embedded_total", result["embedded"])
+            logger.info("|%s| synced: %s", rel_path, result)
+            return result
+    
     @staticmethod
     def _get_records(file_path):
         """
         Get records objects from file_path, to create a record, we need:
             chunk text, embedding vector, metadata
         """
+        chunks = list(Assembler._iter_chunks(file_path))
+        embeddings = EmbedderFactory.embed([chunk for chunk, _ in chunks])
+        return Assembler._build_records(
+            file_path, [(idx, chunk, emb, attrs) for idx, ((chunk, attrs), emb) in enumerate(zip(chunks, embeddings))]
+        )
+    
+    @staticmethod
+    def _iter_chunks(file_path):
+        """
+        file_path -> load -> chunk, lazily
+        yields (chunk, attributes), e.g. attributes = {"page_number": 3} for pdf pages
+        """
         _,ext = os.path.splitext(file_path)
-        data = DataLoaderFactory.load(file_path)
-        chunks = ChunkerFactory.chunk(data, ext)
-        embeddings = HuggingFaceEmbedder.embed(chunks)
-        
-        records = []
-        for idx, chunk in enumerate(chunks):
- 
-            metadata = RAGMetadata(
-                source_name=os.path.basename(file_path),
-                source_type=ext.lstrip('.'),
-                attributes=ExtraAttributes(
-                    file_path=Config.get_relative_path(file_path),
-                    chunk_index=idx
-                )
-            )
-            # metadata.print_metadata()
-            
-            record = RAGRecord(
-                document=chunk,
-                metadata=metadata,
-                vector=embeddings[idx]
-            )
-            records.append(record)
-        return records
+        segments = DataLoaderFactory.iter_load(file_path)
+        return ChunkerFactory.iter_chunks(segments, ext)
+    
+    @staticmethod
+    def _build_records(file_path, items):
+        """
+        items: list of (chunk_index, chunk, embedding, attributes)
+        chunks whose embedding failed (None) are skipped
+        Returns:
+            RecordBatch (no pydantic on the ingest path, .to_records() if you need RAGRecords)
+        """
+        return RecordBatch.from_chunks(file_path, Config.get_relative_path(file_path), items)
     
     @staticmethod
     def _records_to_db(records,db):
         """
-        Insert records to vector DB
+        Insert records (RecordBatch or list of RAGRecord) to vector DB
+        Returns:
+            False if the DB rejected the upsert
         """
-        formatted_records = [r.to_db_format() for r in records]
-        
-        if formatted_records:
-            db.add_documents(
-                ids=[r["id"] for r in formatted_records],
-                texts=[r["document"] for r in formatted_records],
-                embeddings=[r["vector"] for r in formatted_records],
-                metadatas=[r["metadata"] for r in formatted_records]
-            )
+        if not isinstance(records, RecordBatch):
+            records = RecordBatch.from_rag_records(records)
+        if not len(records):
+            return True
+        return db.add_documents(**records.to_db_format())
     
 if __name__ == "__main__":
+    from shcema import RAGRecord
     file_path = Config.TEST_FILE_PATH
     
     # print("Dpocument count in DB before storing file:", Assembler.db.count())
@@ -127,7 +1036,7 @@ if __name__ == "__main__":
     # records = RAGRecord.get_records_from_results(results)
     
     text = ["智能体采取的动作"]
-    embedding = HuggingFaceEmbedder.embed(text)[0]
+    embedding = EmbedderFactory.embed(text)[0]
     results = Assembler.query_with_vector(embedding, n_results=5)
     records = RAGRecord.get_records_from_results(results)
     # records = RAGRecord.sort_by_distance(records)
@@ -0,0 +1,278 @@
+import time
+import asyncio
+import weakref
+from collections import deque
+from config import Config
+from embedder import EmbedderFactory
+from assembler import Assembler, query_timings
+from registry import ClientRegistry, get_async_executor, run_blocking
+from metrics import Metrics, get_logger
+
+###########################################
+# asyncio front end of the Assembler, for serving many requests from one process
+#   embedding:   awaited on the event loop (HF AsyncInferenceClient), at most
+#                EMBED_MAX_WORKERS requests per loop; CPU-bound local / hash models run in the pool
+#   chroma, sqlite (manifest, caches), file loading: a bounded thread pool
+#                (ASYNC_DB_WORKERS threads, see registry), the event loop never blocks on them
+#   identical in-flight requests are coalesced: one embedding / one search,
+#   every caller gets its result
+# shares the DB, manifest, lexical index and query caches with Assembler,
+# sync and async callers can be mixed in one process.
+###########################################
+
+logger = get_logger("asyncAssembler")
+
+
+class AsyncAssembler:
+    # (event loop, key) -> task computing it; entries leave when the task is done
+    _inflight = {}
+    # (event loop, rel_path) -> lock: one write at a time per file
+    _file_locks = weakref.WeakValueDictionary()
+
+    @staticmethod
+    async def store_file(filepath, incremental=False):
+        """
+        Store file to vdb (see Assembler.store_file).
+        filepath: should be absolute path.
+        """
+        return await AsyncAssembler.sync_file(filepath, force=not incremental)
+
+    @staticmethod
+    async def sync_file(filepath, force=False):
+        """
+        Assembler.sync_file without blocking the event loop:
+        load + chunk + diff run in the pool, the changed groups are embedded concurrently,
+        the upsert and manifest commit go back to the pool.
+        Returns:
+            a dict like {'status': 'updated', 'embedded': 3, 'unchanged': 40, 'deleted': 2}
+        """
+        rel_path = Config.get_relative_path(filepath)
+        async with AsyncAssembler._file_lock(rel_path):
+            with Metrics.span("sync_file", attrs={"file": rel_path, "async": True}) as span:
+                result = await AsyncAssembler._sync_file(filepath, force)
+                span.update(result)
+        Metrics.inc("files_synced_total", status=result["status"])
+        return result
+
+    @staticmethod
+    async def delete_file(filepath):
+        """
+        Delete file from vdb.
+        filepath: should be absolute path.
+        Returns:
+            number of deleted records
+        """
+        async with AsyncAssembler._file_lock(Config.get_relative_path(filepath)):
+            return await AsyncAssembler.run(Assembler.delete_file, filepath)
+
+    @staticmethod
+    async def query_with_vector(vector, n_results=5, where=None):
+        """
+        Query similar documents based on **one** query vector (chromadb result dict)
+        """
+        return await AsyncAssembler.run(Assembler.query_with_vector, vector, n_results, where)
+
+    @staticmethod
+    async def query_text(text, n_results=5, where=None, use_cache=True, columnar=False):
+        """
+        Assembler.query_text for async callers: same caches, the query embedding is awaited
+        and the search runs in the pool. Concurrent calls with the same text share the
+        embedding, with the same text / n_results / where / DB version also the search.
+        Returns:
+            list of RAGRecord sorted by distance, a RecordBatch (own copy) with columnar=True
+        """
+        start = time.perf_counter()
+        timings = {"embed_cached": False, "result_cached": False}
+
+        query_key = Assembler._query_key(text)
+        vector = Assembler.query_embeddings.get(query_key) if use_cache else None
+        if vector is None:
+            vector = await AsyncAssembler._coalesce(("embed",) + query_key, lambda: AsyncAssembler._embed_query(text))
+        else:
+            timings["embed_cached"] = True
+            Metrics.inc("query_cache_hits_total", cache="embedding")
+        t_embed = time.perf_counter()
+        timings["embed_ms"] = (t_embed - start) * 1000
+
+        # in the pool: the first call opens the DB / manifest
+        result_key = await AsyncAssembler.run(Assembler._result_key, query_key, n_results, where)
+        records = Assembler.query_results.get(result_key) if use_cache else None
+        if records is not None:
+            timings["result_cached"] = True
+            timings["search_ms"] = 0.0
+            Metrics.inc("query_cache_hits_total", cache="result")
+        else:
+            records = await AsyncAssembler._coalesce(
+                ("search",) + result_key, lambda: AsyncAssembler._search(vector, n_results, where, result_key)
+            )
+            timings["search_ms"] = (time.perf_counter() - t_embed) * 1000
+
+        timings["total_ms"] = (time.perf_counter() - start) * 1000
+        # this task's own value, other tasks querying meanwhile keep theirs
+        query_timings.set(timings)
+        Assembler._observe_query("text", timings)
+        return records.copy() if columnar else records.to_records()
+
+    @staticmethod
+    async def query_reranked(text, n_results=5, where=None, **kwargs):
+        """
+        Assembler.query_reranked for async callers: the (coalesced) query embedding is awaited,
+        the over-fetching search and the CPU-bound rerank run in the pool.
+        kwargs: candidates, method, budget_ms, lambda_
+        """
+        query_key = Assembler._query_key(text)
+        if Assembler.query_embeddings.get(query_key) is None:
+            await AsyncAssembler._coalesce(("embed",) + query_key, lambda: AsyncAssembler._embed_query(text))
+        # the vector is in the query cache now, Assembler.query_reranked finds it there
+        return await AsyncAssembler.run(Assembler.query_reranked, text, n_results, where, **kwargs)
+
+    @staticmethod
+    async def answer(question, n_results=Config.ANSWER_N_RESULTS, where=None,
+                     budget_tokens=Config.ANSWER_CONTEXT_TOKENS, rerank=Config.ANSWER_RERANK, model=None, **params):
+        """
+        Assembler.answer for async callers: retrieval is awaited, the answer streams from
+        the AsyncOpenAI client of the running loop.
+            stream = await AsyncAssembler.answer(question)
+            async for text in stream: ...
+        """
+        from answer import AnswerStream, pack_context, build_messages
+        from api import ChatClient
+        start = time.perf_counter()
+        records = await (AsyncAssembler.query_reranked(question, n_results, where) if rerank
+                         else AsyncAssembler.query_text(question, n_results, where, columnar=True))
+        packed = pack_context(records, budget_tokens)
+        stats = {"retrieve_ms": (time.perf_counter() - start) * 1000}
+        deltas = ChatClient.astream(build_messages(question, packed), model, stats, **params)
+        return AnswerStream(deltas, records, packed, stats, start)
+
+    @staticmethod
+    async def query_texts(texts, n_results=5, where=None, columnar=False):
+        """
+        Many queries at once, each one coalesced / cached like query_text
+        Returns:
+            list (one per text) of lists of RAGRecord, of RecordBatch with columnar=True
+        """
+        return list(await asyncio.gather(*(AsyncAssembler.query_text(t, n_results, where, columnar=columnar)
+                                           for t in texts)))
+
+    @staticmethod
+    async def run(fn, *args, **kwargs):
+        """
+        Run a blocking call in the bounded pool and await it
+        """
+        return await run_blocking(fn, *args, **kwargs)
+
+    @staticmethod
+    def executor():
+        """
+        The pool for blocking calls, shared process-wide (see registry)
+        """
+        return get_async_executor()
+
+    @staticmethod
+    async def aclose():
+        """
+        Close the async HTTP clients of the running event loop (call before the loop ends)
+        """
+        loop = asyncio.get_running_loop()
+        for key in ClientRegistry.keys():
+            if key[0] in ("hf_async_inference", "llm_async", "embed_limiter") and key[-1] is loop:
+                client = ClientRegistry.peek(key)
+                ClientRegistry.close(key)
+                if hasattr(client, "close"):
+                    await client.close()
+
+    # --- internals ---
+
+    @staticmethod
+    async def _sync_file(filepath, force):
+        job = await AsyncAssembler.run(Assembler._check_file, filepath, force)
+        if job is None:
+            return {"status": "skipped", "embedded": 0, "unchanged": 0, "deleted": 0}
+        job.chunks = await AsyncAssembler.run(Assembler._iter_chunks, filepath)
+        groups = Assembler._changed_groups(job)
+        # the next group is read (loaded, chunked, diffed) in the pool while the earlier ones
+        # are embedding; at most EMBED_MAX_WORKERS groups are in flight
+        pending, batches = deque(), []
+        try:
+            while True:
+                group = await AsyncAssembler.run(next, groups, None)
+                if group is None:
+                    break
+                pending.append((group, asyncio.ensure_future(
+                    EmbedderFactory.aembed([chunk for _, chunk, _ in group]))))
+                if len(pending) >= Config.EMBED_MAX_WORKERS:
+                    await AsyncAssembler._group_batch(job, batches, *pending.popleft())
+            while pending:
+                await AsyncAssembler._group_batch(job, batches, *pending.popleft())
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+        def write():
+            Assembler._finish_records(job, batches)
+            result = Assembler._store_file(job)
+            if result is None:
+                return {"status": "failed", "embedded": 0, "unchanged": 0, "deleted": 0}
+            Assembler.lexical.save()
+            return result
+        return await AsyncAssembler.run(write)
+
+    @staticmethod
+    async def _group_batch(job, batches, group, task):
+        batch = Assembler._group_records(job, group, await task)
+        if job.write_through:
+            # row-streamed file: written and committed group by group, nothing is kept
+            await AsyncAssembler.run(Assembler._write_group, job, group, batch)
+        else:
+            batches.append(batch)
+
+    @staticmethod
+    async def _embed_query(text):
+        vector = (await EmbedderFactory.aembed([text]))[0]
+        if vector is None:
+            Metrics.inc("query_errors_total", kind="text")
+            raise RuntimeError(f"Failed to embed query: {text[:30]}...")
+        Assembler.query_embeddings.put(Assembler._query_key(text), vector)
+        return vector
+
+    @staticmethod
+    async def _search(vector, n_results, where, result_key):
+        records = await AsyncAssembler.run(Assembler._vector_search, vector, n_results, where)
+        Assembler.query_results.put(result_key, records)
+        return records
+
+    @staticmethod
+    async def _coalesce(key, make_coro):
+        """
+        Await the in-flight task computing key, or start it.
+        shield: a cancelled caller does not cancel the task the others are waiting on
+        """
+        loop = asyncio.get_running_loop()
+        task = AsyncAssembler._inflight.get((loop, key))
+        if task is None:
+            task = loop.create_task(make_coro())
+            AsyncAssembler._inflight[(loop, key)] = task
+            task.add_done_callback(lambda _: AsyncAssembler._inflight.pop((loop, key), None))
+        else:
+            Metrics.inc("query_coalesced_total", stage=key[0])
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _file_lock(rel_path):
+        key = (asyncio.get_running_loop(), rel_path)
+        lock = AsyncAssembler._file_locks.get(key)
+        if lock is None:
+            lock = AsyncAssembler._file_locks[key] = asyncio.Lock()
+        return lock
+
+
+if __name__ == "__main__":
+    async def main():
+        texts = ["智能体采取的动作"] * 50 + ["强化学习的历史"] * 50
+        start = time.perf_counter()
+        results = await AsyncAssembler.query_texts(texts, n_results=5)
+        print(f"{len(results)} queries in {(time.perf_counter() - start) * 1000:.0f}ms")
+        results[0][0].print()
+        await AsyncAssembler.aclose()
+    asyncio.run(main())
@@ -1,48 +1,128 @@
+import time
 from config import Config
-from abc import ABC, abstractmethod
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from abc import ABC
+from metrics import Metrics, get_logger
 
 ###########################################
 CHUNK_SIZE = Config.CHUNK_SIZE
 CHUNK_OVERLAP = Config.CHUNK_OVERLAP
+CHUNK_ENGINE = Config.CHUNK_ENGINE
+CHUNK_UNIT = Config.CHUNK_UNIT
 ###########################################
 
+logger = get_logger("chunker")
+
 class Chunker(ABC):
-    @abstractmethod
-    def chunk(self, text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
-        pass
+    markdown = False
+    # only used by the langchain engine
+    separators = []
 
-class TextChunker(Chunker):
-    @staticmethod
-    def chunk(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    @classmethod
+    def chunk(cls, text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+        return [chunk for chunk, _ in cls.iter_spans(text, chunk_size, chunk_overlap)]
+
+    @classmethod
+    def iter_spans(cls, text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP, engine=CHUNK_ENGINE):
+        """
+        Yields (chunk, attributes) lazily,
+        the native engine fills start_offset / end_offset (and heading_path for markdown)
+        """
+        if engine == "langchain":
+            for chunk in cls._langchain_split(text, chunk_size, chunk_overlap):
+                yield chunk, {}
+            return
+        from textSplitter import TextSplitter
+        splitter = TextSplitter(chunk_size, chunk_overlap, markdown=cls.markdown, token_starts=_token_starts())
+        yield from splitter.iter_spans(text)
+
+    @classmethod
+    def _langchain_split(cls, text, chunk_size, chunk_overlap):
+        # langchain is slow to import, only load it when something is chunked
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", ".", "。", ",", "，", " "]
+            separators=cls.separators
         )
-        chunks = text_splitter.split_text(text)
-        return chunks
+        return text_splitter.split_text(text)
+
+class TextChunker(Chunker):
+    separators = ["\n\n", "\n", ".", "。", ",", "，", " "]
     
 class MarkdownChunker(Chunker):
-    @staticmethod
-    def chunk(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=chunk_size,
-            chunk_overlap=chunk_overlap,
-            separators=["\n\n", "\n", "#", "##", "###", ".", "。", ",", "，", " "]
-        )
-        chunks = text_splitter.split_text(text)
-        return chunks
+    markdown = True
+    separators = ["\n\n", "\n", "#", "##", "###", ".", "。", ",", "，", " "]
+
+
+def _token_starts(unit=CHUNK_UNIT):
+    """
+    Token offsets function for CHUNK_UNIT, None when sizing in characters
+    """
+    if unit == "tokens":
+        from textSplitter import approx_token_starts
+        return approx_token_starts
+    if unit == "model":
+        from registry import ClientRegistry
+        from embedder import MODEL_SPEC, parse_model_spec
+        backend, model_id = parse_model_spec(MODEL_SPEC)
+        if backend == "hash":
+            from textSplitter import approx_token_starts
+            return approx_token_starts
+
+        def load():
+            from transformers import AutoTokenizer
+            tokenizer = AutoTokenizer.from_pretrained(model_id)
+
+            def token_starts(text):
+                encoded = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, verbose=False)
+                return [start for start, _ in encoded["offset_mapping"]]
+            return token_starts
+        return ClientRegistry.get(("tokenizer", model_id), load)
+    return None
     
 class ChunkerFactory:
     
     @staticmethod
     def chunk(data, file_extension):
         chunker = ChunkerFactory._get_chunker(file_extension)
-        chunks = chunker.chunk(data)
-        print(f"Total |{len(chunks)} chunks| created using {chunker.__name__}")
+        with Metrics.span("chunk", chunker=chunker.__name__):
+            chunks = chunker.chunk(data)
+        ChunkerFactory._count(chunker, len(chunks), sum(len(c) for c in chunks))
         return chunks
     
+    @staticmethod
+    def iter_chunks(segments, file_extension):
+        """
+        Chunk (text, attributes) segments as they arrive
+        yields (chunk, attributes), chunks never cross a segment (page) boundary
+        """
+        chunker = ChunkerFactory._get_chunker(file_extension)
+        count = chars = 0
+        # time spent splitting only: segments arrive from the loader, chunks leave to the embedder
+        busy = 0.0
+        for text, attributes in segments:
+            if not text.strip():
+                continue
+            spans = chunker.iter_spans(text)
+            while True:
+                start = time.perf_counter()
+                item = next(spans, None)
+                busy += time.perf_counter() - start
+                if item is None:
+                    break
+                chunk, span = item
+                count += 1
+                chars += len(chunk)
+                yield chunk, {**attributes, **span}
+        Metrics.observe("chunk_seconds", busy, chunker=chunker.__name__)
+        ChunkerFactory._count(chunker, count, chars)
+    
+    @staticmethod
+    def _count(chunker, count, chars):
+        Metrics.inc("chunks_total", count, chunker=chunker.__name__)
+        Metrics.inc("chunk_chars_total", chars, chunker=chunker.__name__)
+        logger.debug("Total |%d chunks| created using %s", count, chunker.__name__)
+    
     @staticmethod
     def _get_chunker(file_extension):
         if file_extension in [".txt"]:
@@ -0,0 +1,219 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from config import Config
+from embeddingCache import EmbeddingCache
+
+###########################################
+# Near-duplicate detection at ingest
+# every stored chunk gets a signature:
+#   exact    sha256 of the normalized text
+#   simhash  64-bit SimHash of character shingles (texts of DEDUP_MIN_CHARS or more)
+# a new chunk whose exact hash, or whose simhash within DEDUP_MAX_HAMMING bits,
+# matches a stored record of another file is not embedded / stored again:
+# the manifest links it to that canonical record (see Assembler._commit_file);
+# reads scoped to a file (query_file, file_path filters, BM25) find its linked
+# chunks through the manifest (Assembler._linked_records), with the canonical
+# record's text and vector: for near links ("near" mode, opt-in) not quite the file's own text.
+# near lookups use 4 indexed 16-bit bands of the simhash: two simhashes at most
+# 3 bits apart share at least one band.
+DEDUP_INDEX_PATH = Config.DEDUP_INDEX_PATH
+MAX_HAMMING = Config.DEDUP_MAX_HAMMING
+MIN_CHARS = Config.DEDUP_MIN_CHARS
+SHINGLE = Config.DEDUP_SHINGLE
+###########################################
+
+_MASK = (1 << 64) - 1
+_BANDS = 4
+
+
+def signature(text, near=True):
+    """
+    (exact hash, simhash or None) of a chunk
+    """
+    normalized = EmbeddingCache.normalize(text).lower()
+    exact = hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+    return exact, simhash(normalized) if near and len(normalized) >= MIN_CHARS else None
+
+
+def simhash(text, shingle=SHINGLE):
+    """
+    64-bit SimHash of the character shingles of text (as an unsigned int)
+    """
+    codes = np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32).astype(np.uint64)
+    n = len(codes) - shingle + 1
+    if n <= 0:
+        return 0
+    h = np.zeros(n, dtype=np.uint64)
+    for i in range(shingle):
+        h = h * np.uint64(1000003) + codes[i:i + n]
+    # splitmix64 finalizer: every input bit flips about half of the output bits
+    h ^= h >> np.uint64(30)
+    h *= np.uint64(0xBF58476D1CE4E5B9)
+    h ^= h >> np.uint64(27)
+    h *= np.uint64(0x94D049BB133111EB)
+    h ^= h >> np.uint64(31)
+    bits = np.unpackbits(h.astype("<u8").view(np.uint8).reshape(n, 8), axis=1, bitorder="little")
+    majority = bits.sum(axis=0, dtype=np.int64) * 2 > n
+    return int(np.packbits(majority, bitorder="little").view("<u8")[0])
+
+
+def hamming(a, b):
+    return bin((a ^ b) & _MASK).count("1")
+
+
+def _signed(value):
+    # sqlite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _bands(value):
+    return [(value >> (16 * i)) & 0xFFFF for i in range(_BANDS)]
+
+
+class DedupIndex:
+    def __init__(self, path=DEDUP_INDEX_PATH, max_hamming=MAX_HAMMING):
+        """
+        Open (or create) the signature index, ":memory:" for a throwaway one
+        """
+        path = str(path)
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_hamming = max_hamming
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS signatures (
+                record_id TEXT PRIMARY KEY,
+                file_path TEXT NOT NULL,
+                exact_hash TEXT NOT NULL,
+                simhash INTEGER,
+                band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_sig_exact ON signatures(exact_hash);
+            CREATE INDEX IF NOT EXISTS idx_sig_file ON signatures(file_path);
+            CREATE INDEX IF NOT EXISTS idx_sig_band0 ON signatures(band0);
+            CREATE INDEX IF NOT EXISTS idx_sig_band1 ON signatures(band1);
+            CREATE INDEX IF NOT EXISTS idx_sig_band2 ON signatures(band2);
+            CREATE INDEX IF NOT EXISTS idx_sig_band3 ON signatures(band3);
+            """
+        )
+        self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM signatures").fetchone()[0]
+
+    def match(self, sig, exclude_file=None, only_file=None):
+        """
+        Canonical record for a chunk signature, records of exclude_file left out
+        (only_file: among the records of that file only)
+        Returns:
+            (record_id, "exact" | "near") or None
+        """
+        exact, sim = sig
+        query = "SELECT record_id, exact_hash, simhash FROM signatures WHERE (exact_hash = ?"
+        params = [exact]
+        if sim is not None:
+            query += "".join(f" OR band{i} = ?" for i in range(_BANDS))
+            params += _bands(sim)
+        query += ")"
+        if exclude_file is not None:
+            query += " AND file_path != ?"
+            params.append(exclude_file)
+        if only_file is not None:
+            # "+": looked up by hash, not through the file index (every row of a big file)
+            query += " AND +file_path = ?"
+            params.append(only_file)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        best, best_distance = None, self.max_hamming + 1
+        for record_id, row_exact, row_sim in rows:
+            if row_exact == exact:
+                return record_id, "exact"
+            if sim is not None and row_sim is not None:
+                distance = hamming(sim, row_sim)
+                if distance < best_distance:
+                    best, best_distance = record_id, distance
+        return (best, "near") if best is not None else None
+
+    def add(self, entries):
+        """
+        entries: iterable of (record_id, file_path, (exact hash, simhash or None))
+        """
+        rows = []
+        for record_id, file_path, (exact, sim) in entries:
+            bands = _bands(sim) if sim is not None else [None] * _BANDS
+            rows.append((record_id, file_path, exact, None if sim is None else _signed(sim), *bands))
+        if not rows:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO signatures "
+                "(record_id, file_path, exact_hash, simhash, band0, band1, band2, band3) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+
+    def remove(self, record_ids):
+        rows = [(record_id,) for record_id in record_ids]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM signatures WHERE record_id = ?", rows)
+
+    def remove_files(self, file_paths):
+        rows = [(file_path,) for file_path in file_paths]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM signatures WHERE file_path = ?", rows)
+
+    def reassign(self, old_id, new_id, file_path):
+        """
+        The canonical record moved to another file (its owner file was deleted / changed)
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE OR REPLACE signatures SET record_id = ?, file_path = ? WHERE record_id = ?",
+                (new_id, file_path, old_id)
+            )
+
+    def confirm(self, links):
+        """
+        links: list of (record_id, signature) that match() found earlier
+        Returns:
+            one bool per link: the record is still in the index and still a duplicate of the signature
+        """
+        record_ids, stored = list({record_id for record_id, _ in links}), {}
+        with self._lock:
+            for start in range(0, len(record_ids), 500):
+                batch = record_ids[start:start + 500]
+                for record_id, exact, sim in self._conn.execute(
+                    "SELECT record_id, exact_hash, simhash FROM signatures "
+                    f"WHERE record_id IN ({','.join('?' * len(batch))})", batch
+                ):
+                    stored[record_id] = (exact, None if sim is None else sim & _MASK)
+        confirmed = []
+        for record_id, (exact, sim) in links:
+            row = stored.get(record_id)
+            confirmed.append(row is not None and (row[0] == exact or (
+                sim is not None and row[1] is not None and hamming(sim, row[1]) <= self.max_hamming)))
+        return confirmed
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM signatures")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    a = "强化学习是机器学习的一个领域，强调如何基于环境而行动，以取得最大化的预期利益。" * 3
+    b = a.replace("预期利益", "预期收益", 1)
+    index = DedupIndex(":memory:")
+    index.add([("r1", "a.md", signature(a))])
+    print(hamming(simhash(a), simhash(b)), index.match(signature(b)), index.match(signature(a)))
@@ -1,43 +1,555 @@
+import time
+import random
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 from config import Config
-from huggingface_hub import InferenceClient
-from tqdm import tqdm
+from registry import (ClientRegistry, get_embedding_cache, get_inference_client, get_async_inference_client,
+                      get_embed_limiter, run_blocking)
+from metrics import Metrics, get_logger
+
+
+def parse_model_spec(spec):
+    """
+    Config.EMBEDDING_MODEL picks the backend with an optional prefix:
+        "BAAI/bge-m3" or "hf:BAAI/bge-m3"  -> HuggingFace Inference API
+        "local:BAAI/bge-m3"                -> in-process model on CPU
+        "hash:256"                         -> deterministic hashing model (offline tests)
+    Returns (backend, model_name)
+    """
+    backend, sep, name = spec.partition(":")
+    if sep and backend in ("hf", "local", "hash"):
+        return backend, name
+    return "hf", spec
+
 ###########################################
 HF_TOKEN = Config.HF_TOKEN
-MODEL_ID = Config.EMBEDDING_MODEL
+MODEL_SPEC = Config.EMBEDDING_MODEL
+BACKEND, MODEL_ID = parse_model_spec(MODEL_SPEC)
+BATCH_SIZE = Config.EMBED_BATCH_SIZE
+MAX_BATCH_CHARS = Config.EMBED_MAX_BATCH_CHARS
+MAX_WORKERS = Config.EMBED_MAX_WORKERS
+MAX_RETRIES = Config.EMBED_MAX_RETRIES
+BACKOFF = Config.EMBED_BACKOFF
+CACHE_ENABLED = Config.EMBED_CACHE_ENABLED
+LOCAL_RUNTIME = Config.LOCAL_EMBED_RUNTIME
+LOCAL_QUANTIZE = Config.LOCAL_EMBED_QUANTIZE
+LOCAL_MAX_LENGTH = Config.LOCAL_EMBED_MAX_LENGTH
+LOCAL_MAX_BATCH_TOKENS = Config.LOCAL_EMBED_MAX_BATCH_TOKENS
+LOCAL_POOLING = Config.LOCAL_EMBED_POOLING
+LOCAL_THREADS = Config.LOCAL_EMBED_THREADS
 ###########################################
 
+logger = get_logger("embedder")
+
+
+def _show_progress():
+    # progress bars follow the log level: none in quiet (WARNING+) runs
+    return logger.isEnabledFor(logging.INFO)
+
+
+class Embedder(ABC):
+    """
+    Base class of all embedding backends.
+    Every backend goes through the shared on-disk cache, only misses reach the model.
+    Vectors are 1-D float32 NumPy arrays, None for a text that failed to embed.
+    embed(..., stats={}) fills the dict with the cache {'hits', 'misses'} of that call.
+    """
+
+    @abstractmethod
+    def embed(self, data, model_id=MODEL_ID, cache=None, stats=None):
+        pass
+
+    @staticmethod
+    def get_cache():
+        """
+        Shared on-disk cache, opened on first use (one per process, see registry)
+        """
+        return get_embedding_cache()
+
+    @classmethod
+    async def aembed(cls, data, model_id=MODEL_ID, **kwargs):
+        """
+        Async embed. By default the blocking embed runs in the async executor (registry)
+        (CPU-bound local / hash models); network backends override it with a real async client.
+        """
+        return await run_blocking(cls.embed, data, model_id=model_id, **kwargs)
+
+    @classmethod
+    def _embed_cached(cls, data, cache_key, cache, embed_fn, stats=None):
+        """
+        Look data up in the cache and call embed_fn(list_of_texts) for the misses only.
+        cache_key: model identity used in the cache key
+        cache: EmbeddingCache to use, None for the default one (if enabled), False to skip
+        stats: dict updated with the hit / miss counts of this call
+        """
+        if not data:
+            return []
+        cache, embeddings, missing, counts = cls._cache_lookup(data, cache_key, cache)
+        if stats is not None:
+            stats.update(counts)
+        if not cache:
+            with Metrics.span("embed", attrs={"texts": len(data)}, backend=cls.__name__):
+                return embed_fn(data)
+        if missing:
+            with Metrics.span("embed", attrs={"texts": len(missing)}, backend=cls.__name__):
+                vectors = embed_fn(missing)
+            embeddings = cls._cache_fill(data, cache_key, cache, embeddings, missing, vectors)
+        return embeddings
+
+    @classmethod
+    async def _aembed_cached(cls, data, cache_key, cache, aembed_fn, stats=None):
+        """
+        _embed_cached for an async aembed_fn, the sqlite cache is read / written in the async executor
+        """
+        if not data:
+            return []
+        cache, embeddings, missing, counts = await run_blocking(cls._cache_lookup, data, cache_key, cache)
+        if stats is not None:
+            stats.update(counts)
+        if not cache:
+            with Metrics.span("embed", attrs={"texts": len(data)}, backend=cls.__name__):
+                return await aembed_fn(data)
+        if missing:
+            with Metrics.span("embed", attrs={"texts": len(missing)}, backend=cls.__name__):
+                vectors = await aembed_fn(missing)
+            embeddings = await run_blocking(cls._cache_fill, data, cache_key, cache, embeddings, missing, vectors)
+        return embeddings
+
+    @classmethod
+    def _cache_lookup(cls, data, cache_key, cache):
+        """
+        Returns (cache or False, cached vectors with None for misses, distinct missing texts,
+                 {'hits', 'misses'})
+        """
+        Metrics.inc("embed_texts_total", len(data), backend=cls.__name__)
+        if cache is None:
+            cache = Embedder.get_cache() if CACHE_ENABLED else False
+        if not cache:
+            return False, [None] * len(data), list(data), {"hits": 0, "misses": len(data)}
+
+        embeddings = cache.get_many(cache_key, data)
+        # only send each distinct missing text once
+        missing = list(dict.fromkeys(data[i] for i, e in enumerate(embeddings) if e is None))
+        hits = len(data) - sum(1 for e in embeddings if e is None)
+        Metrics.inc("embed_cache_hits_total", hits, backend=cls.__name__)
+        Metrics.inc("embed_cache_misses_total", len(data) - hits, backend=cls.__name__)
+        logger.debug("Embedding cache: %d hits, %d misses", hits, len(data) - hits)
+        return cache, embeddings, missing, {"hits": hits, "misses": len(data) - hits}
+
+    @staticmethod
+    def _cache_fill(data, cache_key, cache, embeddings, missing, vectors):
+        """
+        Store the fresh vectors and put them in the slots of the misses
+        """
+        cache.put_many(cache_key, missing, vectors)
+        fresh = dict(zip(missing, vectors))
+        return [e if e is not None else fresh[data[i]] for i, e in enumerate(embeddings)]
+
+
 # Embedding via HuggingFace Inference API
-class HuggingFaceEmbedder:
+class HuggingFaceEmbedder(Embedder):
     @staticmethod
-    def embed(data, model_id=MODEL_ID, hf_token=HF_TOKEN):
+    def embed(data, model_id=MODEL_ID, hf_token=HF_TOKEN, client=None, cache=None, stats=None,
+              batch_size=BATCH_SIZE, max_batch_chars=MAX_BATCH_CHARS,
+              max_workers=MAX_WORKERS, max_retries=MAX_RETRIES, backoff=BACKOFF):
         """
         Embed chunks to vectors using HuggingFace Inference API
         data: list of text chunks
+        client: anything with a `feature_extraction(list_of_texts)` method,
+                defaults to the shared InferenceClient of model_id (pass a stub for local testing)
+        cache: EmbeddingCache to use, None for the default one (if enabled), False to skip
+        stats: dict filled with the cache {'hits', 'misses'} of this call
+        Returns:
+            list of vectors in the same order as data,
+            a chunk that still fails after all retries gets None in its slot
+        """
+        return HuggingFaceEmbedder._embed_cached(
+            data, model_id, cache,
+            lambda texts: HuggingFaceEmbedder._embed_remote(
+                texts, model_id, hf_token, client,
+                batch_size, max_batch_chars, max_workers, max_retries, backoff
+            ), stats
+        )
+
+    @staticmethod
+    async def aembed(data, model_id=MODEL_ID, hf_token=HF_TOKEN, client=None, cache=None, stats=None,
+                     batch_size=BATCH_SIZE, max_batch_chars=MAX_BATCH_CHARS,
+                     max_workers=MAX_WORKERS, max_retries=MAX_RETRIES, backoff=BACKOFF):
+        """
+        Async embed: batches are awaited concurrently on the event loop's AsyncInferenceClient,
+        no thread is held while waiting. At most max_workers requests run at a time
+        over all the aembed calls of the loop (one shared limiter)
+        client: anything with an async `feature_extraction(list_of_texts)` method
+        """
+        return await HuggingFaceEmbedder._aembed_cached(
+            data, model_id, cache,
+            lambda texts: HuggingFaceEmbedder._aembed_remote(
+                texts, model_id, hf_token, client,
+                batch_size, max_batch_chars, max_workers, max_retries, backoff
+            ), stats
+        )
+
+    @staticmethod
+    def _embed_remote(data, model_id, hf_token, client,
+                      batch_size, max_batch_chars, max_workers, max_retries, backoff):
+        """
+        Send data to the model in concurrent batches, results keep the input order
+        """
+        if client is None:
+            client = get_inference_client(model_id, hf_token)
+
+        from tqdm import tqdm
+        embeddings = [None] * len(data)
+        batches = HuggingFaceEmbedder._make_batches(data, batch_size, max_batch_chars)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = {
+                executor.submit(HuggingFaceEmbedder._embed_batch, client, batch, max_retries, backoff): start
+                for start, batch in batches
+            }
+            with tqdm(total=len(data), desc="Embedding chunks", disable=not _show_progress()) as pbar:
+                for future in as_completed(futures):
+                    start = futures[future]
+                    vectors = future.result()
+                    embeddings[start:start + len(vectors)] = vectors
+                    pbar.update(len(vectors))
+
+        failed = sum(1 for e in embeddings if e is None)
+        if failed:
+            Metrics.inc("embed_failed_total", failed, backend="HuggingFaceEmbedder")
+            logger.error("Failed to embed %d/%d chunks after retries", failed, len(data))
+        return embeddings
+
+    @staticmethod
+    async def _aembed_remote(data, model_id, hf_token, client,
+                             batch_size, max_batch_chars, max_workers, max_retries, backoff):
+        import asyncio
+        if client is None:
+            client = get_async_inference_client(model_id, hf_token)
+        embeddings = [None] * len(data)
+        limit = get_embed_limiter(max_workers)
+
+        async def run(start, batch):
+            async with limit:
+                vectors = await HuggingFaceEmbedder._aembed_batch(client, batch, max_retries, backoff)
+            embeddings[start:start + len(vectors)] = vectors
+
+        await asyncio.gather(*(run(start, batch) for start, batch in
+                               HuggingFaceEmbedder._make_batches(data, batch_size, max_batch_chars)))
+        failed = sum(1 for e in embeddings if e is None)
+        if failed:
+            Metrics.inc("embed_failed_total", failed, backend="HuggingFaceEmbedder")
+            logger.error("Failed to embed %d/%d chunks after retries", failed, len(data))
+        return embeddings
+
+    @staticmethod
+    def _make_batches(data, batch_size, max_batch_chars):
+        """
+        Pack chunks into batches capped by count and by total characters.
+        Returns a list of (start_index, batch) so results can be put back in order.
+        A single chunk longer than max_batch_chars still gets its own batch.
+        """
+        batches = []
+        start, batch, chars = 0, [], 0
+        for idx, chunk in enumerate(data):
+            if batch and (len(batch) >= batch_size or chars + len(chunk) > max_batch_chars):
+                batches.append((start, batch))
+                start, batch, chars = idx, [], 0
+            batch.append(chunk)
+            chars += len(chunk)
+        if batch:
+            batches.append((start, batch))
+        return batches
+
+    @staticmethod
+    def _embed_batch(client, batch, max_retries, backoff):
+        """
+        Embed one batch with retry and exponential backoff.
+        If the whole batch keeps failing, fall back to one request per chunk
+        so a single bad chunk does not lose the rest of the batch.
+        """
+        vectors = HuggingFaceEmbedder._request_with_retry(client, batch, max_retries, backoff)
+        if vectors is not None:
+            return vectors
+        if len(batch) == 1:
+            logger.warning("Failed to embed chunk after retries: %s...", batch[0][:30])
+            return [None]
+
+        results = []
+        for chunk in batch:
+            results.extend(HuggingFaceEmbedder._embed_batch(client, [chunk], max_retries, backoff))
+        return results
+
+    @staticmethod
+    def _request_with_retry(client, batch, max_retries, backoff):
+        for attempt in range(max_retries + 1):
+            if attempt:
+                Metrics.inc("embed_retries_total", backend="HuggingFaceEmbedder")
+            Metrics.inc("embed_requests_total", backend="HuggingFaceEmbedder")
+            start = time.perf_counter()
+            try:
+                result = client.feature_extraction(batch)
+                Metrics.observe("embed_request_seconds", time.perf_counter() - start, backend="HuggingFaceEmbedder")
+                if result is not None and len(result) == len(batch):
+                    return [HuggingFaceEmbedder._to_vector(v) for v in result]
+                logger.warning("Unexpected embedding response for batch of %d", len(batch))
+            except Exception as e:
+                logger.warning("Embedding request failed (attempt %d/%d): %s", attempt + 1, max_retries + 1, e)
+            Metrics.inc("embed_request_errors_total", backend="HuggingFaceEmbedder")
+            if attempt < max_retries:
+                time.sleep(backoff * (2 ** attempt) * (1 + random.random() * 0.1))
+        return None
+
+    @staticmethod
+    async def _aembed_batch(client, batch, max_retries, backoff):
+        """
+        Async _embed_batch: retry with backoff, then one request per chunk
+        """
+        vectors = await HuggingFaceEmbedder._arequest_with_retry(client, batch, max_retries, backoff)
+        if vectors is not None:
+            return vectors
+        if len(batch) == 1:
+            logger.warning("Failed to embed chunk after retries: %s...", batch[0][:30])
+            return [None]
+        results = []
+        for chunk in batch:
+            results.extend(await HuggingFaceEmbedder._aembed_batch(client, [chunk], max_retries, backoff))
+        return results
+
+    @staticmethod
+    async def _arequest_with_retry(client, batch, max_retries, backoff):
+        import asyncio
+        for attempt in range(max_retries + 1):
+            if attempt:
+                Metrics.inc("embed_retries_total", backend="HuggingFaceEmbedder")
+            Metrics.inc("embed_requests_total", backend="HuggingFaceEmbedder")
+            start = time.perf_counter()
+            try:
+                result = await client.feature_extraction(batch)
+                Metrics.observe("embed_request_seconds", time.perf_counter() - start, backend="HuggingFaceEmbedder")
+                if result is not None and len(result) == len(batch):
+                    return [HuggingFaceEmbedder._to_vector(v) for v in result]
+                logger.warning("Unexpected embedding response for batch of %d", len(batch))
+            except Exception as e:
+                logger.warning("Embedding request failed (attempt %d/%d): %s", attempt + 1, max_retries + 1, e)
+            Metrics.inc("embed_request_errors_total", backend="HuggingFaceEmbedder")
+            if attempt < max_retries:
+                await asyncio.sleep(backoff * (2 ** attempt) * (1 + random.random() * 0.1))
+        return None
+
+    @staticmethod
+    def _to_vector(vector):
+        # InferenceClient returns a float32 array per batch (rows are views), other clients lists
+        return np.asarray(vector, dtype=np.float32)
+
+
+
+# Embedding with a model running in this process (CPU)
+class LocalEmbedder(Embedder):
+    @staticmethod
+    def embed(data, model_id=MODEL_ID, cache=None, stats=None, runtime=LOCAL_RUNTIME, quantize=LOCAL_QUANTIZE,
+              max_length=LOCAL_MAX_LENGTH, max_batch_tokens=LOCAL_MAX_BATCH_TOKENS):
         """
-        embeddings = []
-        client = InferenceClient(model=model_id, token=hf_token)
-        
-        for chunk in tqdm(data, desc="Embedding chunks"):
-            embedding = client.feature_extraction([chunk])
-            if embedding is not None:
-                embeddings.append(embedding[0])  # Assuming the first item is the embedding vector
-            else:
-                # retry 3 times
-                retry_count = 0
-                while retry_count < 3:
-                    embedding = HuggingFaceEmbedder._embed_single([chunk], model_id, hf_token)
-                    if embedding is not None:
-                        embeddings.append(embedding[0])
-                        break
-                    retry_count += 1
-                print(f"Failed to embed chunk after retries: {chunk[:30]}...")
-                return None
+        Embed chunks with a local transformers model (e.g. BAAI/bge-m3)
+        runtime: "torch" or "onnx" (model exported once and cached under CACHE_DIR)
+        quantize: int8 dynamic quantization of the linear layers
+        Returns:
+            list of L2-normalized float32 vectors in the same order as data
+        """
+        cache_key = f"local:{model_id}"
+        return LocalEmbedder._embed_cached(
+            data, cache_key, cache,
+            lambda texts: LocalEmbedder._embed_local(
+                texts, model_id, runtime, quantize, max_length, max_batch_tokens
+            ), stats
+        )
+
+    @staticmethod
+    def _embed_local(data, model_id, runtime, quantize, max_length, max_batch_tokens):
+        from tqdm import tqdm
+        tokenizer, run_model = LocalEmbedder._get_model(model_id, runtime, quantize)
+        encoded = tokenizer(list(data), truncation=True, max_length=max_length)["input_ids"]
+
+        embeddings = [None] * len(data)
+        buckets = LocalEmbedder._make_buckets(encoded, max_batch_tokens)
+        for batch in tqdm(buckets, desc="Embedding chunks", disable=not _show_progress()):
+            padded = tokenizer.pad({"input_ids": [encoded[i] for i in batch]}, return_tensors="np")
+            start = time.perf_counter()
+            hidden = run_model(padded["input_ids"].astype(np.int64), padded["attention_mask"].astype(np.int64))
+            Metrics.observe("embed_request_seconds", time.perf_counter() - start, backend="LocalEmbedder")
+            Metrics.inc("embed_requests_total", backend="LocalEmbedder")
+            vectors = LocalEmbedder._pool(hidden, padded["attention_mask"])
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = vector
         return embeddings
 
     @staticmethod
-    def _embed_single(data, model_id, hf_token):
-        client = InferenceClient(model=model_id, token=hf_token)
-        return client.feature_extraction(data)
+    def _make_buckets(encoded, max_batch_tokens):
+        """
+        Dynamic batching: sort by token length so texts of similar length share a batch
+        (little padding), and grow each batch while batch_size * longest <= max_batch_tokens.
+        Returns lists of indices into encoded.
+        """
+        order = sorted(range(len(encoded)), key=lambda i: len(encoded[i]))
+        buckets, bucket = [], []
+        for i in order:
+            # sorted ascending, so the current text is the longest in the bucket
+            if bucket and (len(bucket) + 1) * len(encoded[i]) > max_batch_tokens:
+                buckets.append(bucket)
+                bucket = []
+            bucket.append(i)
+        if bucket:
+            buckets.append(bucket)
+        return buckets
+
+    @staticmethod
+    def _pool(hidden, attention_mask):
+        if LOCAL_POOLING == "mean":
+            mask = attention_mask[..., None].astype(np.float32)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        else:
+            # bge models use the [CLS] token
+            vectors = hidden[:, 0]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    @staticmethod
+    def _get_model(model_id, runtime, quantize):
+        """
+        Load (once per process) the tokenizer and a run_model(input_ids, attention_mask)
+        function returning the last hidden state as numpy
+        """
+        def load():
+            logger.info("Loading local embedding model %s (%s, int8=%s)", model_id, runtime, quantize)
+            if runtime == "onnx":
+                return LocalEmbedder._load_onnx(model_id, quantize)
+            return LocalEmbedder._load_torch(model_id, quantize)
+        return ClientRegistry.get(("local_model", model_id, runtime, quantize), load)
+
+    @staticmethod
+    def _load_torch(model_id, quantize):
+        import torch
+        from transformers import AutoTokenizer, AutoModel
+        if LOCAL_THREADS:
+            torch.set_num_threads(LOCAL_THREADS)
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model = AutoModel.from_pretrained(model_id).eval()
+        if quantize:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+        def run_model(input_ids, attention_mask):
+            with torch.inference_mode():
+                output = model(input_ids=torch.from_numpy(input_ids),
+                               attention_mask=torch.from_numpy(attention_mask))
+            return output[0].float().numpy()
+        return tokenizer, run_model
+
+    @staticmethod
+    def _load_onnx(model_id, quantize):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        tokenizer = AutoTokenizer.from_pretrained(model_id)
+        model_dir = Config.CACHE_DIR / "onnx" / model_id.replace("/", "--")
+        fp32_path = model_dir / "model.onnx"
+        int8_path = model_dir / "model.int8.onnx"
+        if not fp32_path.exists():
+            LocalEmbedder._export_onnx(model_id, tokenizer, fp32_path)
+        path = fp32_path
+        if quantize:
+            if not int8_path.exists():
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                quantize_dynamic(str(fp32_path), str(int8_path), weight_type=QuantType.QInt8)
+            path = int8_path
+
+        options = ort.SessionOptions()
+        if LOCAL_THREADS:
+            options.intra_op_num_threads = LOCAL_THREADS
+        session = ort.InferenceSession(str(path), options, providers=["CPUExecutionProvider"])
+
+        def run_model(input_ids, attention_mask):
+            return session.run(None, {"input_ids": input_ids, "attention_mask": attention_mask})[0]
+        return tokenizer, run_model
+
+    @staticmethod
+    def _export_onnx(model_id, tokenizer, path):
+        import torch
+        from transformers import AutoModel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        model = AutoModel.from_pretrained(model_id).eval()
+        sample = tokenizer(["export"], return_tensors="pt")
+        torch.onnx.export(
+            model,
+            (sample["input_ids"], sample["attention_mask"]),
+            str(path),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "last_hidden_state": {0: "batch", 1: "sequence"},
+            },
+            opset_version=17,
+        )
+        logger.info("Exported %s to %s", model_id, path)
+
+
+# Tiny deterministic model: hashed character n-grams -> fixed size vector
+# no download, no network, same text always gives the same vector. For tests/benchmarks.
+class HashingEmbedder(Embedder):
+    @staticmethod
+    def embed(data, model_id="256", cache=False, stats=None, ngram=3):
+        """
+        model_id: the vector size, e.g. "256" (from "hash:256")
+        cache: off by default, computing is cheaper than a lookup
+        """
+        dim = int(model_id or 256)
+        return HashingEmbedder._embed_cached(
+            data, f"hash:{dim}", cache,
+            lambda texts: [HashingEmbedder._embed_one(t, dim, ngram) for t in texts], stats
+        )
+
+    @staticmethod
+    def _embed_one(text, dim, ngram):
+        vector = np.zeros(dim, dtype=np.float32)
+        text = f" {text.lower()} "
+        for i in range(max(1, len(text) - ngram + 1)):
+            digest = hashlib.blake2b(text[i:i + ngram].encode("utf-8"), digest_size=8).digest()
+            h = int.from_bytes(digest, "little")
+            vector[h % dim] += 1.0 if (h >> 63) else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+class EmbedderFactory:
+    """
+    Pick the embedding backend from Config.EMBEDDING_MODEL (see parse_model_spec)
+    """
+    embedders = {
+        "hf": HuggingFaceEmbedder,
+        "local": LocalEmbedder,
+        "hash": HashingEmbedder,
+    }
+
+    @staticmethod
+    def embed(data, model=MODEL_SPEC, **kwargs):
+        embedder, model_id = EmbedderFactory.get_embedder(model)
+        return embedder.embed(data, model_id=model_id, **kwargs)
+
+    @staticmethod
+    async def aembed(data, model=MODEL_SPEC, **kwargs):
+        embedder, model_id = EmbedderFactory.get_embedder(model)
+        return await embedder.aembed(data, model_id=model_id, **kwargs)
+
+    @staticmethod
+    def get_embedder(model=MODEL_SPEC):
+        """
+        Returns (embedder class, model name without the backend prefix)
+        """
+        backend, model_id = parse_model_spec(model)
+        return EmbedderFactory.embedders[backend], model_id
 
 
 if __name__ == "__main__":
@@ -48,4 +560,4 @@ if __name__ == "__main__":
     data = DataLoaderFactory.load(file_path)
     _, ext = os.path.splitext(file_path)
     chunks = ChunkerFactory.chunk(data, ext)
-    embeddings = HuggingFaceEmbedder.embed(chunks)
\ No newline at end of file
+    embeddings = EmbedderFactory.embed(chunks)
@@ -0,0 +1,154 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import numpy as np
+from config import Config
+
+###########################################
+# Persistent embedding cache
+# key: sha256(model id + normalized chunk text) -> float32 vector
+CACHE_PATH = Config.EMBED_CACHE_PATH
+MAX_ENTRIES = Config.EMBED_CACHE_MAX_ENTRIES
+###########################################
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class EmbeddingCache:
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        """
+        Open (or create) the sqlite cache file.
+        max_entries: least recently used entries are evicted above this size
+        """
+        path = str(path)
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                dim INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings(last_access)")
+        self._conn.commit()
+        # entries, kept up to date by put_many instead of a COUNT(*) per write
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def normalize(text):
+        # same text with different unicode forms / whitespace should share one entry
+        return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+    @staticmethod
+    def make_key(model_id, text):
+        normalized = EmbeddingCache.normalize(text)
+        return hashlib.sha256(f"{model_id}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model_id, texts):
+        """
+        Look up vectors for texts.
+        Returns a list aligned with texts: float32 arrays (read-only), None where the cache misses.
+        """
+        keys = [self.make_key(model_id, t) for t in texts]
+        found = {}
+        with self._lock:
+            unique_keys = list(set(keys))
+            # stay below sqlite's bound parameter limit
+            for i in range(0, len(unique_keys), 500):
+                part = unique_keys[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE key = ?",
+                    [(now, k) for k in found]
+                )
+                self._conn.commit()
+        return [found.get(k) for k in keys]
+
+    def put_many(self, model_id, texts, vectors):
+        """
+        Store vectors for texts, None vectors are ignored.
+        """
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            if vector is None:
+                continue
+            arr = np.asarray(vector, dtype=np.float32)
+            rows.append((self.make_key(model_id, text), model_id, arr.shape[-1], arr.tobytes(), now))
+        if not rows:
+            return
+        keys = list(dict.fromkeys(row[0] for row in rows))
+        with self._lock:
+            existing = 0
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                existing += self._conn.execute(
+                    f"SELECT COUNT(*) FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchone()[0]
+            self._count += len(keys) - existing
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, dim, vector, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        Drop least recently used entries once over max_entries.
+        We evict down to 90% so we don't run this on every insert.
+        """
+        if not self.max_entries or self._count <= self.max_entries:
+            return
+        # other processes may share the file, count exactly before evicting
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if self._count <= self.max_entries:
+            return
+        to_remove = self._count - int(self.max_entries * 0.9)
+        cursor = self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_access ASC LIMIT ?)",
+            (to_remove,)
+        )
+        self._count -= cursor.rowcount
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._count = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    cache = EmbeddingCache(":memory:", max_entries=10)
+    cache.put_many("test-model", ["hello  world", "foo"], [[0.1, 0.2], [0.3, 0.4]])
+    print(cache.get_many("test-model", ["hello world", "bar"]))
+    print("Entries:", cache.count())
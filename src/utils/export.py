@@ -0,0 +1,110 @@
+import os
+import json
+import shutil
+import numpy as np
+from metrics import get_logger
+
+###########################################
+# Streaming dump / restore of a collection
+#   <name>.jsonl  one {"id", "document", "metadata"} per line
+#   <name>.npy    float32 vectors, row i belongs to line i
+# both sides go page by page, memory stays flat whatever the collection size
+###########################################
+
+logger = get_logger("export")
+
+
+def vectors_path_for(jsonl_path):
+    return os.path.splitext(str(jsonl_path))[0] + ".npy"
+
+
+def export_collection(db, jsonl_path, where=None, include_vectors=True, page_size=1000):
+    """
+    Dump the collection (or the documents matching where) to jsonl_path,
+    and the vectors next to it as .npy if include_vectors
+    Returns:
+        {'documents': n, 'dim': vector size or None, 'jsonl': path, 'vectors': path or None}
+    """
+    jsonl_path = str(jsonl_path)
+    os.makedirs(os.path.dirname(os.path.abspath(jsonl_path)), exist_ok=True)
+    include = ["documents", "metadatas"] + (["embeddings"] if include_vectors else [])
+    vectors_path = vectors_path_for(jsonl_path) if include_vectors else None
+    # the row count is only known at the end: vectors go to a raw file first,
+    # the .npy header is written once we know the shape
+    raw_path = vectors_path + ".raw" if vectors_path else None
+    count, dim = 0, None
+
+    with open(jsonl_path + ".tmp", "w", encoding="utf-8") as out:
+        raw = open(raw_path, "wb") if raw_path else None
+        try:
+            for page in db.iter_pages(where=where, page_size=page_size, include=include):
+                for record_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                    out.write(json.dumps({"id": record_id, "document": document, "metadata": metadata},
+                                         ensure_ascii=False))
+                    out.write("\n")
+                if raw:
+                    vectors = np.asarray(page["embeddings"], dtype="<f4")
+                    dim = vectors.shape[1]
+                    raw.write(vectors.tobytes())
+                count += len(page["ids"])
+        finally:
+            if raw:
+                raw.close()
+
+    if raw_path:
+        with open(vectors_path + ".tmp", "wb") as f:
+            header = {"descr": "<f4", "fortran_order": False, "shape": (count, dim or 0)}
+            np.lib.format.write_array_header_1_0(f, header)
+            with open(raw_path, "rb") as raw:
+                shutil.copyfileobj(raw, f, 1 << 20)
+        os.remove(raw_path)
+        os.replace(vectors_path + ".tmp", vectors_path)
+    os.replace(jsonl_path + ".tmp", jsonl_path)
+
+    logger.info("Exported %d documents to %s", count, jsonl_path)
+    return {"documents": count, "dim": dim, "jsonl": jsonl_path, "vectors": vectors_path}
+
+
+def iter_export(jsonl_path, batch_size=1000):
+    """
+    Read an export back in batches (vectors are memory-mapped, not loaded)
+    Yields:
+        (ids, documents, metadatas, embeddings array or None)
+    """
+    vectors_path = vectors_path_for(jsonl_path)
+    vectors = np.load(vectors_path, mmap_mode="r") if os.path.exists(vectors_path) else None
+    ids, documents, metadatas, start = [], [], [], 0
+
+    def batch():
+        embeddings = None if vectors is None else np.array(vectors[start:start + len(ids)])
+        return ids, documents, metadatas, embeddings
+
+    with open(jsonl_path, encoding="utf-8") as f:
+        for line in f:
+            row = json.loads(line)
+            ids.append(row["id"])
+            documents.append(row["document"])
+            metadatas.append(row["metadata"])
+            if len(ids) >= batch_size:
+                yield batch()
+                start += len(ids)
+                ids, documents, metadatas = [], [], []
+    if ids:
+        yield batch()
+
+
+def import_collection(db, jsonl_path, batch_size=1000):
+    """
+    Upsert an export into db (same ids, so importing twice is harmless)
+    Returns:
+        number of documents written
+    """
+    count = 0
+    for ids, documents, metadatas, embeddings in iter_export(jsonl_path, batch_size):
+        if embeddings is None:
+            raise ValueError(f"No vectors next to {jsonl_path}, export with include_vectors=True")
+        if not db.add_documents(documents, embeddings, metadatas, ids):
+            raise RuntimeError(f"Failed to import batch at document {count}")
+        count += len(ids)
+    logger.info("Imported %d documents from %s", count, jsonl_path)
+    return count
@@ -0,0 +1,265 @@
+import os
+import re
+import math
+import sqlite3
+import threading
+from collections import Counter
+from config import Config
+
+###########################################
+# BM25 inverted index over chunk texts
+# kept next to the vector DB for exact-term matches the dense side misses
+# postings live in sqlite: a write only touches the rows of its documents,
+# a search only reads the postings of the query terms and is scored in SQL
+INDEX_PATH = Config.LEXICAL_INDEX_PATH
+K1 = Config.BM25_K1
+B = Config.BM25_B
+###########################################
+
+# latin words / numbers, and runs of CJK characters (Han, kana, hangul)
+_TOKEN_RE = re.compile(
+    r"[a-z0-9]+(?:['_\-.][a-z0-9]+)*"
+    r"|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+"
+)
+_CJK_RE = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]")
+
+
+def tokenize(text):
+    """
+    Latin words are lowercased as is, CJK runs become unigrams + bigrams
+    (no word segmenter needed, bigrams give back most of the precision)
+        "RAG的核心" -> ["rag", "的", "核", "心", "的核", "核心"]
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(text.lower()):
+        word = match.group()
+        if _CJK_RE.match(word):
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+        else:
+            tokens.append(word)
+    return tokens
+
+
+def match_where(meta, where):
+    """
+    Evaluate a chromadb style metadata filter against one metadata dict.
+    Supports equality, $eq/$ne/$in/$nin/$gt/$gte/$lt/$lte and $and/$or.
+    """
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(match_where(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match_where(meta, c) for c in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = meta.get(key)
+            for op, target in cond.items():
+                if op == "$eq" and value != target:
+                    return False
+                if op == "$ne" and value == target:
+                    return False
+                if op == "$in" and value not in target:
+                    return False
+                if op == "$nin" and value in target:
+                    return False
+                if op in ("$gt", "$gte", "$lt", "$lte"):
+                    if value is None:
+                        return False
+                    if op == "$gt" and not value > target:
+                        return False
+                    if op == "$gte" and not value >= target:
+                        return False
+                    if op == "$lt" and not value < target:
+                        return False
+                    if op == "$lte" and not value <= target:
+                        return False
+        elif meta.get(key) != cond:
+            return False
+    return True
+
+
+class LexicalIndex:
+    # metadata kept per document so `where` filters work on the sparse side too
+    META_KEYS = ("file_path", "source_name", "source_type", "chunk_index")
+
+    def __init__(self, path=INDEX_PATH, k1=K1, b=B):
+        """
+        Open (or create) the index, path None for a throwaway in-memory one
+        """
+        path = str(path) if path else ":memory:"
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        # postings are inserted in term order, not appended: keep more of the B-tree in memory
+        self._conn.execute("PRAGMA cache_size=-65536")
+        # documents are numbered, postings hold numbers not uuid strings
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS docs (
+                n INTEGER PRIMARY KEY,
+                record_id TEXT NOT NULL UNIQUE,
+                length INTEGER NOT NULL,
+                file_path TEXT,
+                source_name TEXT,
+                source_type TEXT,
+                chunk_index INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS idx_docs_file ON docs(file_path);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, n)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_doc ON postings(n);
+            """
+        )
+        self._conn.commit()
+        # document count and total length, kept up to date by every write
+        self._n_docs, self._total_length = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+        ).fetchone()
+
+    def __len__(self):
+        return self._n_docs
+
+    def add(self, ids, texts, metadatas):
+        """
+        Add (or replace) documents, written to disk by the next save()
+        """
+        with self._lock:
+            postings = []
+            # an id given twice: the last one wins, like two add() calls
+            documents = {record_id: (text, meta) for record_id, text, meta in zip(ids, texts, metadatas)}
+            for record_id, (text, meta) in documents.items():
+                self._remove(record_id)
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                n = self._conn.execute(
+                    f"INSERT INTO docs (record_id, length, {', '.join(self.META_KEYS)}) VALUES (?, ?, ?, ?, ?, ?)",
+                    [record_id, length] + [(meta or {}).get(key) for key in self.META_KEYS]
+                ).lastrowid
+                postings.extend((term, n, tf) for term, tf in counts.items())
+                self._n_docs += 1
+                self._total_length += length
+            self._conn.executemany("INSERT INTO postings (term, n, tf) VALUES (?, ?, ?)", postings)
+
+    def remove(self, ids):
+        with self._lock:
+            for record_id in ids:
+                self._remove(record_id)
+
+    def remove_file(self, file_path, from_chunk=0):
+        """
+        Remove documents of a file, only those with chunk_index >= from_chunk if given
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT record_id FROM docs WHERE file_path = ? AND COALESCE(chunk_index, 0) >= ?",
+                (file_path, from_chunk)
+            ).fetchall()
+            for (record_id,) in rows:
+                self._remove(record_id)
+
+    def _remove(self, record_id):
+        row = self._conn.execute("SELECT n, length FROM docs WHERE record_id = ?", (record_id,)).fetchone()
+        if row is None:
+            return
+        n, length = row
+        self._conn.execute("DELETE FROM postings WHERE n = ?", (n,))
+        self._conn.execute("DELETE FROM docs WHERE n = ?", (n,))
+        self._n_docs -= 1
+        self._total_length -= length
+
+    def search(self, query, n_results=5, where=None, ids=None):
+        """
+        BM25 search
+        ids: only score these records (where is not applied then)
+        Returns:
+            list of (record id, score), best first
+        """
+        terms = Counter(tokenize(query))
+        with self._lock:
+            if not self._n_docs or not terms:
+                return []
+            n_docs, avg_length = self._n_docs, self._total_length / self._n_docs
+            # query term weight: qtf * idf
+            weights = []
+            for term, qtf in terms.items():
+                df = self._conn.execute("SELECT COUNT(*) FROM postings WHERE term = ?", (term,)).fetchone()[0]
+                if df:
+                    weights.append((term, qtf * math.log(1 + (n_docs - df + 0.5) / (df + 0.5))))
+            if not weights:
+                return []
+            k1, b = self.k1, self.b
+            weight = "CASE p.term " + "WHEN ? THEN ? " * len(weights) + "END"
+            sql = (
+                f"SELECT d.record_id, SUM({weight} * p.tf * ? / (p.tf + ? * (1 - ? + ? * d.length / ?))) AS score, "
+                f"{', '.join('d.' + key for key in self.META_KEYS)} "
+                f"FROM postings p JOIN docs d ON d.n = p.n "
+                f"WHERE p.term IN ({','.join('?' * len(weights))}) GROUP BY p.n ORDER BY score DESC"
+            )
+            params = [value for pair in weights for value in pair] + [k1 + 1, k1, b, b, avg_length]
+            params += [term for term, _ in weights]
+            if ids is not None:
+                ids, results = list(ids), []
+                restricted = sql.replace(" GROUP BY", " AND d.record_id IN ({}) GROUP BY")
+                for start in range(0, len(ids), 500):
+                    batch = ids[start:start + 500]
+                    rows = self._conn.execute(restricted.format(",".join("?" * len(batch))), params + batch)
+                    results.extend((record_id, score) for record_id, score, *_ in rows)
+                return sorted(results, key=lambda hit: -hit[1])[:n_results]
+            if not where:
+                rows = self._conn.execute(sql + " LIMIT ?", params + [n_results]).fetchall()
+                return [(record_id, score) for record_id, score, *_ in rows]
+            # filtered: walk the ranking until n_results documents pass,
+            # only the rows read so far reach Python
+            results = []
+            for record_id, score, *values in self._conn.execute(sql, params):
+                meta = {key: value for key, value in zip(self.META_KEYS, values) if value is not None}
+                if match_where(meta, where):
+                    results.append((record_id, score))
+                    if len(results) >= n_results:
+                        break
+            return results
+
+    def rebuild(self, pages):
+        """
+        Rebuild from scratch, pages: iterable of chromadb get() results
+        with 'ids', 'documents' and 'metadatas'
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM postings")
+            self._conn.execute("DELETE FROM docs")
+            self._n_docs = self._total_length = 0
+            for page in pages:
+                self.add(page["ids"], page["documents"], page["metadatas"])
+
+    def save(self, force=False):
+        """
+        Commit the writes since the last save (only their rows, not the whole index)
+        """
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+
+
+if __name__ == "__main__":
+    print(tokenize("RAG的核心是检索, easy-rl chapter1.md"))
+    index = LexicalIndex(path=None)
+    index.add(["a", "b"], ["智能体采取的动作", "蜂医 is a medic"], [{"file_path": "x"}, {"file_path": "y"}])
+    print(index.search("动作"), index.search("蜂医"))
@@ -1,15 +1,34 @@
 import os
+import csv
+import json
+import math
+import datetime
 from config import Config
 from abc import ABC, abstractmethod
+from metrics import Metrics, get_logger
 ###########################################
 # Get Raw Data And Extract
+PDF_PARALLEL_MIN_PAGES = Config.PDF_PARALLEL_MIN_PAGES
+PDF_PAGES_PER_TASK = Config.PDF_PAGES_PER_TASK
+PDF_WORKERS = Config.PDF_WORKERS
+# tables (.csv / .xlsx) and records (.json / .jsonl) are read row by row, never as a whole:
+# every TABLE_ROWS_PER_CHUNK rows become one segment of "column: value" lines,
+# with row_number (+ sheet_name) and the scalar column values as chunk attributes
+TABLE_ROWS_PER_CHUNK = Config.TABLE_ROWS_PER_CHUNK
+TABLE_METADATA_COLUMNS = Config.TABLE_METADATA_COLUMNS
+TABLE_METADATA_MAX_CHARS = Config.TABLE_METADATA_MAX_CHARS
 ###########################################
 
+logger = get_logger("loader")
+
 class DataLoader(ABC):
     """
     Abstract Base Class for all data loaders.
     Defines the contract for loading raw data.
     """
+    # True: many small segments (rows), the file is never held as a whole.
+    # Ingestion keeps such files out of the process pool and writes their records as they are embedded.
+    streaming = False
     @abstractmethod
     def load_data(self):
         """Load raw data from the source."""
@@ -18,6 +37,13 @@ class DataLoader(ABC):
     def get_supported_extensions(self):
         """Return a list of supported file extensions."""
         pass
+    def iter_segments(self, file_path, parallel=True):
+        """
+        Yield the data as (text, attributes) segments, e.g. one per page,
+        attributes end up in ExtraAttributes of every chunk of the segment.
+        Default: the whole file as one segment.
+        """
+        yield self.load_data(file_path), {}
 
 class MarkDownDataLoader(DataLoader):
     def load_data(self, file_path):
@@ -27,32 +53,330 @@ class MarkDownDataLoader(DataLoader):
     def get_supported_extensions(self):
         return [".txt",'.md']
 
+def _extract_pdf_pages(file_path, start, end):
+    """
+    Runs in a worker process: text of pages [start, end)
+    """
+    from PyPDF2 import PdfReader
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or "" for i in range(start, end)]
+
 class PDFDataLoader(DataLoader):
     def load_data(self, file_path):
+        return "\n".join(text for text, _ in self.iter_segments(file_path))
+    def get_supported_extensions(self):
+        return [".pdf"]
+    def iter_segments(self, file_path, parallel=True):
+        """
+        Yield (page_text, {"page_number": n}) page by page (1-based), in order.
+        Big PDFs are split in page ranges extracted by a process pool,
+        pages are yielded as soon as their range is done.
+        """
         from PyPDF2 import PdfReader
         reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + "\n"
-        return text
+        n_pages = len(reader.pages)
+        if not parallel or PDF_WORKERS <= 1 or n_pages < PDF_PARALLEL_MIN_PAGES:
+            for i, page in enumerate(reader.pages):
+                yield page.extract_text() or "", {"page_number": i + 1}
+            return
+        
+        from concurrent.futures import ProcessPoolExecutor
+        ranges = [(start, min(start + PDF_PAGES_PER_TASK, n_pages))
+                  for start in range(0, n_pages, PDF_PAGES_PER_TASK)]
+        with ProcessPoolExecutor(max_workers=PDF_WORKERS) as pool:
+            futures = [pool.submit(_extract_pdf_pages, str(file_path), start, end) for start, end in ranges]
+            for (start, _), future in zip(ranges, futures):
+                for offset, text in enumerate(future.result()):
+                    yield text, {"page_number": start + offset + 1}
+
+# metadata keys of every chunk, a column with one of these names is stored as col_<name>
+RESERVED_KEYS = {"source_name", "source_type", "file_path", "url", "chunk_index", "page_number",
+                 "start_offset", "end_offset", "heading_path", "row_number", "rows", "sheet_name"}
+
+class TableDataLoader(DataLoader):
+    """
+    Base of the row-streaming loaders: iter_rows yields (row dict, attributes) one row at a time,
+    iter_segments groups them into TABLE_ROWS_PER_CHUNK-row segments.
+    """
+    streaming = True
+    def load_data(self, file_path):
+        return "\n\n".join(text for text, _ in self.iter_segments(file_path))
+    def iter_segments(self, file_path, parallel=True):
+        """
+        Yield ("column: value" lines, attributes) per row group; attributes hold
+        row_number (first row, 1-based), rows (when more than one), sheet_name (xlsx)
+        and the column values the rows of the group share
+        """
+        group, sheet = [], None
+        for row, attrs in self.iter_rows(file_path):
+            if group and (len(group) >= TABLE_ROWS_PER_CHUNK or attrs.get("sheet_name") != sheet):
+                yield _row_segment(group)
+                group = []
+            sheet = attrs.get("sheet_name")
+            group.append((row, attrs))
+        if group:
+            yield _row_segment(group)
+    @abstractmethod
+    def iter_rows(self, file_path):
+        """Yield (row dict, {"row_number": n, ...}), empty rows left out."""
+        pass
+
+class CSVDataLoader(TableDataLoader):
     def get_supported_extensions(self):
-        return [".pdf"]
+        return [".csv"]
+    def iter_rows(self, file_path):
+        """
+        First line is the header, row_number counts it (first data row = 2)
+        """
+        with open(file_path, "r", encoding="utf-8-sig", newline="") as file:
+            reader = csv.reader(file)
+            columns = None
+            for row_number, values in enumerate(reader, start=1):
+                if columns is None:
+                    columns = _column_names(values)
+                    continue
+                row = {name: _parse_csv_value(value) for name, value in zip(columns, values)}
+                if any(value is not None for value in row.values()):
+                    yield row, {"row_number": row_number}
+
+class ExcelDataLoader(TableDataLoader):
+    def get_supported_extensions(self):
+        return [".xlsx", ".xlsm"]
+    def iter_rows(self, file_path):
+        """
+        Every sheet, its first non-empty row is the header; read-only workbook, rows stream from the zip
+        """
+        from openpyxl import load_workbook
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            for sheet in workbook.worksheets:
+                columns = None
+                for row_number, values in enumerate(sheet.iter_rows(values_only=True), start=sheet.min_row or 1):
+                    if all(value is None or value == "" for value in values):
+                        continue
+                    if columns is None:
+                        columns = _column_names(values)
+                        continue
+                    row = {name: value for name, value in zip(columns, values) if value is not None and value != ""}
+                    yield row, {"sheet_name": sheet.title, "row_number": row_number}
+        finally:
+            workbook.close()
+
+class JSONDataLoader(TableDataLoader):
+    def get_supported_extensions(self):
+        return [".json"]
+    def iter_rows(self, file_path):
+        """
+        Top-level array: one row per element, decoded one at a time.
+        Top-level object (read whole): its first list is the rows, otherwise it is the only row
+        """
+        with open(file_path, "r", encoding="utf-8-sig") as file:
+            if _first_char(file) == "[":
+                file.seek(0)
+                items = _iter_json_array(file)
+            else:
+                file.seek(0)
+                data = json.load(file)
+                items = next((value for value in data.values() if isinstance(value, list)), [data]) \
+                    if isinstance(data, dict) else [data]
+            for row_number, item in enumerate(items, start=1):
+                row = item if isinstance(item, dict) else {"value": item}
+                if row:
+                    yield row, {"row_number": row_number}
+
+class JSONLinesDataLoader(TableDataLoader):
+    def get_supported_extensions(self):
+        return [".jsonl"]
+    def iter_rows(self, file_path):
+        """
+        One JSON value per line, row_number is the line number; broken lines are logged and skipped
+        """
+        with open(file_path, "r", encoding="utf-8-sig") as file:
+            for row_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    item = json.loads(line)
+                except ValueError as e:
+                    logger.warning("|%s| line %d skipped: %s", Config.get_relative_path(file_path), row_number, e)
+                    Metrics.inc("loader_bad_rows_total", type="jsonl")
+                    continue
+                row = item if isinstance(item, dict) else {"value": item}
+                if row:
+                    yield row, {"row_number": row_number}
+
+def _row_segment(group):
+    text = "\n\n".join(_row_text(row) for row, _ in group)
+    attrs = dict(group[0][1])
+    if len(group) > 1:
+        attrs["rows"] = len(group)
+    metadata = _row_metadata(group[0][0])
+    for row, _ in group[1:]:
+        other = _row_metadata(row)
+        metadata = {k: v for k, v in metadata.items() if other.get(k) == v}
+    return text, {**metadata, **attrs}
+
+def _row_text(row):
+    return "\n".join(f"{name}: {_text_value(value)}" for name, value in row.items()
+                     if value is not None and value != "")
+
+def _text_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+def _row_metadata(row):
+    """
+    Scalar column values as metadata: dates as ISO strings, long text cut,
+    nested values (json objects / arrays) only in the text
+    """
+    metadata = {}
+    for name, value in row.items():
+        if TABLE_METADATA_COLUMNS is not None and name not in TABLE_METADATA_COLUMNS:
+            continue
+        if isinstance(value, (datetime.date, datetime.time)):
+            value = value.isoformat()
+        elif isinstance(value, float) and value != value:
+            continue  # NaN
+        elif not isinstance(value, (str, int, float, bool)):
+            continue
+        if isinstance(value, str):
+            value = value[:TABLE_METADATA_MAX_CHARS]
+        metadata[f"col_{name}" if name in RESERVED_KEYS else name] = value
+    return metadata
+
+def _column_names(values):
+    """
+    Header cells as column names: blanks become column_<n>, repeated names get a _<n> suffix
+    """
+    names, seen = [], set()
+    for i, value in enumerate(values, start=1):
+        name = str(value).strip() if value is not None else ""
+        name = name or f"column_{i}"
+        base, n = name, 2
+        while name in seen:
+            name, n = f"{base}_{n}", n + 1
+        seen.add(name)
+        names.append(name)
+    return names
+
+def _parse_csv_value(value):
+    """
+    Numbers become int / float when that loses nothing ("007", "1.50", "nan" stay text), "" becomes None
+    """
+    if value == "":
+        return None
+    for kind in (int, float):
+        try:
+            parsed = kind(value)
+        except ValueError:
+            continue
+        return parsed if str(parsed) == value and math.isfinite(parsed) else value
+    return value
+
+def _first_char(file):
+    while True:
+        char = file.read(1)
+        if not char or not char.isspace():
+            return char
+
+def _iter_json_array(file, block_size=1 << 16):
+    """
+    Elements of the top-level JSON array in a text file, decoded one at a time:
+    memory holds one element plus one block, not the file
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos = "", 0
+    started = eof = need_more = False
+    while True:
+        while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ","):
+            pos += 1
+        if need_more or pos == len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of the JSON array")
+            block = file.read(block_size)
+            eof = not block
+            buffer, pos, need_more = buffer[pos:] + block, 0, False
+            continue
+        if not started:
+            if buffer[pos] != "[":
+                raise ValueError("Expected a JSON array")
+            started, pos = True, pos + 1
+            continue
+        if buffer[pos] == "]":
+            return
+        try:
+            value, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            need_more = True  # the element goes on in the next block
+            continue
+        after = end
+        while after < len(buffer) and buffer[after].isspace():
+            after += 1
+        if after == len(buffer) or buffer[after] not in ",]":
+            # a number like 1.5e3 cut after "1.5" decodes too: only trust an element once its delimiter is read
+            if eof:
+                raise ValueError("Malformed JSON array")
+            need_more = True
+            continue
+        yield value
+        pos = end
 
 class DataLoaderFactory:
     """
     Factory class to create appropriate DataLoader instances based on file extension.
     """
-    loaders = [MarkDownDataLoader(), PDFDataLoader()]
+    loaders = [MarkDownDataLoader(), PDFDataLoader(), CSVDataLoader(), ExcelDataLoader(),
+               JSONDataLoader(), JSONLinesDataLoader()]
     DATA_DIR = Config.DATA_DIR
     
     @staticmethod
     def load(file_path):
         _, ext = os.path.splitext(file_path)
         loader = DataLoaderFactory._get_loader(ext)
-        data = loader.load_data(file_path)
-        print(f"|{Config.get_relative_path(file_path)}| Data loaded using {loader.__class__.__name__}")
+        rel_path = Config.get_relative_path(file_path)
+        with Metrics.span("load", attrs={"file": rel_path}, type=ext.lstrip(".")):
+            data = loader.load_data(file_path)
+        DataLoaderFactory._count(file_path, ext)
+        logger.info("|%s| Data loaded using %s", rel_path, loader.__class__.__name__)
         return data
     
+    @staticmethod
+    def iter_load(file_path, parallel=True):
+        """
+        Streaming version of load: yields (text, attributes) segments
+        parallel: allow the loader to use a process pool (off inside pool workers)
+        """
+        _, ext = os.path.splitext(file_path)
+        loader = DataLoaderFactory._get_loader(ext)
+        rel_path = Config.get_relative_path(file_path)
+        # only the time spent reading counts, not the time the chunker holds a segment
+        yield from Metrics.timed_iter(loader.iter_segments(file_path, parallel=parallel),
+                                      "load", attrs={"file": rel_path}, type=ext.lstrip("."))
+        DataLoaderFactory._count(file_path, ext)
+        logger.info("|%s| Data loaded using %s", rel_path, loader.__class__.__name__)
+    
+    @staticmethod
+    def streams(file_path):
+        """
+        True if the file's loader yields it row by row (see DataLoader.streaming)
+        """
+        return DataLoaderFactory._get_loader(os.path.splitext(file_path)[1]).streaming
+    
+    @staticmethod
+    def supported_extensions():
+        extensions = []
+        for loader in DataLoaderFactory.loaders:
+            extensions.extend(loader.get_supported_extensions())
+        return extensions
+    
+    @staticmethod
+    def _count(file_path, ext):
+        Metrics.inc("loaded_files_total", type=ext.lstrip("."))
+        Metrics.inc("loaded_bytes_total", os.path.getsize(file_path), type=ext.lstrip("."))
+    
     @staticmethod
     def _get_loader(file_extension):
         for loader in DataLoaderFactory.loaders:
@@ -0,0 +1,295 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from config import Config
+
+###########################################
+# Ingestion manifest
+# remembers what we stored for every file so re-ingestion
+# can skip unchanged files / chunks and find orphaned records
+MANIFEST_PATH = Config.MANIFEST_PATH
+###########################################
+
+
+class IngestManifest:
+    def __init__(self, path=MANIFEST_PATH):
+        path = str(path)
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        # bumped by every change of the chunk rows (query result caches key on it, see Assembler)
+        self.version = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                file_path TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                file_path TEXT NOT NULL,
+                chunk_index INTEGER NOT NULL,
+                chunk_hash TEXT NOT NULL,
+                record_id TEXT NOT NULL,
+                position TEXT NOT NULL DEFAULT '',
+                PRIMARY KEY (file_path, chunk_index)
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_record ON chunks(record_id);
+            """
+        )
+        # manifests written before chunk positions were kept
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        if "position" not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN position TEXT NOT NULL DEFAULT ''")
+        self._conn.commit()
+
+    @staticmethod
+    def hash_bytes(data):
+        return hashlib.sha256(data).hexdigest()
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_file(file_path):
+        h = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        return h.hexdigest()
+
+    def get_file(self, rel_path):
+        """
+        Returns {'content_hash', 'mtime_ns', 'size'} or None if the file was never stored
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT content_hash, mtime_ns, size FROM files WHERE file_path = ?", (rel_path,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"content_hash": row[0], "mtime_ns": row[1], "size": row[2]}
+
+    def get_chunks(self, rel_path, start=0, end=None, limit=None):
+        """
+        Returns {chunk_index: (chunk_hash, record_id, position)}
+        position: where the chunk sits in its file (offsets as JSON, "" if it has none),
+        kept apart from chunk_hash so a chunk that only moved is not embedded again
+        start / end / limit: only the chunks from index start up to end (excluded), the first limit of them
+        """
+        query = "SELECT chunk_index, chunk_hash, record_id, position FROM chunks WHERE file_path = ? AND chunk_index >= ?"
+        params = [rel_path, start]
+        if end is not None:
+            query += " AND chunk_index < ?"
+            params.append(end)
+        if limit is not None:
+            query += " ORDER BY chunk_index LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return {idx: (chunk_hash, record_id, position) for idx, chunk_hash, record_id, position in rows}
+
+    def update_file(self, rel_path, content_hash, mtime_ns, size, chunks):
+        """
+        Replace the entry of one file.
+        chunks: list of (chunk_index, chunk_hash, record_id, position)
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_path, content_hash, mtime_ns, size, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (rel_path, content_hash, mtime_ns, size, time.time())
+            )
+            self._conn.execute("DELETE FROM chunks WHERE file_path = ?", (rel_path,))
+            self._conn.executemany(
+                "INSERT INTO chunks (file_path, chunk_index, chunk_hash, record_id, position) VALUES (?, ?, ?, ?, ?)",
+                [(rel_path, idx, chunk_hash, record_id, position) for idx, chunk_hash, record_id, position in chunks]
+            )
+            self.version += 1
+
+    def begin_file(self, rel_path, mtime_ns, size):
+        """
+        A file whose chunks are rewritten a group at a time (put_chunks, finish_file):
+        its content hash stays empty until finish_file, an interrupted sync is done again
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO files (file_path, content_hash, mtime_ns, size, updated_at) VALUES (?, '', ?, ?, ?) "
+                "ON CONFLICT(file_path) DO UPDATE SET content_hash = '', updated_at = excluded.updated_at",
+                (rel_path, mtime_ns, size, time.time())
+            )
+
+    def put_chunks(self, rel_path, chunks):
+        """
+        Insert or replace some chunks of a file (see begin_file)
+        chunks: list of (chunk_index, chunk_hash, record_id, position)
+        """
+        if not chunks:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (file_path, chunk_index, chunk_hash, record_id, position) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(rel_path, idx, chunk_hash, record_id, position) for idx, chunk_hash, record_id, position in chunks]
+            )
+            self.version += 1
+
+    def delete_chunks(self, rel_path, start, end=None):
+        """
+        Forget the chunks of a file from index start up to end (excluded)
+        """
+        with self._lock, self._conn:
+            if end is None:
+                self._conn.execute("DELETE FROM chunks WHERE file_path = ? AND chunk_index >= ?", (rel_path, start))
+            else:
+                self._conn.execute("DELETE FROM chunks WHERE file_path = ? AND chunk_index >= ? AND chunk_index < ?",
+                                   (rel_path, start, end))
+            self.version += 1
+
+    def finish_file(self, rel_path, content_hash, mtime_ns, size):
+        """
+        End of a begin_file: record the content hash ("" keeps the file due for another sync)
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (file_path, content_hash, mtime_ns, size, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (rel_path, content_hash, mtime_ns, size, time.time())
+            )
+
+    def touch_file(self, rel_path, mtime_ns, size):
+        """
+        Content is the same but the file was touched, just remember the new stat
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE files SET mtime_ns = ?, size = ?, updated_at = ? WHERE file_path = ?",
+                (mtime_ns, size, time.time(), rel_path)
+            )
+
+    def remove_file(self, rel_path):
+        self.remove_files([rel_path])
+
+    def remove_files(self, rel_paths):
+        rows = [(rel_path,) for rel_path in rel_paths]
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM files WHERE file_path = ?", rows)
+            self._conn.executemany("DELETE FROM chunks WHERE file_path = ?", rows)
+            self.version += 1
+
+    def get_record_ids(self, rel_paths):
+        """
+        Record ids stored for many files at once
+        Returns:
+            {file_path: [record_id, ...]} for the files the manifest knows
+        """
+        result = {}
+        with self._lock:
+            for rel_path in rel_paths:
+                rows = self._conn.execute(
+                    "SELECT record_id FROM chunks WHERE file_path = ?", (rel_path,)
+                ).fetchall()
+                if rows or self._conn.execute(
+                    "SELECT 1 FROM files WHERE file_path = ?", (rel_path,)
+                ).fetchone():
+                    result[rel_path] = [row[0] for row in rows]
+        return result
+
+    def get_referrers(self, record_ids, exclude_files=()):
+        """
+        Chunks pointing at the given records (several files can share one record, see dedup)
+        Returns:
+            {record_id: [(file_path, chunk_index, chunk_hash), ...]} for the referenced ones
+        """
+        record_ids, exclude = list(dict.fromkeys(record_ids)), set(exclude_files)
+        result = {}
+        with self._lock:
+            for start in range(0, len(record_ids), 500):
+                batch = record_ids[start:start + 500]
+                rows = self._conn.execute(
+                    "SELECT record_id, file_path, chunk_index, chunk_hash FROM chunks "
+                    f"WHERE record_id IN ({','.join('?' * len(batch))}) ORDER BY file_path, chunk_index", batch
+                ).fetchall()
+                for record_id, file_path, chunk_index, chunk_hash in rows:
+                    if file_path not in exclude:
+                        result.setdefault(record_id, []).append((file_path, chunk_index, chunk_hash))
+        return result
+
+    def get_shared(self, rel_paths):
+        """
+        Chunks of these files whose record other chunks point at too (dedup): the links
+        of these files into other records and the records that are linked to
+        Returns:
+            list of (file_path, chunk_index, record_id, position)
+        """
+        rel_paths = list(rel_paths)
+        result = []
+        with self._lock:
+            for start in range(0, len(rel_paths), 500):
+                batch = rel_paths[start:start + 500]
+                result.extend(self._conn.execute(
+                    "SELECT c.file_path, c.chunk_index, c.record_id, c.position FROM chunks c "
+                    f"WHERE c.file_path IN ({','.join('?' * len(batch))}) AND EXISTS ("
+                    "SELECT 1 FROM chunks o WHERE o.record_id = c.record_id "
+                    "AND (o.file_path != c.file_path OR o.chunk_index != c.chunk_index)) "
+                    "ORDER BY c.file_path, c.chunk_index", batch
+                ).fetchall())
+        return result
+
+    def relink(self, old_id, new_id, exclude_files=()):
+        """
+        Point the chunks of every other file at new_id instead of old_id
+        """
+        exclude = list(exclude_files)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE chunks SET record_id = ? WHERE record_id = ? "
+                f"AND file_path NOT IN ({','.join('?' * len(exclude))})",
+                [new_id, old_id] + exclude
+            )
+            self.version += 1
+
+    def requeue(self, chunks):
+        """
+        Forget some chunks and mark their files for another sync, which embeds those chunks again
+        chunks: list of (file_path, chunk_index)
+        """
+        if not chunks:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM chunks WHERE file_path = ? AND chunk_index = ?", chunks)
+            self._conn.executemany("UPDATE files SET content_hash = '' WHERE file_path = ?",
+                                   [(file_path,) for file_path in dict.fromkeys(f for f, _ in chunks)])
+            self.version += 1
+
+    def revision(self):
+        """
+        Moves on with every write to the manifest, by this process (version)
+        or by any other one (sqlite data_version): query result caches key on it
+        """
+        with self._lock:
+            return self.version, self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def list_files(self, prefix=None):
+        """
+        Stored files, only those under the directory `prefix` (e.g. "C1/markdown") if given
+        """
+        with self._lock:
+            if not prefix:
+                return [row[0] for row in self._conn.execute("SELECT file_path FROM files")]
+            prefix = prefix.rstrip("/") + "/"
+            return [row[0] for row in self._conn.execute(
+                "SELECT file_path FROM files WHERE substr(file_path, 1, ?) = ?", (len(prefix), prefix)
+            )]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
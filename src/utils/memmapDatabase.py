@@ -0,0 +1,352 @@
+import os
+import json
+import uuid
+import sqlite3
+import threading
+import numpy as np
+from typing import List, Dict, Any, Optional
+from config import Config
+from quantization import QuantizedIndex
+from quantizedDatabase import hydrate_hits
+from vectorDatabase import empty_results
+from metrics import Metrics, get_logger
+
+###########################################
+# VectorDatabase without chromadb (Config.VECTOR_BACKEND = "memmap")
+# <DB_PATH>/<name>.memmap/
+#   vectors.f32, ids.txt, deleted.i64 ...  a QuantizedIndex: normalized float32 rows in an
+#                                          append-only memory-mapped file, deletes tombstoned
+#                                          and compacted; "exact" search (blocked matmul +
+#                                          argpartition) or int8 / pq with VECTOR_STORAGE
+#   records.sqlite3                        side table: id -> document, metadata (JSON)
+# chromadb style `where` filters are translated to SQL over the metadata JSON.
+# opening maps the vector file (zero-copy), several processes share its pages:
+# one writer, any number of readonly=True readers (they pick up its writes on every query).
+DB_PATH = Config.DB_PATH
+VECTOR_STORAGE = Config.VECTOR_STORAGE
+###########################################
+
+logger = get_logger("memmapDatabase")
+
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def where_to_sql(where):
+    """
+    chromadb metadata filter -> (SQL condition on the metadata column, parameters)
+    e.g. {"$and": [{"source_type": "pdf"}, {"page": {"$gte": 3}}]}
+    """
+    if not where:
+        return "1", []
+    clauses, params = [], []
+    for field, condition in where.items():
+        if field in ("$and", "$or"):
+            parts = [where_to_sql(clause) for clause in condition]
+            clauses.append("(" + f" {field[1:].upper()} ".join(sql for sql, _ in parts) + ")")
+            params += [param for _, part in parts for param in part]
+            continue
+        # a literal path, so that the expression index on file_path is used
+        path = f"$.{field}" if field.isidentifier() else '$."' + field.replace('"', '""') + '"'
+        column = "json_extract(metadata, '" + path.replace("'", "''") + "')"
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        for operator, value in condition.items():
+            if operator in _OPERATORS:
+                clauses.append(f"{column} {_OPERATORS[operator]} ?")
+                params.append(value)
+            elif operator in ("$in", "$nin"):
+                values = list(value)
+                negate = "NOT " if operator == "$nin" else ""
+                clauses.append(f"{column} {negate}IN ({','.join('?' * len(values))})")
+                params += values
+            else:
+                raise ValueError(f"Unsupported where operator: {operator}")
+    return "(" + " AND ".join(clauses) + ")", params
+
+
+class MemmapVectorDatabase:
+    def __init__(self, collection_name: str = "rag_knowledge_base", path=DB_PATH,
+                 storage=VECTOR_STORAGE, readonly=False):
+        """
+        Open (or create) <path>/<collection_name>.memmap
+        storage: "float32" (exact search), "int8" or "pq"
+        readonly: a reader process next to the one writing
+        """
+        self.path = str(path)
+        self.name = collection_name
+        self.readonly = readonly
+        self.version = 0
+        self._lock = threading.Lock()
+        directory = os.path.join(self.path, f"{collection_name}.memmap")
+        self.index = QuantizedIndex(directory, "exact" if storage == "float32" else storage, readonly=readonly)
+        db_path = os.path.join(directory, "records.sqlite3")
+        if readonly:
+            self._conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    id TEXT PRIMARY KEY,
+                    document TEXT,
+                    metadata TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_records_file ON records(json_extract(metadata, '$.file_path'));
+                """
+            )
+            self._conn.commit()
+
+    def add_documents(self,
+                      texts: List[str],
+                      embeddings,
+                      metadatas: Optional[List[Dict[str, Any]]] = None,
+                      ids: Optional[List[str]] = None):
+        """
+        Vectors appended to the memory-mapped file, documents and metadata upserted in sqlite
+        Returns:
+            True if the upsert succeeded
+        """
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in range(len(texts))]
+        if metadatas is None:
+            metadatas = [{"source": "default"} for _ in range(len(texts))]
+        try:
+            with Metrics.span("db_upsert", attrs={"documents": len(ids)}, collection=self.name):
+                rows = [(record_id, text, json.dumps(metadata, ensure_ascii=False))
+                        for record_id, text, metadata in zip(ids, texts, metadatas)]
+                # records first, committed once the vectors are appended: a failed append rolls
+                # them back, the previous vectors of the ids are only tombstoned by a successful one
+                with self._lock, self._conn:
+                    self._conn.executemany(
+                        "INSERT INTO records (id, document, metadata) VALUES (?, ?, ?) "
+                        "ON CONFLICT(id) DO UPDATE SET document = excluded.document, metadata = excluded.metadata",
+                        rows
+                    )
+                    self.index.add(ids, np.asarray(embeddings, dtype=np.float32))
+        except Exception as e:
+            logger.error("Error upserting documents: %s", e)
+            return False
+        self.version += 1
+        Metrics.inc("db_upserted_total", len(ids), collection=self.name)
+        return True
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Replace the metadata of existing documents, documents and vectors stay
+        Returns:
+            True if the update succeeded
+        """
+        rows = [(json.dumps(metadata, ensure_ascii=False), record_id) for record_id, metadata in zip(ids, metadatas)]
+        try:
+            with Metrics.span("db_update", attrs={"documents": len(rows)}, collection=self.name):
+                with self._lock, self._conn:
+                    self._conn.executemany("UPDATE records SET metadata = ? WHERE id = ?", rows)
+        except Exception as e:
+            logger.error("Error updating metadata: %s", e)
+            return False
+        self.version += 1
+        return True
+
+    def query_by_metadata(self, where: Dict[str, Any], n_results: int = 5):
+        """
+        Query documents based on metadata filtering (no distance included)
+        """
+        with Metrics.span("db_query", kind="metadata", collection=self.name):
+            return self._select(where, ("documents", "metadatas"), limit=n_results)
+
+    def iter_pages(self, where: Dict[str, Any] = None, page_size: int = 1000,
+                   include: List[str] = ("metadatas",)):
+        """
+        Walk the records (or those matching `where`) page by page, in insertion order
+        Yields:
+            chromadb get() like results {'ids': [...], 'metadatas': [...], ...}
+        """
+        after = 0
+        while True:
+            page, after = self._select(where, include, limit=page_size, after=after, with_rowid=True)
+            if not page["ids"]:
+                return
+            yield page
+            if len(page["ids"]) < page_size:
+                return
+
+    def get_by_ids(self, ids: List[str], include: List[str] = ("documents", "metadatas")):
+        """
+        Fetch documents by id (no distance included), ids not found are left out
+        """
+        ids = list(ids)
+        results = {"ids": []}
+        results.update((key, []) for key in include if key != "embeddings")
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            page = self._select(None, include, id_in=batch)
+            for key in results:
+                results[key].extend(page[key])
+        return self._with_vectors(results, include)
+
+    def query_with_vector(self, query_embedding, n_results: int = 5, where: Dict[str, Any] = None,
+                          include: List[str] = ("documents", "metadatas", "distances")):
+        """
+        Query similar documents based on **one** query vector (chromadb query() layout)
+        """
+        return self.query_with_vectors([query_embedding], n_results, where, include=include)
+
+    def query_with_vectors(self, query_embeddings, n_results: int = 5, where: Dict[str, Any] = None,
+                           batch_size: int = 256, include: List[str] = ("documents", "metadatas", "distances")):
+        """
+        Blocked scan of the memory-mapped vectors (metadata filter applied first, in sqlite)
+        Returns:
+            A dictionary of per-query lists, same layout as chromadb
+        """
+        self.index.refresh()
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        if not query_embeddings.size:
+            return empty_results(include)
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings[None, :]
+        # the ids of a filter are only read when its row mask is not cached (see QuantizedIndex.search);
+        # data_version moves on when another process commits to the records
+        allowed = (lambda: self.get_ids(where)) if where else None
+        key = None
+        if where:
+            with self._lock:
+                data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            key = (json.dumps(where, sort_keys=True), self.version, data_version)
+        hits = []
+        for i in range(0, len(query_embeddings), batch_size):
+            with Metrics.span("db_query", attrs={"queries": len(query_embeddings[i:i + batch_size])},
+                              kind="memmap", collection=self.name):
+                hits.extend(self.index.search(query_embeddings[i:i + batch_size], n_results,
+                                              allowed=allowed, allowed_key=key))
+        return hydrate_hits(self, hits, include)
+
+    def get_ids(self, where: Dict[str, Any] = None):
+        """
+        Ids of the documents matching the filter, nothing else is fetched
+        """
+        return self._select(where, ())["ids"]
+
+    def delete_documents(self, where: Dict[str, Any]):
+        """
+        Delete documents matching the given metadata filter
+        Returns:
+            number of deleted documents
+        """
+        return self.delete_by_ids(self.get_ids(where))
+
+    def delete_by_ids(self, ids: List[str], batch_size: int = 5000):
+        """
+        Delete documents by id, ids that don't exist are ignored
+        Returns:
+            number of documents that existed and were deleted
+        """
+        ids = list(ids)
+        count = 0
+        try:
+            with Metrics.span("db_delete", collection=self.name):
+                # as in add_documents: the records are only deleted if the vectors are too
+                with self._lock, self._conn:
+                    for start in range(0, len(ids), 500):
+                        batch = ids[start:start + 500]
+                        count += self._conn.execute(
+                            f"DELETE FROM records WHERE id IN ({','.join('?' * len(batch))})", batch
+                        ).rowcount
+                    self.index.remove(ids)
+        except Exception as e:
+            logger.error("Error deleting documents: %s", e)
+            count = 0
+        if count:
+            self.version += 1
+        Metrics.inc("db_deleted_total", count, collection=self.name)
+        return count
+
+    def delete_by_files(self, file_paths: List[str], batch_size: int = 500):
+        """
+        Delete every document of many files (relative paths)
+        Returns:
+            number of deleted documents
+        """
+        file_paths = list(file_paths)
+        return sum(self.delete_documents({"file_path": {"$in": file_paths[i:i + batch_size]}})
+                   for i in range(0, len(file_paths), batch_size))
+
+    def _clear_collection(self):
+        """
+        Delete all documents
+        """
+        self.index.clear()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM records")
+        self.version += 1
+        logger.info("Collection %s cleared.", self.name)
+
+    def count(self):
+        """
+        Return the total number of documents
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def peek(self, limit: int = 5):
+        """
+        Peek at a few documents
+        """
+        return self._select(None, ("documents", "metadatas"), limit=limit)
+
+    def close(self):
+        self.index.close()
+        with self._lock:
+            self._conn.close()
+
+    # --- internals ---
+
+    def _select(self, where, include, limit=None, after=None, id_in=None, with_rowid=False):
+        condition, params = where_to_sql(where)
+        # only the columns asked for: id listings never read the documents / metadata
+        columns = ["rowid", "id"] + [column for key, column in (("documents", "document"), ("metadatas", "metadata"))
+                                     if key in include]
+        query = f"SELECT {', '.join(columns)} FROM records WHERE {condition}"
+        if id_in is not None:
+            query += f" AND id IN ({','.join('?' * len(id_in))})"
+            params += list(id_in)
+        if after is not None:
+            query += " AND rowid > ? ORDER BY rowid"
+            params.append(after)
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        results = {"ids": [row[1] for row in rows]}
+        if "documents" in include:
+            at = columns.index("document")
+            results["documents"] = [row[at] for row in rows]
+        if "metadatas" in include:
+            at = columns.index("metadata")
+            results["metadatas"] = [json.loads(row[at]) for row in rows]
+        results = self._with_vectors(results, include)
+        if with_rowid:
+            return results, rows[-1][0] if rows else after
+        return results
+
+    def _with_vectors(self, results, include):
+        if "embeddings" in include:
+            results["embeddings"] = self.index.get_vectors(results["ids"])
+        return results
+
+
+if __name__ == "__main__":
+    import tempfile
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((1000, 64)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = MemmapVectorDatabase(path=tmp)
+        db.add_documents([f"doc {i}" for i in range(1000)], vectors,
+                         [{"file_path": f"C{i % 3}/f{i % 10}.md", "chunk_index": i} for i in range(1000)],
+                         [str(i) for i in range(1000)])
+        print(db.count(), db.query_with_vector(vectors[7], 3, where={"file_path": "C1/f7.md"})["ids"])
+        reader = MemmapVectorDatabase(path=tmp, readonly=True)
+        db.delete_by_files(["C1/f7.md"])
+        print(reader.query_with_vector(vectors[7], 3)["ids"], reader.count())
+        reader.close()
+        db.close()
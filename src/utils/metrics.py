@@ -0,0 +1,297 @@
+import sys
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from config import Config
+
+###########################################
+# Instrumentation shared by every stage
+#   counters     Metrics.inc("chunks_total", 12, chunker="MarkdownChunker")
+#   histograms   Metrics.observe("query_seconds", 0.03, kind="text")
+#   spans        with Metrics.span("load", attrs={"file": rel_path}, type="pdf"): ...
+#                -> histogram load_seconds{type="pdf"} + an entry in the recent span log
+# exported as Prometheus text (Metrics.to_prometheus) or JSON (Metrics.to_json).
+# labels are kept low-cardinality (stage, backend, type...), per-file detail
+# only goes to the span log and the debug log.
+# get_logger() gives the package's leveled loggers ("eco_rag.<module>").
+LOG_LEVEL = Config.LOG_LEVEL
+SPAN_HISTORY = Config.METRICS_SPAN_HISTORY
+LATENCY_BUCKETS = Config.METRICS_LATENCY_BUCKETS
+###########################################
+
+_ROOT_LOGGER = "eco_rag"
+
+
+def get_logger(name):
+    """
+    Logger "eco_rag.<name>"; the first call gives the package a stderr handler
+    at Config.LOG_LEVEL unless the application configured "eco_rag" itself
+    """
+    root = logging.getLogger(_ROOT_LOGGER)
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)-7s %(name)s: %(message)s"))
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        root.propagate = False
+    return logging.getLogger(f"{_ROOT_LOGGER}.{name}")
+
+
+def set_log_level(level):
+    """
+    e.g. set_log_level("DEBUG") for per-file / per-batch messages, "WARNING" for quiet runs
+    """
+    get_logger("metrics")
+    logging.getLogger(_ROOT_LOGGER).setLevel(level)
+
+
+logger = get_logger("metrics")
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram (Prometheus layout), plus sum / count / max
+    """
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile (what a Prometheus histogram can tell)
+        """
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "mean": round(self.sum / self.count, 6) if self.count else None,
+            "max": round(self.max, 6),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": {str(b): n for b, n in zip(self.buckets + ["+Inf"], self.counts)},
+        }
+
+
+class Metrics:
+    _counters = {}      # (name, labels) -> value
+    _histograms = {}    # (name, labels) -> Histogram
+    _help = {}          # name -> description
+    _spans = deque(maxlen=SPAN_HISTORY)
+    _lock = threading.Lock()
+
+    @staticmethod
+    def inc(name, value=1, **labels):
+        """
+        Add value to the counter name{labels}
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with Metrics._lock:
+            Metrics._counters[key] = Metrics._counters.get(key, 0) + value
+
+    @staticmethod
+    def observe(name, value, **labels):
+        """
+        Record one value (seconds for latencies) in the histogram name{labels}
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with Metrics._lock:
+            histogram = Metrics._histograms.get(key)
+            if histogram is None:
+                histogram = Metrics._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @staticmethod
+    @contextmanager
+    def span(name, attrs=None, **labels):
+        """
+        Time a block: observed in <name>_seconds{labels}, kept in the recent span log with attrs
+        (per-file details like {"file": rel_path, "chunks": 12}, the block may add to attrs).
+        Failing blocks are counted in <name>_errors_total{labels}.
+        """
+        attrs = {} if attrs is None else attrs
+        start = time.perf_counter()
+        ok = True
+        try:
+            yield attrs
+        except BaseException:
+            ok = False
+            Metrics.inc(f"{name}_errors_total", **labels)
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            Metrics.observe(f"{name}_seconds", seconds, **labels)
+            entry = {"span": name, "seconds": round(seconds, 6), "ok": ok, "end": time.time(), **labels, **attrs}
+            with Metrics._lock:
+                Metrics._spans.append(entry)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("span %s %.1fms %s", name, seconds * 1000, {**labels, **attrs})
+
+    @staticmethod
+    def timed_iter(iterable, name, attrs=None, **labels):
+        """
+        Like span() around a generator: only the time spent producing items is counted,
+        not the time the consumer holds them. attrs["items"] is set to the number of items.
+        """
+        attrs = {} if attrs is None else attrs
+        iterator, busy, count = iter(iterable), 0.0, 0
+        ok = False
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    busy += time.perf_counter() - start
+                    ok = True
+                    return
+                busy += time.perf_counter() - start
+                count += 1
+                yield item
+        except GeneratorExit:
+            # the consumer stopped early (break, close()): not an error of the source
+            ok = True
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+            raise
+        finally:
+            if not ok:
+                Metrics.inc(f"{name}_errors_total", **labels)
+            Metrics.observe(f"{name}_seconds", busy, **labels)
+            entry = {"span": name, "seconds": round(busy, 6), "ok": ok, "end": time.time(),
+                     **labels, **attrs, "items": count}
+            with Metrics._lock:
+                Metrics._spans.append(entry)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("span %s %.1fms %s items=%d", name, busy * 1000, {**labels, **attrs}, count)
+
+    @staticmethod
+    def describe(name, text):
+        """
+        HELP line of a metric in the Prometheus export
+        """
+        Metrics._help[name] = text
+
+    @staticmethod
+    def counter(name, **labels):
+        """
+        Current value of one counter (0 if never incremented)
+        """
+        with Metrics._lock:
+            return Metrics._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    @staticmethod
+    def histogram(name, **labels):
+        """
+        Summary dict of one histogram, None if nothing was observed
+        """
+        with Metrics._lock:
+            histogram = Metrics._histograms.get((name, tuple(sorted(labels.items()))))
+            return histogram.to_dict() if histogram else None
+
+    @staticmethod
+    def recent_spans(name=None, limit=None):
+        """
+        Latest spans (newest last), optionally of one name
+        """
+        with Metrics._lock:
+            spans = [s for s in Metrics._spans if name is None or s["span"] == name]
+        return spans[-limit:] if limit else spans
+
+    @staticmethod
+    def reset():
+        with Metrics._lock:
+            Metrics._counters.clear()
+            Metrics._histograms.clear()
+            Metrics._spans.clear()
+
+    @staticmethod
+    def to_json(spans=True):
+        """
+        Everything as one JSON-serializable dict:
+            {'counters': [{'name', 'labels', 'value'}], 'histograms': [...], 'spans': [...]}
+        """
+        with Metrics._lock:
+            counters = [{"name": n, "labels": dict(l), "value": v}
+                        for (n, l), v in sorted(Metrics._counters.items())]
+            histograms = [{"name": n, "labels": dict(l), **h.to_dict()}
+                          for (n, l), h in sorted(Metrics._histograms.items(), key=lambda item: item[0])]
+            recent = list(Metrics._spans) if spans else []
+        return {"counters": counters, "histograms": histograms, "spans": recent}
+
+    @staticmethod
+    def to_prometheus(prefix=_ROOT_LOGGER):
+        """
+        Prometheus text exposition format (counters and histograms, spans are JSON only)
+        """
+        lines, typed = [], set()
+
+        def header(name, kind):
+            if name not in typed:
+                typed.add(name)
+                if name in Metrics._help:
+                    lines.append(f"# HELP {prefix}_{name} {Metrics._help[name]}")
+                lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        with Metrics._lock:
+            for (name, labels), value in sorted(Metrics._counters.items()):
+                header(name, "counter")
+                lines.append(f"{prefix}_{name}{_labels(labels)} {value}")
+            for (name, labels), h in sorted(Metrics._histograms.items(), key=lambda item: item[0]):
+                header(name, "histogram")
+                cumulative = 0
+                for bound, n in zip(h.buckets + ["+Inf"], h.counts):
+                    cumulative += n
+                    lines.append(f"{prefix}_{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{prefix}_{name}_sum{_labels(labels)} {h.sum}")
+                lines.append(f"{prefix}_{name}_count{_labels(labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def write(path):
+        """
+        Dump to path, Prometheus text for *.prom / *.txt, JSON otherwise
+        """
+        path = str(path)
+        text = Metrics.to_prometheus() if path.endswith((".prom", ".txt")) else json.dumps(Metrics.to_json(), indent=2)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+if __name__ == "__main__":
+    set_log_level("DEBUG")
+    with Metrics.span("load", attrs={"file": "C1/a.md"}, type="md"):
+        time.sleep(0.01)
+    Metrics.inc("chunks_total", 12, chunker="MarkdownChunker")
+    print(Metrics.to_prometheus())
@@ -0,0 +1,257 @@
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from loader import DataLoaderFactory
+from chunker import ChunkerFactory
+from recordBatch import RecordBatch
+from metrics import Metrics, get_logger
+
+###########################################
+# Directory ingestion as a streaming pipeline
+#
+#   walk files --> [load + chunk]  --> [embed]  --> [batched writer]
+#                  process pool        threads      one thread
+#
+# stages are connected by bounded queues, so a slow stage
+# blocks the ones before it instead of piling up memory.
+# the manifest is only updated after a file's records are written,
+# an interrupted run can be resumed by running it again.
+LOAD_WORKERS = Config.INGEST_LOAD_WORKERS
+EMBED_WORKERS = Config.INGEST_EMBED_WORKERS
+QUEUE_SIZE = Config.INGEST_QUEUE_SIZE
+WRITE_BATCH = Config.INGEST_WRITE_BATCH
+###########################################
+
+logger = get_logger("pipeline")
+
+_DONE = object()
+
+
+def _embedded(job):
+    # write-through jobs keep no records, only their counters
+    return job.stats["embedded"] if job.write_through else len(job.records)
+
+
+def _load_and_chunk(file_path):
+    """
+    Runs in a worker process: file_path -> load -> chunk
+    Returns list of (chunk, attributes)
+    """
+    _, ext = os.path.splitext(file_path)
+    # files are already spread over processes, no pool inside the pool
+    segments = DataLoaderFactory.iter_load(file_path, parallel=False)
+    return list(ChunkerFactory.iter_chunks(segments, ext))
+
+
+class StageStats:
+    """
+    Throughput counters of one pipeline stage
+    """
+    def __init__(self, name):
+        self.name = name
+        self.files = 0
+        self.chunks = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, files=0, chunks=0, errors=0, seconds=0.0):
+        with self._lock:
+            self.files += files
+            self.chunks += chunks
+            self.errors += errors
+            self.busy_seconds += seconds
+        # load + chunk run in worker processes, their own metrics stay there: this is the parent's view
+        if files:
+            Metrics.inc("pipeline_files_total", files, stage=self.name)
+            Metrics.observe("pipeline_stage_seconds", seconds, stage=self.name)
+        if chunks:
+            Metrics.inc("pipeline_chunks_total", chunks, stage=self.name)
+        if errors:
+            Metrics.inc("pipeline_errors_total", errors, stage=self.name)
+
+    def to_dict(self):
+        busy = self.busy_seconds or 1e-9
+        return {
+            "files": self.files,
+            "chunks": self.chunks,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "files_per_second": round(self.files / busy, 2),
+            "chunks_per_second": round(self.chunks / busy, 2),
+        }
+
+
+class IngestPipeline:
+    def __init__(self, root=Config.DATA_DIR, incremental=True,
+                 load_workers=LOAD_WORKERS, embed_workers=EMBED_WORKERS,
+                 queue_size=QUEUE_SIZE, write_batch=WRITE_BATCH):
+        self.root = root
+        self.incremental = incremental
+        self.load_workers = max(1, load_workers)
+        self.embed_workers = max(1, embed_workers)
+        self.write_batch = max(1, write_batch)
+        self.chunk_queue = queue.Queue(maxsize=queue_size)
+        self.record_queue = queue.Queue(maxsize=queue_size)
+        self.stats = {name: StageStats(name) for name in ("scan", "load", "embed", "write")}
+
+    def run(self):
+        """
+        Run the whole pipeline and block until every file is written.
+        Returns:
+            {'seconds': ..., 'stages': {stage_name: counters}}
+        """
+        # imported here so worker processes don't open the DB when they import this module
+        from assembler import Assembler
+        self.assembler = Assembler
+
+        start = time.perf_counter()
+        # fork the loader processes before any of our threads exist
+        pool = ProcessPoolExecutor(max_workers=self.load_workers)
+        pool.submit(os.getpid).result()
+        embedders = [
+            threading.Thread(target=self._embed_stage, name=f"embed-{i}", daemon=True)
+            for i in range(self.embed_workers)
+        ]
+        writer = threading.Thread(target=self._write_stage, name="writer", daemon=True)
+        for t in embedders:
+            t.start()
+        writer.start()
+
+        try:
+            self._load_stage(pool)
+        finally:
+            pool.shutdown()
+            for _ in embedders:
+                self.chunk_queue.put(_DONE)
+            for t in embedders:
+                t.join()
+            self.record_queue.put(_DONE)
+            writer.join()
+
+        result = {
+            "seconds": round(time.perf_counter() - start, 3),
+            "stages": {name: s.to_dict() for name, s in self.stats.items()},
+        }
+        logger.info("Ingested %s in %ss", self.root, result["seconds"])
+        for name, s in result["stages"].items():
+            logger.info("    %-6s %s", name, s)
+        return result
+
+    def iter_files(self):
+        """
+        Walk root and yield supported files in a stable order
+        """
+        extensions = set(DataLoaderFactory.supported_extensions())
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                if os.path.splitext(filename)[1] in extensions:
+                    yield os.path.join(dirpath, filename)
+
+    def _load_stage(self, pool):
+        """
+        Scan files (in this thread) and load + chunk them in the process pool.
+        At most 2 * load_workers files are in flight, results are handed on in order.
+        """
+        in_flight = deque()
+        for file_path in self.iter_files():
+            t0 = time.perf_counter()
+            try:
+                job = self.assembler._check_file(file_path, force=not self.incremental)
+            except Exception as e:
+                logger.error("|%s| failed to scan: %s", file_path, e)
+                self.stats["scan"].add(errors=1)
+                continue
+            self.stats["scan"].add(files=1, seconds=time.perf_counter() - t0)
+            if job is None:
+                continue
+            if job.write_through:
+                # rows are read by the embed stage as it goes, the file never becomes one list
+                job.chunks = self.assembler._iter_chunks(file_path)
+                self.stats["load"].add(files=1)
+                self.chunk_queue.put(job)
+                continue
+            in_flight.append((job, pool.submit(_load_and_chunk, file_path), time.perf_counter()))
+            if len(in_flight) >= 2 * self.load_workers:
+                self._hand_over(in_flight.popleft())
+        while in_flight:
+            self._hand_over(in_flight.popleft())
+
+    def _hand_over(self, item):
+        job, future, submitted = item
+        try:
+            job.chunks = future.result()
+        except Exception as e:
+            logger.error("|%s| failed to load: %s", job.rel_path, e)
+            self.stats["load"].add(errors=1)
+            return
+        self.stats["load"].add(files=1, chunks=len(job.chunks), seconds=time.perf_counter() - submitted)
+        # blocks when the embed stage is behind
+        self.chunk_queue.put(job)
+
+    def _embed_stage(self):
+        while True:
+            job = self.chunk_queue.get()
+            if job is _DONE:
+                return
+            t0 = time.perf_counter()
+            try:
+                self.assembler._prepare_records(job)
+            except Exception as e:
+                logger.error("|%s| failed to embed: %s", job.rel_path, e)
+                self.stats["embed"].add(errors=1)
+                continue
+            if job.write_through:
+                self.stats["load"].add(chunks=job.n_chunks)
+            self.stats["embed"].add(files=1, chunks=_embedded(job), seconds=time.perf_counter() - t0)
+            self.record_queue.put(job)
+
+    def _write_stage(self):
+        """
+        Group records of several files into large upserts,
+        files are committed to the manifest only after their records are written
+        """
+        pending_jobs, pending_count = [], 0
+        while True:
+            job = self.record_queue.get()
+            if job is not _DONE:
+                pending_jobs.append(job)
+                if not job.write_through:
+                    pending_count += len(job.records)
+                if pending_count < self.write_batch:
+                    continue
+            if pending_jobs:
+                self._flush(pending_jobs, RecordBatch.concat([j.records for j in pending_jobs
+                                                              if not j.write_through]))
+                pending_jobs, pending_count = [], 0
+            if job is _DONE:
+                return
+
+    def _flush(self, jobs, records):
+        t0 = time.perf_counter()
+        # the embed threads commit row-streamed files meanwhile, the stores change under the lock only
+        with self.assembler.write_lock:
+            for job in jobs:
+                if not job.write_through:
+                    # records other files link to move away before these files overwrite them
+                    self.assembler._promote_replaced(job, list(job.inflight))
+            for i in range(0, len(records), self.write_batch):
+                if not self.assembler._records_to_db(records[i:i + self.write_batch], self.assembler.db):
+                    # leave these files out of the manifest so the next run retries them
+                    logger.error("Failed to write batch of %d records", len(records))
+                    self.stats["write"].add(errors=len(jobs))
+                    return
+            for job in jobs:
+                try:
+                    self.assembler._commit_file(job)
+                except Exception as e:
+                    logger.error("|%s| failed to commit: %s", job.rel_path, e)
+                    self.stats["write"].add(errors=1)
+            self.assembler.lexical.save()
+        self.stats["write"].add(files=len(jobs), chunks=sum(_embedded(job) for job in jobs),
+                                seconds=time.perf_counter() - t0)
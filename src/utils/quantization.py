@@ -0,0 +1,723 @@
+import os
+import sys
+import json
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+from config import Config
+from metrics import Metrics, get_logger
+
+###########################################
+# Compact vector storage: quantized codes in memory, exact floats on disk
+#   int8   per-vector scalar quantization, dim bytes + 4 per vector, no training
+#   pq     product quantization, PQ_SUBVECTORS bytes per vector,
+#          codebooks trained (k-means, NumPy) once PQ_TRAIN_SIZE vectors are in
+#   exact  no codes, blocked float32 scan of the memory map (utils/memmapDatabase.py)
+# search: quantized scores over every row in blocks -> RESCORE_CANDIDATES best
+#         -> exact cosine on their float32 rows (memory-mapped) -> top k
+# files (one directory per index), all append-only between compactions:
+#   vectors.f32  normalized float32 rows     codes.bin / scales.f32  quantized rows
+#   ids.txt      record id of every row      deleted.i64  tombstoned rows
+# record ids are held as fixed-width bytes + sorted 64-bit hashes (_IdMap), no Python object per row
+# one writer process; readers open it readonly and refresh() to see its writes
+# (meta.json "generation" moves on when a compaction / clear replaces the files)
+# filtered searches: the row mask of a metadata filter is kept (FILTER_MASKS of them)
+# until rows are added or removed, repeated filters skip the id -> row lookup
+RESCORE_CANDIDATES = Config.RESCORE_CANDIDATES
+PQ_SUBVECTORS = Config.PQ_SUBVECTORS
+PQ_TRAIN_SIZE = Config.PQ_TRAIN_SIZE
+SEARCH_BLOCK = Config.QUANTIZED_SEARCH_BLOCK
+COMPACT_RATIO = Config.QUANTIZED_COMPACT_RATIO
+FILTER_MASKS = Config.QUANTIZED_FILTER_MASKS
+###########################################
+
+logger = get_logger("quantization")
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12, None)
+
+
+class ScalarQuantizer:
+    """
+    int8 per vector: code = round(v / scale), scale = max|v| / 127
+    """
+    code_dtype = np.int8
+    trained = True
+
+    def __init__(self, dim):
+        self.dim = dim
+        self.code_size = dim
+
+    def encode(self, vectors):
+        """
+        Returns (codes (n, dim) int8, scales (n,) float32)
+        """
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def scores(self, queries, codes, scales):
+        """
+        Approximate dot products (len(queries), len(codes))
+        """
+        return (queries @ codes.astype(np.float32).T) * scales
+
+
+class ProductQuantizer:
+    """
+    m sub-vectors, each replaced by the closest of 256 centroids (one byte)
+    """
+    code_dtype = np.uint8
+
+    def __init__(self, dim, m=PQ_SUBVECTORS, codebooks=None):
+        if dim % m:
+            raise ValueError(f"PQ needs a dimension divisible by the number of sub-vectors ({dim} % {m})")
+        self.dim, self.m, self.dsub = dim, m, dim // m
+        self.code_size = m
+        self.codebooks = codebooks      # (m, 256, dsub)
+
+    @property
+    def trained(self):
+        return self.codebooks is not None
+
+    def train(self, vectors, iterations=15, seed=0):
+        """
+        k-means (256 centroids) in every sub-space
+        """
+        rng = np.random.default_rng(seed)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ksub = min(256, len(vectors))
+        codebooks = np.zeros((self.m, 256, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            x = vectors[:, j * self.dsub:(j + 1) * self.dsub]
+            centroids = x[rng.choice(len(x), ksub, replace=False)].copy()
+            for _ in range(iterations):
+                assign = self._nearest(x, centroids)
+                counts = np.bincount(assign, minlength=ksub)
+                sums = np.stack([np.bincount(assign, weights=x[:, d], minlength=ksub) for d in range(self.dsub)], axis=1)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, None]
+            codebooks[j, :ksub] = centroids
+            codebooks[j, ksub:] = centroids[0]
+        self.codebooks = codebooks
+
+    def encode(self, vectors):
+        """
+        Returns (codes (n, m) uint8, None)
+        """
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = self._nearest(vectors[:, j * self.dsub:(j + 1) * self.dsub], self.codebooks[j])
+        return codes, None
+
+    def scores(self, queries, codes, scales=None):
+        """
+        Asymmetric distance computation: per-query lookup tables of sub-vector dot products
+        """
+        tables = np.einsum("qmd,mkd->qmk", queries.reshape(len(queries), self.m, self.dsub), self.codebooks)
+        out = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for j in range(self.m):
+            out += tables[:, j, codes[:, j]]
+        return out
+
+    @staticmethod
+    def _nearest(x, centroids):
+        # argmin |x - c|^2 = argmin |c|^2 - 2 x.c
+        return np.argmin((centroids * centroids).sum(axis=1) - 2 * (x @ centroids.T), axis=1)
+
+
+class _Buffer:
+    """
+    Growable array (amortized appends), .data is the filled part
+    """
+    def __init__(self, array):
+        self._array = array
+        self.size = len(array)
+
+    @property
+    def data(self):
+        return self._array[:self.size]
+
+    @property
+    def nbytes(self):
+        """
+        Allocated bytes, spare capacity included
+        """
+        return self._array.nbytes
+
+    def widen(self, dtype):
+        """
+        Cast to a wider dtype (longer fixed-width strings)
+        """
+        self._array = self._array.astype(dtype)
+
+    def append(self, rows):
+        if self.size + len(rows) > len(self._array):
+            grown = np.empty((max(2 * len(self._array), self.size + len(rows), 1024),) + self._array.shape[1:],
+                             dtype=self._array.dtype)
+            grown[:self.size] = self._array[:self.size]
+            self._array = grown
+        self._array[self.size:self.size + len(rows)] = rows
+        self.size += len(rows)
+
+
+def _encode_ids(ids):
+    """
+    Fixed-width UTF-8 bytes array of record ids
+    """
+    encoded = [record_id.encode("utf-8") for record_id in ids]
+    return np.array(encoded) if encoded else np.zeros(0, dtype="S1")
+
+
+def _hash_ids(ids):
+    """
+    64-bit FNV-1a of every id of a fixed-width bytes array; the NUL padding is skipped,
+    so widening the array does not change the hashes
+    """
+    hashes = np.full(len(ids), 0xcbf29ce484222325, dtype=np.uint64)
+    if not len(ids):
+        return hashes
+    for column in np.ascontiguousarray(ids).view(np.uint8).reshape(len(ids), -1).T:
+        mixed = (hashes ^ column) * np.uint64(0x100000001b3)
+        hashes = np.where(column != 0, mixed, hashes)
+    return hashes
+
+
+class _IdMap:
+    """
+    Record id <-> row of a QuantizedIndex
+      row -> id   fixed-width UTF-8 bytes, widened when a longer id comes in
+      id -> row   id hashes of the live rows, sorted (searchsorted), plus a dict of the ids
+                  added since, merged into the sorted arrays once it outgrows 1/16 of them
+    """
+    def __init__(self, ids, alive):
+        self.ids = _Buffer(ids)
+        self._rebuild(alive)
+
+    @property
+    def nbytes(self):
+        recent = sys.getsizeof(self._recent) + sum(sys.getsizeof(record_id) + sys.getsizeof(row)
+                                                   for record_id, row in self._recent.items())
+        return self.ids.nbytes + self._hashes.nbytes + self._rows.nbytes + recent
+
+    def append(self, ids, first, alive):
+        encoded = _encode_ids(ids)
+        if encoded.dtype.itemsize > self.ids.data.dtype.itemsize:
+            self.ids.widen(encoded.dtype)
+        self.ids.append(encoded)
+        for row, record_id in enumerate(ids, start=first):
+            self._recent[record_id] = row
+        if len(self._recent) > max(1024, len(self._hashes) // 16):
+            self._rebuild(alive)
+
+    def lookup(self, ids, alive):
+        """
+        Live row of every id, -1 for ids not in the index
+        """
+        keys = _encode_ids(ids)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        if len(self._hashes) and len(keys):
+            hashes = _hash_ids(keys)
+            at = np.searchsorted(self._hashes, hashes)
+            pending = np.arange(len(keys))
+            # ids with the same hash sit next to each other: step on until the id matches
+            while len(pending):
+                pending = pending[at[pending] < len(self._hashes)]
+                pending = pending[self._hashes[at[pending]] == hashes[pending]]
+                candidates = self._rows[at[pending]]
+                hit = self.ids.data[candidates] == keys[pending]
+                rows[pending[hit]] = candidates[hit]
+                pending = pending[~hit]
+                at[pending] += 1
+        if self._recent:
+            for i, record_id in enumerate(ids):
+                rows[i] = self._recent.get(record_id, rows[i])
+        found = rows >= 0
+        rows[found] = np.where(alive[rows[found]], rows[found], -1)
+        return rows
+
+    def _rebuild(self, alive):
+        rows = np.flatnonzero(alive)
+        hashes = _hash_ids(self.ids.data[rows])
+        # the same id alive twice (interrupted upsert): the later row comes first and wins
+        order = np.lexsort((-rows, hashes))
+        self._hashes = hashes[order]
+        self._rows = rows[order].astype(np.int32 if len(alive) < 2**31 else np.int64)
+        self._recent = {}
+
+
+def _top(scores, k):
+    """
+    Column indices of the k largest scores of every row, unordered
+    """
+    if scores.shape[1] <= k:
+        return np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    return np.argpartition(-scores, k - 1, axis=1)[:, :k]
+
+
+class QuantizedIndex:
+    def __init__(self, path, method="int8", dim=None, pq_subvectors=PQ_SUBVECTORS, readonly=False):
+        """
+        Open (or create) the index directory at path
+        method: "int8", "pq" or "exact" (an existing index keeps the method it was made with)
+        readonly: never writes, for processes that only search (see refresh)
+        """
+        self.path = str(path)
+        self.readonly = readonly
+        self._lock = threading.RLock()
+        if os.path.exists(self._file("meta.json")):
+            self.meta = self._read_meta()
+            if self.meta["method"] != method:
+                raise ValueError(f"{self.path} holds a {self.meta['method']} index, not {method}")
+        elif readonly:
+            raise FileNotFoundError(f"No index at {self.path}")
+        else:
+            os.makedirs(self.path, exist_ok=True)
+            self.meta = {"method": method, "dim": dim, "pq_subvectors": pq_subvectors, "generation": 0}
+            self._write_meta()
+        self._consistent_load()
+
+    def __len__(self):
+        return int(np.count_nonzero(self._alive.data))
+
+    # --- writes ---
+
+    def add(self, ids, vectors):
+        """
+        Insert or replace the vectors of ids (normalized here)
+        """
+        self._check_writable()
+        ids = list(ids)
+        if not ids:
+            return
+        vectors = normalize(vectors).reshape(len(ids), -1)
+        with self._lock:
+            if self.dim is None:
+                self.meta["dim"] = vectors.shape[1]
+                self._write_meta()
+                self._load()
+            if vectors.shape[1] != self.dim:
+                raise ValueError(f"Vectors of dim {vectors.shape[1]} for an index of dim {self.dim}")
+            # upsert: a later row of the same id wins, the earlier one is tombstoned
+            replaced = self._idmap.lookup(ids, self._alive.data)
+            replaced = list(replaced[replaced >= 0])
+            first = self._n
+            self._append("vectors.f32", vectors)
+            if self.quantizer is not None and self.quantizer.trained:
+                codes, scales = self.quantizer.encode(vectors)
+                self._append("codes.bin", codes)
+                self._codes.append(codes)
+                if scales is not None:
+                    self._append("scales.f32", scales)
+                    self._scales.append(scales)
+            with open(self._file("ids.txt"), "a", encoding="utf-8") as f:
+                f.write("".join(f"{record_id}\n" for record_id in ids))
+            self._alive.append(np.ones(len(ids), dtype=bool))
+            self._masks.clear()
+            last = {}
+            for row, record_id in enumerate(ids, start=first):
+                if record_id in last:
+                    replaced.append(last[record_id])   # same id twice in one call
+                last[record_id] = row
+            self._n += len(ids)
+            self._tombstone(np.unique(replaced))
+            self._idmap.append(ids, first, self._alive.data)
+            Metrics.inc("quantized_rows_added_total", len(ids), method=self.method)
+            if self.method == "pq" and not self.quantizer.trained and len(self) >= PQ_TRAIN_SIZE:
+                self.train()
+            self._maybe_compact()
+
+    def remove(self, ids):
+        """
+        Tombstone the rows of ids
+        Returns:
+            number of ids that were in the index
+        """
+        self._check_writable()
+        with self._lock:
+            rows = self._idmap.lookup(list(ids), self._alive.data)
+            rows = np.unique(rows[rows >= 0])
+            self._tombstone(rows)
+            self._maybe_compact()
+        return len(rows)
+
+    def compact(self):
+        """
+        Rewrite the files without the tombstoned rows
+        """
+        self._check_writable()
+        with self._lock:
+            self._begin_replace()
+            alive = np.flatnonzero(self._alive.data)
+            vectors = self._vectors()
+            tmp = {name: self._file(name) + ".tmp" for name in ("vectors.f32", "codes.bin", "scales.f32", "ids.txt")}
+            with open(tmp["vectors.f32"], "wb") as f:
+                for start in range(0, len(alive), SEARCH_BLOCK):
+                    np.ascontiguousarray(vectors[alive[start:start + SEARCH_BLOCK]]).tofile(f)
+            self._codes.data[alive[alive < self._codes.size]].tofile(tmp["codes.bin"])
+            self._scales.data[alive[alive < self._scales.size]].tofile(tmp["scales.f32"])
+            with open(tmp["ids.txt"], "wb") as f:
+                f.write(b"".join(record_id + b"\n" for record_id in self._idmap.ids.data[alive]))
+            self._vectors_map = None
+            for name, tmp_path in tmp.items():
+                os.replace(tmp_path, self._file(name))
+            if os.path.exists(self._file("deleted.i64")):
+                os.remove(self._file("deleted.i64"))
+            self._end_replace()
+            self._load()
+            Metrics.inc("quantized_compactions_total", method=self.method)
+            logger.info("Compacted %s: %d rows", self.path, self._n)
+
+    def train(self):
+        """
+        Train the PQ codebooks on a sample of the stored rows and encode every row
+        (runs by itself once PQ_TRAIN_SIZE rows are in; int8 needs no training)
+        """
+        if self.method != "pq" or not len(self):
+            return
+        self._check_writable()
+        with self._lock, Metrics.span("pq_train", attrs={"rows": len(self)}):
+            alive = np.flatnonzero(self._alive.data)
+            sample = np.random.default_rng(0).choice(alive, min(len(alive), PQ_TRAIN_SIZE), replace=False)
+            vectors = self._vectors()
+            self.quantizer.train(np.asarray(vectors[np.sort(sample)]))
+            np.save(self._file("pq_codebooks.npy"), self.quantizer.codebooks)
+            codes = _Buffer(np.zeros((0, self.quantizer.code_size), dtype=np.uint8))
+            for start in range(0, self._n, SEARCH_BLOCK):
+                codes.append(self.quantizer.encode(np.asarray(vectors[start:start + SEARCH_BLOCK]))[0])
+            codes.data.tofile(self._file("codes.bin"))
+            self._codes = codes
+        logger.info("Trained PQ codebooks on %d vectors (%s)", len(sample), self.path)
+
+    def clear(self):
+        self._check_writable()
+        with self._lock:
+            self._begin_replace()
+            self._vectors_map = None
+            for name in ("vectors.f32", "codes.bin", "scales.f32", "ids.txt", "deleted.i64", "pq_codebooks.npy"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self._end_replace()
+            self._load()
+
+    def refresh(self):
+        """
+        Readonly openers: pick up what the writer process did since the index was loaded
+        (a few stat() calls when it did nothing)
+        Returns:
+            True if the index was reloaded
+        """
+        if not self.readonly or self._stamp() == self._loaded_stamp:
+            return False
+        with self._lock:
+            if self._read_meta().get("replacing"):
+                return False    # keep searching the loaded generation until the new one is complete
+            self._consistent_load()
+        return True
+
+    # --- reads ---
+
+    def search(self, queries, k=5, candidates=RESCORE_CANDIDATES, allowed=None, allowed_key=None):
+        """
+        Top k rows of every query: quantized scores in blocks, then the best `candidates`
+        re-scored with the exact float vectors ("exact": float scores, top k straight away)
+        allowed: optional set of record ids to search in (metadata filter),
+                 or a function returning them, only called when the row mask is not cached
+        allowed_key: hashable naming that set as it is now (filter + store version), its row mask
+                     is cached under it until rows are added or removed
+        Returns:
+            list (one per query) of (ids, cosine distances), best first
+        """
+        queries = normalize(queries)
+        if queries.ndim == 1:
+            queries = queries[None, :]
+        if callable(allowed):
+            with self._lock:
+                cached = allowed_key is not None and allowed_key in self._masks
+            if not cached:
+                # read outside the lock: it may query the store whose writes take this lock too
+                allowed = allowed()
+        with self._lock:
+            n, codes, scales, vectors = self._n, self._codes.data, self._scales.data, self._vectors()
+            ids = self._idmap.ids.data
+            mask = self._alive.data.copy() if allowed is None else self._allowed_rows(allowed, allowed_key)
+        if not n or not mask.any():
+            return [([], []) for _ in queries]
+        candidates = k if self.quantizer is None else max(candidates, k)
+
+        # running top candidates of every query, merged block by block
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, n, SEARCH_BLOCK):
+            end = min(start + SEARCH_BLOCK, n)
+            block_mask = mask[start:end]
+            if not block_mask.any():
+                continue
+            coded = min(end, len(codes))
+            parts = []
+            if coded > start:
+                parts.append(self.quantizer.scores(queries, codes[start:coded],
+                                                   scales[start:coded] if len(scales) else None))
+            if coded < end:
+                # rows without codes ("exact", pq before training): float scores
+                parts.append(queries @ np.asarray(vectors[max(coded, start):end]).T)
+            scores = np.concatenate(parts, axis=1) if len(parts) > 1 else parts[0]
+            scores[:, ~block_mask] = -np.inf
+            top = _top(scores, candidates)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            keep = _top(best_scores, candidates)
+            best_rows = np.take_along_axis(best_rows, keep, axis=1)
+            best_scores = np.take_along_axis(best_scores, keep, axis=1)
+
+        results = []
+        for q, rows, approx in zip(queries, best_rows, best_scores):
+            rows = np.sort(rows[np.isfinite(approx)])
+            exact = np.asarray(vectors[rows]) @ q
+            order = np.argsort(-exact, kind="stable")[:k]
+            results.append(([record_id.decode("utf-8") for record_id in ids[rows[order]]],
+                            (1.0 - exact[order]).tolist()))
+        return results
+
+    def get_vectors(self, ids):
+        """
+        Float32 vectors of ids (zeros for ids not in the index)
+        """
+        with self._lock:
+            rows = self._idmap.lookup(list(ids), self._alive.data)
+            vectors = self._vectors()
+        out = np.zeros((len(rows), self.dim or 0), dtype=np.float32)
+        found = rows >= 0
+        if found.any():
+            out[found] = vectors[rows[found]]
+        return out
+
+    def memory_bytes(self):
+        """
+        {'resident': allocated bytes of the codes, scales, tombstones, id map and cached filter masks,
+         'on_disk': float32 rows, 'per_vector': resident / live rows}
+        """
+        with self._lock:
+            resident = (self._codes.nbytes + self._scales.nbytes + self._alive.nbytes + self._idmap.nbytes
+                        + sum(mask.nbytes for mask in self._masks.values()))
+            on_disk = self._n * (self.dim or 0) * 4
+            n_alive = len(self)
+        return {"resident": resident, "on_disk": on_disk, "per_vector": resident / n_alive if n_alive else 0.0}
+
+    def close(self):
+        with self._lock:
+            self._vectors_map = None
+
+    # --- internals ---
+
+    @property
+    def method(self):
+        return self.meta["method"]
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _read_meta(self):
+        with open(self._file("meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_meta(self):
+        # replaced in one step, readers never see half of it
+        with open(self._file("meta.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(self._file("meta.json.tmp"), self._file("meta.json"))
+
+    def _check_writable(self):
+        if self.readonly:
+            raise RuntimeError(f"{self.path} is opened read-only")
+
+    def _begin_replace(self):
+        self.meta["replacing"] = True
+        self._write_meta()
+
+    def _end_replace(self):
+        self.meta["replacing"] = False
+        self.meta["generation"] = self.meta.get("generation", 0) + 1
+        self._write_meta()
+
+    def _stamp(self):
+        stamp = []
+        for name in ("meta.json", "ids.txt", "deleted.i64"):
+            try:
+                st = os.stat(self._file(name))
+                stamp.append((st.st_size, st.st_mtime_ns))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def _consistent_load(self):
+        """
+        _load between two identical reads of meta.json outside a compaction / clear:
+        the files all belong to one generation
+        """
+        while True:
+            meta = self._read_meta()
+            if not meta.get("replacing"):
+                self.meta = meta
+                try:
+                    self._load()
+                except (OSError, ValueError):
+                    # files swapped under us by the writer, anything else is a real error
+                    if self._read_meta() == meta:
+                        raise
+                else:
+                    if self._read_meta() == meta:
+                        return
+            time.sleep(0.05)
+
+    def _load(self):
+        """
+        (Re)read the directory; rows past the shortest file (an interrupted append) are cut off
+        """
+        self._loaded_stamp = self._stamp()
+        self.dim = self.meta["dim"]
+        self._masks = OrderedDict()
+        ids = []
+        if os.path.exists(self._file("ids.txt")):
+            with open(self._file("ids.txt"), "rb") as f:
+                # a last line without its newline is still being written
+                ids = f.read().split(b"\n")[:-1]
+        self._vectors_map = None
+        if self.dim is None:
+            self.quantizer = None
+            self._n, self._idmap = 0, _IdMap(_encode_ids([]), np.zeros(0, dtype=bool))
+            self._alive, self._codes, self._scales = (_Buffer(np.zeros(0, dtype=bool)), _Buffer(np.zeros(0, np.int8)),
+                                                      _Buffer(np.zeros(0, np.float32)))
+            return
+
+        if self.method == "exact":
+            self.quantizer = None
+        elif self.method == "pq":
+            codebooks = None
+            if os.path.exists(self._file("pq_codebooks.npy")):
+                codebooks = np.load(self._file("pq_codebooks.npy"))
+            self.quantizer = ProductQuantizer(self.dim, self.meta["pq_subvectors"], codebooks)
+        else:
+            self.quantizer = ScalarQuantizer(self.dim)
+
+        row_bytes = self.dim * 4
+        n = len(ids)
+        if os.path.exists(self._file("vectors.f32")):
+            n = min(n, os.path.getsize(self._file("vectors.f32")) // row_bytes)
+        else:
+            n = 0
+        self._truncate("vectors.f32", n * row_bytes)
+        if len(ids) > n and not self.readonly:
+            with open(self._file("ids.txt"), "wb") as f:
+                f.write(b"".join(record_id + b"\n" for record_id in ids[:n]))
+        self._n = n
+
+        if self.quantizer is None:
+            self._codes, self._scales = _Buffer(np.zeros(0, np.int8)), _Buffer(np.zeros(0, np.float32))
+        else:
+            codes = self._read("codes.bin", self.quantizer.code_dtype, self.quantizer.code_size, n)
+            scales = self._read("scales.f32", np.float32, None, len(codes))
+            if self.method == "int8" and len(scales) < len(codes):
+                codes = codes[:len(scales)]
+                self._truncate("codes.bin", codes.nbytes)
+            self._codes, self._scales = _Buffer(codes), _Buffer(scales)
+            if self.quantizer.trained and len(codes) < n:
+                # rows whose codes were not written (interrupted append, or still being written)
+                tail = np.asarray(self._vectors()[len(codes):])
+                codes, scales = self.quantizer.encode(tail)
+                if not self.readonly:
+                    self._append("codes.bin", codes)
+                self._codes.append(codes)
+                if scales is not None:
+                    if not self.readonly:
+                        self._append("scales.f32", scales)
+                    self._scales.append(scales)
+
+        alive = np.ones(n, dtype=bool)
+        if os.path.exists(self._file("deleted.i64")):
+            with open(self._file("deleted.i64"), "rb") as f:
+                data = f.read()
+            deleted = np.frombuffer(data[:len(data) // 8 * 8], dtype=np.int64)
+            alive[deleted[deleted < n]] = False
+        self._alive = _Buffer(alive)
+        self._idmap = _IdMap(np.array(ids[:n]) if n else _encode_ids([]), alive)
+        # mapped now: a compaction replacing the file later does not change what this snapshot reads
+        self._vectors()
+
+    def _read(self, name, dtype, width, max_rows):
+        """
+        Rows of an append-only file into memory, cut to max_rows (file truncated to match)
+        """
+        if not os.path.exists(self._file(name)):
+            return np.zeros((0, width) if width else 0, dtype=dtype)
+        data = np.fromfile(self._file(name), dtype=dtype)
+        if width:
+            data = data[:len(data) // width * width].reshape(-1, width)
+        data = data[:max_rows]
+        if not self.readonly:
+            self._truncate(name, data.nbytes)
+        return data
+
+    def _truncate(self, name, size):
+        if not self.readonly and os.path.exists(self._file(name)) and os.path.getsize(self._file(name)) > size:
+            os.truncate(self._file(name), size)
+
+    def _append(self, name, array):
+        with open(self._file(name), "ab") as f:
+            np.ascontiguousarray(array).tofile(f)
+
+    def _vectors(self):
+        """
+        Read-only memory map of the float rows, zero-copy and shared between processes
+        """
+        if self._vectors_map is None or len(self._vectors_map) != self._n:
+            self._vectors_map = (np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r",
+                                           shape=(self._n, self.dim))
+                                 if self._n else np.zeros((0, self.dim or 0), dtype=np.float32))
+        return self._vectors_map
+
+    def _allowed_rows(self, allowed, key):
+        """
+        Live rows of the allowed ids as a mask, cached under key (see search)
+        """
+        mask = self._masks.get(key) if key is not None else None
+        if mask is not None:
+            self._masks.move_to_end(key)
+            return mask
+        if callable(allowed):
+            allowed = allowed()   # evicted since search() looked
+        rows = self._idmap.lookup(list(allowed), self._alive.data)
+        mask = np.zeros(self._n, dtype=bool)
+        mask[rows[rows >= 0]] = True
+        if key is not None:
+            self._masks[key] = mask
+            while len(self._masks) > FILTER_MASKS:
+                self._masks.popitem(last=False)
+        return mask
+
+    def _tombstone(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        self._alive.data[rows] = False
+        self._masks.clear()
+        self._append("deleted.i64", rows)
+
+    def _maybe_compact(self):
+        dead = self._n - len(self)
+        if dead > 1000 and dead > COMPACT_RATIO * self._n:
+            self.compact()
+
+
+if __name__ == "__main__":
+    import tempfile
+    rng = np.random.default_rng(0)
+    data = normalize(rng.standard_normal((5000, 64)))
+    with tempfile.TemporaryDirectory() as tmp:
+        index = QuantizedIndex(tmp, "int8")
+        index.add([str(i) for i in range(len(data))], data)
+        print(index.search(data[:2], k=3), index.memory_bytes())
@@ -0,0 +1,131 @@
+import os
+import json
+import uuid
+import zlib
+import numpy as np
+from typing import List, Dict, Any, Optional
+from config import Config
+from vectorDatabase import VectorDatabase, empty_results
+from quantization import QuantizedIndex
+from metrics import Metrics, get_logger
+
+###########################################
+# VectorDatabase with compact vector storage (Config.VECTOR_STORAGE = "int8" / "pq")
+# chroma keeps ids, documents and metadata; the embeddings live in a QuantizedIndex
+# next to the chroma files (codes in memory, float32 rows memory-mapped for re-scoring).
+# chroma only gets a 2-d placeholder embedding per record, so its HNSW graph stays tiny.
+# the chroma collection is "<name>_<storage>", float32 and quantized collections never mix.
+DB_PATH = Config.DB_PATH
+VECTOR_STORAGE = Config.VECTOR_STORAGE
+###########################################
+
+logger = get_logger("quantizedDatabase")
+
+
+def _placeholder(ids):
+    # spread over the unit circle by id: distinct points keep chroma's HNSW inserts cheap
+    angles = np.array([zlib.crc32(record_id.encode("utf-8")) for record_id in ids], dtype=np.float64)
+    angles *= 2 * np.pi / 2 ** 32
+    return np.stack([np.cos(angles), np.sin(angles)], axis=1).astype(np.float32)
+
+
+def hydrate_hits(db, hits, include):
+    """
+    QuantizedIndex.search hits -> chromadb query() layout, fields fetched with db.get_by_ids
+    """
+    fields = [key for key in include if key in ("documents", "metadatas", "embeddings")]
+    found = db.get_by_ids(list(dict.fromkeys(record_id for ids, _ in hits for record_id in ids)), include=fields)
+    rows = {record_id: i for i, record_id in enumerate(found["ids"])}
+    merged = {"ids": []}
+    merged.update((key, []) for key in include)
+    for ids, distances in hits:
+        # ids the document store does not have (a failed upsert) are left out
+        keep = [(rows[record_id], distance) for record_id, distance in zip(ids, distances) if record_id in rows]
+        merged["ids"].append([found["ids"][row] for row, _ in keep])
+        for key in fields:
+            column = found[key]
+            picks = [row for row, _ in keep]
+            # (0, dim) when nothing is kept
+            merged[key].append(np.asarray(column, dtype=np.float32)[picks] if key == "embeddings"
+                               else [column[row] for row in picks])
+        if "distances" in include:
+            merged["distances"].append([distance for _, distance in keep])
+    return merged
+
+
+class QuantizedVectorDatabase(VectorDatabase):
+    def __init__(self, collection_name: str = "rag_knowledge_base", path=DB_PATH, storage=VECTOR_STORAGE):
+        super().__init__(f"{collection_name}_{storage}", path)
+        self.storage = storage
+        self.index = QuantizedIndex(os.path.join(self.path, f"{collection_name}.{storage}"), method=storage)
+
+    def add_documents(self,
+                      texts: List[str],
+                      embeddings,
+                      metadatas: Optional[List[Dict[str, Any]]] = None,
+                      ids: Optional[List[str]] = None):
+        """
+        Vectors into the quantized index, documents and metadata into chroma
+        Returns:
+            True if the upsert succeeded
+        """
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in range(len(texts))]
+        with Metrics.span("index_add", attrs={"documents": len(ids)}, storage=self.storage):
+            self.index.add(ids, np.asarray(embeddings, dtype=np.float32))
+        if not super().add_documents(texts, _placeholder(ids), metadatas, ids):
+            self.index.remove(ids)
+            return False
+        return True
+
+    def query_with_vector(self, query_embedding, n_results: int = 5, where: Dict[str, Any] = None,
+                          include: List[str] = ("documents", "metadatas", "distances")):
+        """
+        Query similar documents based on **one** query vector (chromadb query() layout)
+        """
+        return self.query_with_vectors([query_embedding], n_results, where, include=include)
+
+    def query_with_vectors(self, query_embeddings, n_results: int = 5, where: Dict[str, Any] = None,
+                           batch_size: int = 256, include: List[str] = ("documents", "metadatas", "distances")):
+        """
+        Quantized search + exact re-scoring, then documents / metadata fetched from chroma
+        Returns:
+            A dictionary of per-query lists, same layout as chromadb
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        if not query_embeddings.size:
+            return empty_results(include)
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings[None, :]
+        # the ids of a filter are only read when its row mask is not cached (see QuantizedIndex.search)
+        allowed = (lambda: self.get_ids(where)) if where else None
+        key = (json.dumps(where, sort_keys=True), self.version) if where else None
+        hits = []
+        for i in range(0, len(query_embeddings), batch_size):
+            with Metrics.span("db_query", attrs={"queries": len(query_embeddings[i:i + batch_size])},
+                              kind="quantized", collection=self.collection.name):
+                hits.extend(self.index.search(query_embeddings[i:i + batch_size], n_results,
+                                              allowed=allowed, allowed_key=key))
+
+        return hydrate_hits(self, hits, include)
+
+    def get_by_ids(self, ids: List[str], include: List[str] = ("documents", "metadatas")):
+        """
+        Fetch documents by id, "embeddings" come from the quantized index (exact float32)
+        """
+        results = super().get_by_ids(ids, [key for key in include if key != "embeddings"])
+        return self._with_vectors(results, include)
+
+    def delete_by_ids(self, ids: List[str], batch_size: int = 5000):
+        ids = list(ids)
+        count = super().delete_by_ids(ids, batch_size)
+        self.index.remove(ids)
+        return count
+
+    def _clear_collection(self):
+        super()._clear_collection()
+        self.index.clear()
+
+    def _with_vectors(self, results, include):
+        if "embeddings" in include:
+            results["embeddings"] = self.index.get_vectors(results["ids"])
+        return results
@@ -0,0 +1,279 @@
+import os
+import atexit
+import threading
+from config import Config
+from metrics import get_logger
+
+###########################################
+# Process-wide registry of shared clients
+# DB clients per path / collection, inference clients per model, caches...
+# created on first use, shared by every thread, closed together.
+# a forked worker process starts with an empty registry
+# (sqlite connections and sockets must not cross a fork).
+###########################################
+
+logger = get_logger("registry")
+
+
+class ClientRegistry:
+    _clients = {}       # key -> client
+    _closers = {}       # key -> close function
+    _creating = {}      # key -> lock held while that client is being built
+    _lock = threading.Lock()
+
+    @staticmethod
+    def get(key, factory, close=None):
+        """
+        The client registered under key, built with factory() the first time.
+        Only callers of the same key wait for a slow factory (e.g. a model load).
+        close: called with the client by ClientRegistry.close
+        """
+        with ClientRegistry._lock:
+            client = ClientRegistry._clients.get(key)
+            if client is not None:
+                return client
+            key_lock = ClientRegistry._creating.setdefault(key, threading.Lock())
+        with key_lock:
+            with ClientRegistry._lock:
+                client = ClientRegistry._clients.get(key)
+            if client is None:
+                client = factory()
+                with ClientRegistry._lock:
+                    ClientRegistry._clients[key] = client
+                    if close is not None:
+                        ClientRegistry._closers[key] = close
+            return client
+
+    @staticmethod
+    def peek(key):
+        """
+        The client if it was already created, never creates one
+        """
+        with ClientRegistry._lock:
+            return ClientRegistry._clients.get(key)
+
+    @staticmethod
+    def close(key=None):
+        """
+        Close and forget one client, or every client if key is None (newest first).
+        The next get() creates a fresh one.
+        """
+        with ClientRegistry._lock:
+            keys = list(ClientRegistry._clients) if key is None else [key]
+            closing = []
+            for k in reversed(keys):
+                client = ClientRegistry._clients.pop(k, None)
+                closer = ClientRegistry._closers.pop(k, None)
+                ClientRegistry._creating.pop(k, None)
+                if client is not None and closer is not None:
+                    closing.append((k, client, closer))
+        for k, client, closer in closing:
+            try:
+                closer(client)
+            except Exception as e:
+                logger.error("Error closing %s: %s", k, e)
+
+    @staticmethod
+    def keys():
+        with ClientRegistry._lock:
+            return list(ClientRegistry._clients)
+
+    @staticmethod
+    def _after_fork():
+        # inherited from the parent: drop without closing, the parent still owns them
+        ClientRegistry._clients = {}
+        ClientRegistry._closers = {}
+        ClientRegistry._creating = {}
+        ClientRegistry._lock = threading.Lock()
+
+
+atexit.register(ClientRegistry.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=ClientRegistry._after_fork)
+
+
+# --- shared clients used across the package ---
+
+def get_vector_db(path=None, collection_name="rag_knowledge_base"):
+    """
+    The knowledge base DB: a ShardedVectorDatabase when Config.SHARD_BY is set,
+    otherwise the single collection (see get_collection_db)
+    """
+    path = str(path or Config.DB_PATH)
+    if Config.SHARD_BY:
+        from shardedDatabase import ShardedVectorDatabase
+        return ClientRegistry.get(("sharded_db", path, collection_name, Config.SHARD_BY),
+                                  lambda: ShardedVectorDatabase(collection_name, path=path))
+    return get_collection_db(path, collection_name)
+
+
+def get_collection_db(path=None, collection_name="rag_knowledge_base"):
+    """
+    VectorDatabase per (path, collection), all collections of a path share one chromadb client
+    (QuantizedVectorDatabase when Config.VECTOR_STORAGE is "int8" / "pq",
+    MemmapVectorDatabase when Config.VECTOR_BACKEND is "memmap")
+    """
+    path = str(path or Config.DB_PATH)
+    storage = Config.VECTOR_STORAGE
+    if Config.VECTOR_BACKEND == "memmap":
+        from memmapDatabase import MemmapVectorDatabase
+        return ClientRegistry.get(("memmap_db", path, collection_name, storage),
+                                  lambda: MemmapVectorDatabase(collection_name, path=path, storage=storage),
+                                  lambda db: db.close())
+    if storage != "float32":
+        from quantizedDatabase import QuantizedVectorDatabase
+        return ClientRegistry.get(("vector_db", path, collection_name, storage),
+                                  lambda: QuantizedVectorDatabase(collection_name, path=path, storage=storage),
+                                  lambda db: db.index.close())
+    from vectorDatabase import VectorDatabase
+    return ClientRegistry.get(("vector_db", path, collection_name),
+                              lambda: VectorDatabase(collection_name, path=path))
+
+
+def get_chroma_client(path):
+    def connect():
+        import chromadb
+        os.makedirs(path, exist_ok=True)
+        logger.info("Connecting to VectorDB at: %s", path)
+        return chromadb.PersistentClient(path=path)
+    return ClientRegistry.get(("chroma", str(path)), connect)
+
+
+def get_inference_client(model_id, token=None):
+    """
+    One HuggingFace InferenceClient per (model, token), reused by every request and retry
+    """
+    def connect():
+        from huggingface_hub import InferenceClient
+        return InferenceClient(model=model_id, token=token)
+    return ClientRegistry.get(("hf_inference", model_id, token), connect)
+
+
+def get_async_inference_client(model_id, token=None):
+    """
+    AsyncInferenceClient per (model, token, event loop): its HTTP session belongs to the loop
+    that created it (closed by AsyncAssembler.aclose)
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+
+    def connect():
+        from huggingface_hub import AsyncInferenceClient
+        return AsyncInferenceClient(model=model_id, token=token)
+    return ClientRegistry.get(("hf_async_inference", model_id, token, loop), connect)
+
+
+def get_embed_limiter(max_workers):
+    """
+    asyncio.Semaphore per (limit, event loop): every async embedding request of the loop
+    takes it, so concurrent files and queries together stay at max_workers requests
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+    return ClientRegistry.get(("embed_limiter", max_workers, loop), lambda: asyncio.Semaphore(max(1, max_workers)))
+
+
+def get_async_executor():
+    """
+    Thread pool (ASYNC_DB_WORKERS threads) for the blocking calls of async callers:
+    chroma, sqlite, file loading, CPU-bound embedding models
+    """
+    def create():
+        from concurrent.futures import ThreadPoolExecutor
+        return ThreadPoolExecutor(max_workers=Config.ASYNC_DB_WORKERS, thread_name_prefix="eco_rag-io")
+    return ClientRegistry.get(("async_executor", Config.ASYNC_DB_WORKERS), create,
+                              lambda pool: pool.shutdown(wait=False))
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Run a blocking call in the async executor and await it
+    """
+    import asyncio
+    import functools
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_async_executor(), functools.partial(fn, *args, **kwargs))
+
+
+def get_llm_client(base_url=None, api_key=None):
+    """
+    One OpenAI-compatible chat client per endpoint, its HTTP connection pool reused by every request
+    """
+    def connect():
+        from openai import OpenAI
+        return OpenAI(base_url=base_url, api_key=api_key,
+                      timeout=Config.LLM_TIMEOUT, max_retries=Config.LLM_MAX_RETRIES)
+    return ClientRegistry.get(("llm", base_url, api_key), connect, lambda client: client.close())
+
+
+def get_async_llm_client(base_url=None, api_key=None):
+    """
+    AsyncOpenAI per (endpoint, event loop), closed by AsyncAssembler.aclose like the HF async clients
+    """
+    import asyncio
+    loop = asyncio.get_running_loop()
+
+    def connect():
+        from openai import AsyncOpenAI
+        return AsyncOpenAI(base_url=base_url, api_key=api_key,
+                           timeout=Config.LLM_TIMEOUT, max_retries=Config.LLM_MAX_RETRIES)
+    return ClientRegistry.get(("llm_async", base_url, api_key, loop), connect)
+
+
+def get_embedding_cache(path=None):
+    def open_cache():
+        from embeddingCache import EmbeddingCache
+        return EmbeddingCache(path or Config.EMBED_CACHE_PATH)
+    return ClientRegistry.get(("embedding_cache", str(path or Config.EMBED_CACHE_PATH)),
+                              open_cache, lambda cache: cache.close())
+
+
+def get_manifest(path=None):
+    def open_manifest():
+        from manifest import IngestManifest
+        return IngestManifest(path or Config.MANIFEST_PATH)
+    return ClientRegistry.get(("manifest", str(path or Config.MANIFEST_PATH)),
+                              open_manifest, lambda manifest: manifest.close())
+
+
+def get_dedup_index(path=None):
+    def open_index():
+        from dedup import DedupIndex
+        return DedupIndex(path or Config.DEDUP_INDEX_PATH)
+    return ClientRegistry.get(("dedup_index", str(path or Config.DEDUP_INDEX_PATH)),
+                              open_index, lambda index: index.close())
+
+
+def get_lexical_index(path=None):
+    def open_index():
+        from lexicalIndex import LexicalIndex
+        return LexicalIndex(path or Config.LEXICAL_INDEX_PATH)
+    return ClientRegistry.get(("lexical_index", str(path or Config.LEXICAL_INDEX_PATH)),
+                              open_index, lambda index: index.close())
+
+
+def get_query_cache(kind):
+    """
+    In-memory LRU/TTL query caches: "embeddings" (query text -> vector)
+    and "results" (query -> records), shared by Assembler and AsyncAssembler
+    """
+    def create():
+        from queryCache import LRUCache
+        if kind == "embeddings":
+            return LRUCache(Config.QUERY_EMBED_CACHE_SIZE, Config.QUERY_EMBED_CACHE_TTL)
+        return LRUCache(Config.QUERY_RESULT_CACHE_SIZE, Config.QUERY_RESULT_CACHE_TTL)
+    return ClientRegistry.get(("query_cache", kind), create, lambda cache: cache.clear())
+
+
+class shared:
+    """
+    Class attribute looked up in the registry on every access, created on the first one:
+        class Assembler:
+            db = shared(get_vector_db)
+    (assigning the attribute replaces it, e.g. with a test double)
+    """
+    def __init__(self, getter):
+        self.getter = getter
+
+    def __get__(self, obj, owner):
+        return self.getter()
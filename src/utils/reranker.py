@@ -0,0 +1,209 @@
+import time
+import numpy as np
+from config import Config
+from registry import ClientRegistry
+from metrics import Metrics, get_logger
+
+###########################################
+# Post-retrieval stage: over-fetched candidates -> top n_results
+#   mmr      maximal marginal relevance on the stored embeddings (NumPy)
+#            score = lambda * relevance - (1 - lambda) * max similarity to the picked ones
+#            chunks of one file whose offsets overlap (CHUNK_OVERLAP) count as near-duplicates
+#   cross    a local cross-encoder (query, chunk) relevance model on CPU
+#   cross+mmr  cross-encoder relevance, MMR diversification
+# the cross-encoder scores candidates in rank order and stops at the time budget,
+# candidates it did not reach keep their vector rank behind the scored ones.
+RERANK_METHOD = Config.RERANK_METHOD
+RERANK_MODEL = Config.RERANK_MODEL
+RERANK_BUDGET_MS = Config.RERANK_BUDGET_MS
+RERANK_BATCH_SIZE = Config.RERANK_BATCH_SIZE
+RERANK_MAX_LENGTH = Config.RERANK_MAX_LENGTH
+MMR_LAMBDA = Config.MMR_LAMBDA
+###########################################
+
+logger = get_logger("reranker")
+
+
+def mmr(relevance, vectors, k, lambda_=MMR_LAMBDA, redundancy=None):
+    """
+    Maximal marginal relevance selection
+    relevance: (n,) relevance of every candidate (higher is better)
+    vectors: (n, dim) candidate embeddings (normalized here)
+    redundancy: optional (n, n) extra similarity in [0, 1], e.g. text overlap;
+                the similarity of a pair is the max of cosine and redundancy
+    Returns:
+        indices of the k picked candidates, in pick order
+    """
+    n = len(relevance)
+    k = min(k, n)
+    if k <= 0:
+        return []
+    relevance = np.asarray(relevance, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+    picked = [int(np.argmax(relevance))]
+    # similarity of every candidate to its closest picked one, updated one pick at a time: O(k * n * dim)
+    closest = vectors @ vectors[picked[0]]
+    if redundancy is not None:
+        closest = np.maximum(closest, redundancy[picked[0]])
+    available = np.ones(n, dtype=bool)
+    available[picked[0]] = False
+    for _ in range(k - 1):
+        scores = lambda_ * relevance - (1 - lambda_) * closest
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        picked.append(best)
+        available[best] = False
+        similarity = vectors @ vectors[best]
+        if redundancy is not None:
+            similarity = np.maximum(similarity, redundancy[best])
+        np.maximum(closest, similarity, out=closest)
+    return picked
+
+
+def overlap_matrix(metadatas):
+    """
+    (n, n) share of the shorter chunk covered by the other one, for chunks of the same
+    file (and page) with start/end offsets; 0 for every other pair
+    """
+    n = len(metadatas)
+    starts = np.full(n, -1, dtype=np.int64)
+    ends = np.full(n, -1, dtype=np.int64)
+    groups = np.full(n, -1, dtype=np.int64)
+    keys = {}
+    for i, meta in enumerate(metadatas or []):
+        meta = meta or {}
+        if "start_offset" in meta and "end_offset" in meta:
+            starts[i], ends[i] = meta["start_offset"], meta["end_offset"]
+            groups[i] = keys.setdefault((meta.get("file_path"), meta.get("page_number")), len(keys))
+    if not keys:
+        return None
+    shared = np.minimum(ends[:, None], ends[None, :]) - np.maximum(starts[:, None], starts[None, :])
+    shorter = np.minimum(ends - starts, (ends - starts)[:, None])
+    same = (groups[:, None] == groups[None, :]) & (groups[:, None] >= 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(same & (shorter > 0), np.clip(shared, 0, None) / shorter, 0.0)
+    np.fill_diagonal(ratio, 1.0)
+    return ratio.astype(np.float32)
+
+
+class CrossEncoder:
+    @staticmethod
+    def score(query, documents, model_id=RERANK_MODEL, budget_ms=None,
+              batch_size=RERANK_BATCH_SIZE, max_length=RERANK_MAX_LENGTH):
+        """
+        Relevance of every document to the query (higher is better), in batches,
+        stopping before a batch would start more than budget_ms after the first one.
+        The budget starts once the model is loaded: the first query does not lose it to the load
+        Returns:
+            float32 array, NaN for the documents not scored in time
+        """
+        tokenizer, run_model = CrossEncoder._get_model(model_id)
+        deadline = time.perf_counter() + budget_ms / 1000 if budget_ms is not None else None
+        scores = np.full(len(documents), np.nan, dtype=np.float32)
+        for start in range(0, len(documents), batch_size):
+            if deadline is not None and time.perf_counter() > deadline:
+                Metrics.inc("rerank_budget_exceeded_total")
+                logger.debug("Rerank budget reached after %d/%d candidates", start, len(documents))
+                break
+            batch = documents[start:start + batch_size]
+            encoded = tokenizer([query] * len(batch), batch, truncation=True, max_length=max_length,
+                                padding=True, return_tensors="np")
+            scores[start:start + len(batch)] = run_model(encoded)
+        return scores
+
+    @staticmethod
+    def _get_model(model_id):
+        """
+        Load (once per process) the tokenizer and a run_model(encoded) -> logits function
+        """
+        def load():
+            import torch
+            from transformers import AutoTokenizer, AutoModelForSequenceClassification
+            logger.info("Loading reranker model %s", model_id)
+            tokenizer = AutoTokenizer.from_pretrained(model_id)
+            model = AutoModelForSequenceClassification.from_pretrained(model_id).eval()
+
+            def run_model(encoded):
+                with torch.inference_mode():
+                    inputs = {k: torch.from_numpy(v) for k, v in encoded.items()}
+                    logits = model(**inputs).logits
+                return logits[:, -1].float().numpy()
+            # the first forward pass is slow (lazy kernel setup), keep it out of the query budgets
+            run_model(tokenizer(["warm up"], ["warm up"], return_tensors="np"))
+            return tokenizer, run_model
+        return ClientRegistry.get(("rerank_model", model_id), load)
+
+
+class Reranker:
+    @staticmethod
+    def rerank(query, query_vector, candidates, n_results=5, method=RERANK_METHOD,
+               budget_ms=RERANK_BUDGET_MS, lambda_=MMR_LAMBDA, model_id=RERANK_MODEL):
+        """
+        Pick n_results out of candidates (RecordBatch from a vector search, best first)
+        query: query text (for the cross-encoder)
+        query_vector: query embedding (for MMR relevance when no cross-encoder runs)
+        method: "mmr", "cross", "cross+mmr" or "none"
+        budget_ms: time allowed for the cross-encoder, None for no limit
+        Returns:
+            RecordBatch of at most n_results records with `scores` set
+        """
+        if not len(candidates) or method == "none":
+            return candidates[:n_results]
+        with Metrics.span("rerank", attrs={"candidates": len(candidates)}, method=method):
+            relevance = Reranker._vector_relevance(query_vector, candidates)
+            if method.startswith("cross"):
+                relevance = Reranker._cross_relevance(query, candidates, relevance, model_id, budget_ms)
+
+            if method.endswith("mmr"):
+                if candidates.embeddings is None:
+                    raise ValueError("MMR needs the candidates' embeddings (query with include embeddings)")
+                order = mmr(relevance, candidates.embeddings, n_results, lambda_,
+                            overlap_matrix(candidates.metadatas))
+            else:
+                order = [int(i) for i in np.argsort(-relevance, kind="stable")[:n_results]]
+            records = candidates.take(order)
+            records.scores = [float(relevance[i]) for i in order]
+        return records
+
+    @staticmethod
+    def _vector_relevance(query_vector, candidates):
+        """
+        Cosine similarity to the query: from the stored embeddings, else from cosine distances,
+        else the rank order
+        """
+        if query_vector is not None and candidates.embeddings is not None:
+            q = np.asarray(query_vector, dtype=np.float32)
+            vectors = candidates.embeddings
+            norms = np.clip(np.linalg.norm(vectors, axis=1) * np.linalg.norm(q), 1e-12, None)
+            return (vectors @ q) / norms
+        if candidates.distances and None not in candidates.distances:
+            return 1.0 - np.asarray(candidates.distances, dtype=np.float32)
+        return -np.arange(len(candidates), dtype=np.float32)
+
+    @staticmethod
+    def _cross_relevance(query, candidates, vector_relevance, model_id, budget_ms):
+        """
+        Cross-encoder scores mapped to (0, 1); candidates left unscored by the budget
+        rank after every scored one, in their vector order
+        """
+        logits = CrossEncoder.score(query, candidates.documents, model_id, budget_ms)
+        scored = ~np.isnan(logits)
+        relevance = np.empty(len(candidates), dtype=np.float32)
+        relevance[scored] = 1 / (1 + np.exp(-logits[scored]))
+        if not scored.all():
+            floor = relevance[scored].min() if scored.any() else 0.0
+            rest = np.flatnonzero(~scored)
+            ranked = rest[np.argsort(-vector_relevance[rest], kind="stable")]
+            relevance[ranked] = floor - 1 - np.arange(len(ranked), dtype=np.float32) / len(ranked)
+        return relevance
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    base = rng.standard_normal((10, 64)).astype(np.float32)
+    # every vector twice: MMR should not pick both copies
+    vectors = np.concatenate([base, base + 0.01])
+    relevance = vectors @ base[0]
+    print(mmr(relevance, vectors, 5))
@@ -0,0 +1,387 @@
+import os
+import re
+import json
+import uuid
+import zlib
+import threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional
+from config import Config
+from registry import ClientRegistry, get_collection_db
+from vectorDatabase import empty_results
+from metrics import Metrics, get_logger
+
+###########################################
+# The knowledge base split over several collections (Config.SHARD_BY)
+#   "hash"    shard = crc32(record id) % SHARD_COUNT, id lookups / deletes go to one shard
+#   "subdir"  one shard per top-level data directory (C1, C2, ...), created on first write;
+#             file_path filters ($eq / $in, inside $and / $or too) only visit their shards
+# every shard is a get_collection_db (float32 or quantized), in DB_PATH as "<name>.<shard>"
+# or, with SHARD_PATHS, in DB_PATH/shards/<shard> with a chromadb client of its own.
+# queries run on the shards in parallel (SHARD_WORKERS threads), every shard returns
+# its top n and the lists are merged by distance: the global top n is among them.
+# the layout (mode, count, shards) is saved in <name>.shards.json and checked on open.
+DB_PATH = Config.DB_PATH
+SHARD_BY = Config.SHARD_BY
+SHARD_COUNT = Config.SHARD_COUNT
+SHARD_PATHS = Config.SHARD_PATHS
+SHARD_WORKERS = Config.SHARD_WORKERS
+###########################################
+
+logger = get_logger("shardedDatabase")
+
+_NAME = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,62}")
+
+
+def subdir_of(file_path):
+    """
+    Top-level directory of a relative path ("" for files directly in the data dir)
+    """
+    head, sep, _ = str(file_path).replace("\\", "/").partition("/")
+    return head if sep else ""
+
+
+def _slug(key):
+    # chromadb names: [a-zA-Z0-9._-], starting / ending alphanumeric
+    return key if _NAME.fullmatch(key) and key[-1].isalnum() else f"x{zlib.crc32(key.encode('utf-8')):08x}"
+
+
+class ShardedVectorDatabase:
+    def __init__(self, collection_name: str = "rag_knowledge_base", path=DB_PATH,
+                 by=SHARD_BY, count=SHARD_COUNT, separate_paths=SHARD_PATHS):
+        """
+        Open the shards of collection_name, the saved layout wins over a different
+        count / separate_paths only if they match (otherwise ValueError)
+        """
+        if by not in ("hash", "subdir"):
+            raise ValueError(f"Unknown shard mode: {by}")
+        self.path = str(path)
+        self.name = collection_name
+        self.by = by
+        self._lock = threading.Lock()
+        self._layout_path = os.path.join(self.path, f"{collection_name}.shards.json")
+        os.makedirs(self.path, exist_ok=True)
+
+        layout = self._read_layout()
+        expected = {"by": by, "count": count if by == "hash" else None, "separate_paths": bool(separate_paths)}
+        if layout is None:
+            layout = dict(expected, shards=[f"{i:02d}" for i in range(count)] if by == "hash" else [])
+            self._write_layout(layout)
+        elif any(layout[key] != value for key, value in expected.items()):
+            raise ValueError(f"{self._layout_path} was created with {layout}, not {expected}: "
+                             "export the collection and import it into a new path to re-shard")
+        self.count_shards = layout["count"]
+        self.separate_paths = layout["separate_paths"]
+        self.shards = {key: self._open(key) for key in layout["shards"]}
+
+    @property
+    def version(self):
+        # bumped by any shard write, keeps the query result cache keys valid
+        return sum(shard.version for shard in list(self.shards.values()))
+
+    def add_documents(self,
+                      texts: List[str],
+                      embeddings,
+                      metadatas: Optional[List[Dict[str, Any]]] = None,
+                      ids: Optional[List[str]] = None):
+        """
+        Split the batch by shard and upsert the parts in parallel
+        Returns:
+            True if every part was upserted (upserts are idempotent, retry the whole batch)
+        """
+        ids = list(ids) if ids else [str(uuid.uuid4()) for _ in range(len(texts))]
+        if metadatas is None:
+            metadatas = [{"source": "default"} for _ in range(len(texts))]
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        parts = {}
+        for i, (record_id, metadata) in enumerate(zip(ids, metadatas)):
+            parts.setdefault(self._shard_of(record_id, metadata), []).append(i)
+
+        def write(key):
+            rows = parts[key]
+            return self._shard(key).add_documents(
+                [texts[i] for i in rows], embeddings[rows], [metadatas[i] for i in rows], [ids[i] for i in rows]
+            )
+        return all(self._fan_out(write, list(parts)))
+
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Replace the metadata of existing documents in the shards holding them
+        Returns:
+            True if every part was updated
+        """
+        parts = {}
+        for record_id, metadata in zip(ids, metadatas):
+            parts.setdefault(self._shard_of(record_id, metadata), []).append((record_id, metadata))
+
+        def update(key):
+            if key not in self.shards:
+                return False
+            rows = parts[key]
+            return self.shards[key].update_metadatas([row[0] for row in rows], [row[1] for row in rows])
+        return all(self._fan_out(update, list(parts)))
+
+    def query_by_metadata(self, where: Dict[str, Any], n_results: int = 5):
+        """
+        Query documents based on metadata filtering (first n_results over the shards it may hit)
+        """
+        results = self._fan_out(lambda key: self.shards[key].query_by_metadata(where, n_results), self._route(where))
+        return self._concat(results, ("documents", "metadatas"), limit=n_results)
+
+    def iter_pages(self, where: Dict[str, Any] = None, page_size: int = 1000,
+                   include: List[str] = ("metadatas",)):
+        """
+        VectorDatabase.iter_pages over the shards one after another
+        """
+        for key in self._route(where):
+            yield from self.shards[key].iter_pages(where, page_size, include)
+
+    def get_by_ids(self, ids: List[str], include: List[str] = ("documents", "metadatas")):
+        """
+        Fetch documents by id from the shards holding them (order not kept)
+        """
+        groups = self._id_groups(ids)
+        results = self._fan_out(lambda key: self.shards[key].get_by_ids(groups[key], include), list(groups))
+        return self._concat(results, include)
+
+    def query_with_vector(self, query_embedding, n_results: int = 5, where: Dict[str, Any] = None,
+                          include: List[str] = ("documents", "metadatas", "distances")):
+        """
+        Query similar documents based on **one** query vector, every shard searched in parallel
+        """
+        return self.query_with_vectors([query_embedding], n_results, where, include=include)
+
+    def query_with_vectors(self, query_embeddings, n_results: int = 5, where: Dict[str, Any] = None,
+                           batch_size: int = 256, include: List[str] = ("documents", "metadatas", "distances")):
+        """
+        Per-shard top n_results of every query merged into the global top n_results by distance
+        Returns:
+            A dictionary of per-query lists, same layout as chromadb
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        if not query_embeddings.size:
+            return empty_results(include)
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings[None, :]
+        keys = self._route(where)
+        # distances are needed to merge, dropped again if the caller did not ask for them
+        fields = list(dict.fromkeys(list(include) + ["distances"]))
+        with Metrics.span("db_fanout", attrs={"queries": len(query_embeddings), "shards": len(keys)}, by=self.by):
+            results = self._fan_out(
+                lambda key: self.shards[key].query_with_vectors(query_embeddings, n_results, where,
+                                                                batch_size=batch_size, include=fields), keys
+            )
+        merged = {"ids": []}
+        merged.update((key, []) for key in include)
+        for q in range(len(query_embeddings)):
+            hits = sorted(
+                (distance, s, pos)
+                for s, result in enumerate(results)
+                for pos, distance in enumerate(result["distances"][q])
+            )[:n_results]
+            merged["ids"].append([results[s]["ids"][q][pos] for _, s, pos in hits])
+            for key in include:
+                picked = [results[s][key][q][pos] for _, s, pos in hits]
+                merged[key].append(np.asarray(picked, dtype=np.float32).reshape(len(hits), -1)
+                                   if key == "embeddings" else picked)
+        return merged
+
+    def get_ids(self, where: Dict[str, Any] = None):
+        """
+        Ids of the documents matching the filter, nothing else is fetched
+        """
+        results = self._fan_out(lambda key: self.shards[key].get_ids(where), self._route(where))
+        return [record_id for ids in results for record_id in ids]
+
+    def delete_documents(self, where: Dict[str, Any]):
+        """
+        Delete documents matching the given metadata filter
+        Returns:
+            number of deleted documents
+        """
+        return sum(self._fan_out(lambda key: self.shards[key].delete_documents(where), self._route(where)))
+
+    def delete_by_ids(self, ids: List[str], batch_size: int = 5000):
+        """
+        Delete documents by id, ids that don't exist are ignored
+        Returns:
+            number of documents that existed and were deleted
+        """
+        groups = self._id_groups(ids)
+        return sum(self._fan_out(lambda key: self.shards[key].delete_by_ids(groups[key], batch_size), list(groups)))
+
+    def delete_by_files(self, file_paths: List[str], batch_size: int = 500):
+        """
+        Delete every document of many files (relative paths)
+        Returns:
+            number of deleted documents
+        """
+        file_paths = list(file_paths)
+        if self.by == "hash":
+            groups = {key: file_paths for key in self.shards}
+        else:
+            groups = {}
+            for file_path in file_paths:
+                key = subdir_of(file_path)
+                if key in self.shards:
+                    groups.setdefault(key, []).append(file_path)
+        return sum(self._fan_out(lambda key: self.shards[key].delete_by_files(groups[key], batch_size), list(groups)))
+
+    def _clear_collection(self):
+        """
+        Delete all documents in every shard (the shards themselves stay)
+        """
+        self._fan_out(lambda key: self.shards[key]._clear_collection(), list(self.shards))
+
+    def count(self):
+        """
+        Return the total number of documents over the shards
+        """
+        return sum(self._fan_out(lambda key: self.shards[key].count(), list(self.shards)))
+
+    def shard_counts(self):
+        """
+        Documents per shard, e.g. {'C1': 1200, 'C2': 300}
+        """
+        keys = list(self.shards)
+        return dict(zip(keys, self._fan_out(lambda key: self.shards[key].count(), keys)))
+
+    def peek(self, limit: int = 5):
+        """
+        Peek at a few documents (taken from the shards in order)
+        """
+        results = [self.shards[key].peek(limit) for key in self.shards]
+        return self._concat(results, ("documents", "metadatas"), limit=limit)
+
+    # --- internals ---
+
+    def _shard_of(self, record_id, metadata):
+        if self.by == "hash":
+            return f"{zlib.crc32(record_id.encode('utf-8')) % self.count_shards:02d}"
+        return subdir_of((metadata or {}).get("file_path", ""))
+
+    def _id_groups(self, ids):
+        ids = list(ids)
+        if self.by == "subdir":
+            # the id does not tell the directory: ask every shard
+            return {key: ids for key in self.shards} if ids else {}
+        groups = {}
+        for record_id in ids:
+            groups.setdefault(self._shard_of(record_id, None), []).append(record_id)
+        return groups
+
+    def _route(self, where):
+        """
+        Shards a metadata filter can match: every shard unless it pins file_path (subdir mode)
+        """
+        keys = self._filter_subdirs(where) if self.by == "subdir" else None
+        if keys is None:
+            return list(self.shards)
+        Metrics.inc("shard_routed_total", by=self.by)
+        return [key for key in self.shards if key in keys]
+
+    @staticmethod
+    def _filter_subdirs(where):
+        """
+        The set of subdirs `where` is limited to, None if it may match any
+        """
+        if not where:
+            return None
+        found = []
+        for field, condition in where.items():
+            if field in ("$and", "$or"):
+                parts = [ShardedVectorDatabase._filter_subdirs(clause) for clause in condition]
+                if field == "$or":
+                    if any(part is None for part in parts):
+                        continue
+                    found.append(set().union(*parts))
+                else:
+                    found.extend(part for part in parts if part is not None)
+            elif field == "file_path":
+                if isinstance(condition, str):
+                    found.append({subdir_of(condition)})
+                elif isinstance(condition, dict) and "$eq" in condition:
+                    found.append({subdir_of(condition["$eq"])})
+                elif isinstance(condition, dict) and "$in" in condition:
+                    found.append({subdir_of(value) for value in condition["$in"]})
+        # several keys at one level are and-ed
+        return set.intersection(*found) if found else None
+
+    def _shard(self, key):
+        """
+        The shard of key, created (and added to the layout) on first use
+        """
+        shard = self.shards.get(key)
+        if shard is not None:
+            return shard
+        with self._lock:
+            if key not in self.shards:
+                shard = self._open(key)
+                layout = self._read_layout()
+                if key not in layout["shards"]:
+                    layout["shards"].append(key)
+                    self._write_layout(layout)
+                self.shards = {**self.shards, key: shard}
+                logger.info("Created shard %s of %s", key or "<root>", self.name)
+            return self.shards[key]
+
+    def _open(self, key):
+        if self.separate_paths:
+            return get_collection_db(os.path.join(self.path, "shards", _slug(key)), self.name)
+        return get_collection_db(self.path, f"{self.name}.{_slug(key)}")
+
+    def _read_layout(self):
+        if not os.path.exists(self._layout_path):
+            return None
+        with open(self._layout_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_layout(self, layout):
+        tmp = self._layout_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(layout, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, self._layout_path)
+
+    @staticmethod
+    def _fan_out(fn, keys):
+        """
+        fn(key) for every key, in the shard pool when there is more than one
+        """
+        if len(keys) <= 1:
+            return [fn(key) for key in keys]
+        pool = ClientRegistry.get(
+            ("shard_executor", SHARD_WORKERS),
+            lambda: ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="eco_rag-shard"),
+            lambda pool: pool.shutdown(wait=False),
+        )
+        return list(pool.map(fn, keys))
+
+    @staticmethod
+    def _concat(results, include, limit=None):
+        """
+        chromadb get() results of several shards as one
+        """
+        merged = {"ids": []}
+        merged.update((key, []) for key in include)
+        for result in results:
+            if not result["ids"]:
+                continue
+            merged["ids"].extend(result["ids"])
+            for key in include:
+                if key == "embeddings":
+                    merged[key].append(np.asarray(result[key], dtype=np.float32).reshape(len(result["ids"]), -1))
+                else:
+                    merged[key].extend(result[key])
+        if "embeddings" in include:
+            merged["embeddings"] = np.concatenate(merged["embeddings"]) if merged["embeddings"] \
+                else np.empty((0, 0), dtype=np.float32)
+        if limit is not None:
+            merged = {key: value[:limit] for key, value in merged.items()}
+        return merged
+
+
+if __name__ == "__main__":
+    db = ShardedVectorDatabase(by="subdir")
+    print(db.shard_counts())
+    print(ShardedVectorDatabase._filter_subdirs({"$or": [{"file_path": "C1/a.md"}, {"file_path": {"$in": ["C2/b.md"]}}]}))
@@ -0,0 +1,44 @@
+from recordBatch import RecordBatch
+
+###########################################
+# One file being synced (Assembler.sync_file, AsyncAssembler.sync_file, the ingest pipeline)
+# Assembler._changed_groups fills it while diffing the file against the manifest,
+# Assembler._commit_chunks empties it into the manifest, the one commit routine of both kinds:
+#   held files      every record is written first, then one commit for the whole file
+#   row-streamed    (write_through: csv, xlsx, json...) a commit per embedded group,
+#                   the state below stays a group or two long whatever the size of the file
+###########################################
+
+
+class SyncJob:
+    __slots__ = ("filepath", "rel_path", "force", "mtime_ns", "size", "content_hash", "write_through",
+                 "chunks", "records", "n_chunks", "started", "inflight", "local", "links", "rows", "moved",
+                 "stats")
+
+    def __init__(self, filepath, rel_path, force, mtime_ns, size, content_hash, write_through):
+        self.filepath = filepath
+        self.rel_path = rel_path
+        self.force = force
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.content_hash = content_hash
+        self.write_through = write_through
+        # (chunk, attributes) of the file, set by the caller (a list, or a generator for row-streamed files)
+        self.chunks = None
+        # embedded records not committed yet (held files)
+        self.records = RecordBatch.empty()
+        self.n_chunks = 0
+        # the manifest entry is marked as being rewritten (IngestManifest.begin_file)
+        self.started = False
+        # changed chunks being embedded: {chunk_index: (chunk_hash, position, signature, old manifest row)}
+        self.inflight = {}
+        # their signatures (dedup.DedupIndex, chunk index as record id): duplicates inside the file
+        self.local = None
+        # duplicates to link instead of embedding:
+        # {chunk_index: (record_id, kind, signature, chunk_hash, position, old manifest row, chunk index in flight)}
+        self.links = {}
+        # manifest rows ready to commit: (chunk_index, chunk_hash, record_id, position)
+        self.rows = []
+        # unchanged chunks whose offsets moved: {record_id: position}
+        self.moved = {}
+        self.stats = dict.fromkeys(("changed", "embedded", "linked", "moved", "deleted", "failed"), 0)
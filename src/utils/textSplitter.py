@@ -0,0 +1,259 @@
+import re
+from bisect import bisect_left, bisect_right
+
+###########################################
+# Native text splitter, one forward sweep over the text
+# split points are ranked:
+#   0 markdown heading   1 blank line   2 line break
+#   3 sentence end       4 clause       5 whitespace    (6 = hard cut)
+# each chunk is cut at the last split point of the strongest level found
+# in the second half of its window. Headings and blank lines are collected
+# up front by regex (they are few), the finer levels are looked up inside
+# the window with str.rfind / str.find, no python loop per word.
+# Chunks carry (start, end) offsets and, for markdown, their heading path.
+###########################################
+
+HEADING, PARAGRAPH, LINE, SENTENCE, CLAUSE, SPACE, HARD = range(7)
+
+# (separator, split offset inside it) per level: split *after* the punctuation,
+# so a sentence keeps its full stop instead of the next chunk starting with it.
+# a latin "." only ends a sentence before whitespace (keeps 3.14, v1.2, urls whole)
+_SEPARATORS = {
+    LINE: [("\n", 1)],
+    SENTENCE: [(p, 1) for p in "。！？；…!?;"] + [(". ", 1), (".\n", 1)],
+    CLAUSE: [(p, 1) for p in "，、："] + [(", ", 1), (": ", 1)],
+    SPACE: [(" ", 1), ("\t", 1), ("\u3000", 1)],
+}
+# closing quotes / brackets stay with the sentence they close
+_CLOSING = set("”’」』）)]\"'")
+
+# both patterns start with "\n" so the regex engine can skip ahead quickly.
+# a blank line only consumes its first "\n" (split point after the second one)
+_BLANK_LINE_RE = re.compile(r"\n[ \t\u3000]*(?=\n)")
+_HEADING_OR_FENCE_RE = re.compile(r"\n(?:(?P<heading>#{1,6}[ \t][^\n]*)|(?P<fence>```|~~~))")
+_HEADING_RE = re.compile(r"(#{1,6})[ \t]+(.*?)[ \t#]*$")
+
+# rough token boundaries for token sizing without a tokenizer:
+# every CJK character, every latin word / number, every other symbol
+_APPROX_TOKEN_RE = re.compile(
+    r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]|[^\W_]+|[^\s\w]"
+)
+
+
+def approx_token_starts(text):
+    """
+    Start offsets of approximate tokens (one per CJK character / word / symbol)
+    """
+    return [m.start() for m in _APPROX_TOKEN_RE.finditer(text)]
+
+
+class TextSplitter:
+    def __init__(self, chunk_size=1000, chunk_overlap=200, markdown=False, token_starts=None):
+        """
+        chunk_size / chunk_overlap: in characters, or in tokens if token_starts is given
+        markdown: prefer splitting before headings and track heading paths
+        token_starts: function text -> sorted start offsets of its tokens
+                      (approx_token_starts, or a tokenizer's offset mapping)
+        """
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.markdown = markdown
+        self.token_starts = token_starts
+
+    def split_text(self, text):
+        return [chunk for chunk, _ in self.iter_spans(text)]
+
+    def iter_spans(self, text):
+        """
+        Yields (chunk, attributes) lazily, attributes like
+            {"start_offset": 120, "end_offset": 980, "heading_path": "Chapter 1 > 1.2 Rewards"}
+        text[start_offset:end_offset] == chunk
+        """
+        units = _Units(text, self.token_starts)
+        if units.advance(0, self.chunk_size) >= len(text):
+            # fits in one chunk, nothing to scan
+            yield from self._whole(text)
+            return
+        blocks, headings = self._scan(text)
+        heading_pos = [pos for pos, _ in headings]
+        size = self.chunk_size
+        start, n = 0, len(text)
+
+        while start < n:
+            limit = units.advance(start, size)
+            if limit >= n:
+                end, level = n, HEADING
+            else:
+                end, level = self._cut(text, blocks, start, units.advance(start, size // 2), limit)
+
+            chunk_start, chunk_end = _strip(text, start, end)
+            if chunk_start < chunk_end:
+                attributes = {"start_offset": chunk_start, "end_offset": chunk_end}
+                if headings:
+                    i = bisect_right(heading_pos, chunk_start) - 1
+                    if i >= 0 and headings[i][1]:
+                        attributes["heading_path"] = headings[i][1]
+                yield text[chunk_start:chunk_end], attributes
+
+            if end >= n:
+                return
+            start = self._next_start(text, blocks, heading_pos, units, start, end, level)
+
+    # --- internals ---
+
+    def _whole(self, text):
+        start, end = _strip(text, 0, len(text))
+        if start == end:
+            return
+        attributes = {"start_offset": start, "end_offset": end}
+        if self.markdown:
+            # the heading path at the start of the text is its first line, if that is a heading
+            m = _HEADING_RE.match(text, start, text.find("\n", start) % (len(text) + 1))
+            if m and m.group(2):
+                attributes["heading_path"] = m.group(2)
+        yield text[start:end], attributes
+
+    def _scan(self, text):
+        """
+        Split points of the two coarse levels (sorted positions)
+        and (position, heading path) of every markdown heading
+        """
+        blocks = {HEADING: [], PARAGRAPH: [m.end() + 1 for m in _BLANK_LINE_RE.finditer(text)]}
+        headings = []
+        if not self.markdown:
+            return blocks, headings
+        titles, levels, in_fence = [], [], False
+        # prefixed with "\n" so a heading on the first line is found too,
+        # positions in the prefixed text are one past the real ones
+        for m in _HEADING_OR_FENCE_RE.finditer("\n" + text):
+            if m.lastgroup == "fence":
+                in_fence = not in_fence
+                continue
+            if in_fence:
+                continue
+            hashes, title = _HEADING_RE.match(m.group("heading")).groups()
+            while levels and levels[-1] >= len(hashes):
+                levels.pop()
+                titles.pop()
+            levels.append(len(hashes))
+            titles.append(title)
+            if m.start():
+                blocks[HEADING].append(m.start())
+            headings.append((m.start(), " > ".join(filter(None, titles))))
+        return blocks, headings
+
+    def _cut(self, text, blocks, start, half, limit):
+        """
+        End of the chunk starting at start: the last split point of the strongest
+        level in [half, limit], else the last split point at all, else a hard cut at limit
+        """
+        best = None
+        for level in range(HEADING, HARD):
+            point = _last_point(text, blocks, level, start, limit)
+            if point is None:
+                continue
+            if point >= half:
+                return point, level
+            if best is None or point > best[0]:
+                best = (point, level)
+        return best or (limit, HARD)
+
+    def _next_start(self, text, blocks, heading_pos, units, start, end, level):
+        """
+        Start of the next chunk: back from end by up to chunk_overlap, on a split point
+        at least as strong as the cut (whole sentences after a sentence cut...).
+        No overlap after a heading cut and never back into the previous section.
+        """
+        if level == HEADING or not self.chunk_overlap:
+            return end
+        floor = max(start + 1, units.retreat(end, self.chunk_overlap))
+        i = bisect_right(heading_pos, end - 1) - 1
+        if i >= 0:
+            floor = max(floor, heading_pos[i])
+        best = end
+        for lv in range(PARAGRAPH, min(level, SPACE) + 1):
+            point = _first_point(text, blocks, lv, floor, best)
+            if point is not None:
+                best = point
+        if level == HARD and best == end:
+            best = floor
+        return best
+
+
+def _last_point(text, blocks, level, lo, hi):
+    """
+    Last split point of level in (lo, hi], None if there is none
+    """
+    if level in blocks:
+        points = blocks[level]
+        i = bisect_right(points, hi) - 1
+        return points[i] if i >= 0 and points[i] > lo else None
+    best = -1
+    for sep, offset in _SEPARATORS[level]:
+        p = text.rfind(sep, lo, hi)
+        if p >= 0 and p + offset > best:
+            best = p + offset
+    if best <= lo:
+        return None
+    if level == SENTENCE:
+        while best < hi and text[best] in _CLOSING:
+            best += 1
+    return best
+
+
+def _first_point(text, blocks, level, lo, hi):
+    """
+    First split point of level in [lo, hi), None if there is none
+    """
+    if level in blocks:
+        points = blocks[level]
+        i = bisect_left(points, lo)
+        return points[i] if i < len(points) and points[i] < hi else None
+    best = hi
+    for sep, offset in _SEPARATORS[level]:
+        p = text.find(sep, lo, best)
+        if p >= 0 and p + offset < best:
+            best = p + offset
+    if best >= hi:
+        return None
+    if level == SENTENCE:
+        while best < hi and text[best] in _CLOSING:
+            best += 1
+    return best
+
+
+class _Units:
+    """
+    Position arithmetic in characters or in tokens
+    """
+    def __init__(self, text, token_starts=None):
+        self.n = len(text)
+        self.starts = token_starts(text) if token_starts else None
+
+    def advance(self, pos, amount):
+        """
+        Furthest position p so that text[pos:p] holds at most `amount` units
+        """
+        if self.starts is None:
+            return min(pos + amount, self.n)
+        i = bisect_left(self.starts, pos) + amount
+        return self.starts[i] if i < len(self.starts) else self.n
+
+    def retreat(self, pos, amount):
+        """
+        Earliest position p so that text[p:pos] holds at most `amount` units
+        """
+        if self.starts is None:
+            return max(pos - amount, 0)
+        i = bisect_left(self.starts, pos) - amount
+        return self.starts[i] if i > 0 else 0
+
+
+def _strip(text, start, end):
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    return start, end
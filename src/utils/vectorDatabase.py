@@ -1,8 +1,9 @@
-import chromadb
 import uuid
+import numpy as np
 from typing import List, Dict, Any, Optional
 from config import Config
-import os
+from registry import get_chroma_client
+from metrics import Metrics, get_logger
 
 ###########################################
 # We use chromadb for vector storage
@@ -10,15 +11,28 @@ import os
 DB_PATH = Config.DB_PATH
 ###########################################
 
+logger = get_logger("vectorDatabase")
+
+
+def empty_results(include):
+    """
+    query() layout of zero queries
+    """
+    results = {"ids": []}
+    results.update((key, []) for key in include)
+    return results
+
+
 class VectorDatabase:
-    def __init__(self, collection_name: str = "rag_knowledge_base"):
+    def __init__(self, collection_name: str = "rag_knowledge_base", path=DB_PATH):
         """
         Initialize connection to ChromaDB vector database
+        The chromadb client of a path is shared (see registry.get_vector_db to share the whole object)
         """
-        if not os.path.exists(DB_PATH):
-            os.makedirs(DB_PATH)
-        print(f"Connecting to VectorDB at: {DB_PATH}")
-        self.client = chromadb.PersistentClient(path=str(DB_PATH))
+        self.path = str(path)
+        self.client = get_chroma_client(self.path)
+        # bumped on every write, lets callers invalidate cached query results
+        self.version = 0
         
         # metadata={"hnsw:space": "cosine"} for cosine similarity
         self.collection = self.client.get_or_create_collection(
@@ -33,6 +47,8 @@ class VectorDatabase:
                       ids: Optional[List[str]] = None):
         """
         Add documents to the vector database
+        Returns:
+            True if the upsert succeeded
         """
         if not ids:
             # If no IDs are provided, generate random UUIDs
@@ -43,15 +59,37 @@ class VectorDatabase:
             metadatas = [{"source":"default"} for _ in range(len(texts))]
 
         try:
-            self.collection.upsert(
-                documents=texts,
-                embeddings=embeddings,
-                metadatas=metadatas,
-                ids=ids
-            )
-            print(f"Successfully upserted {len(texts)} documents to collection.")
+            with Metrics.span("db_upsert", attrs={"documents": len(texts)}, collection=self.collection.name):
+                self.collection.upsert(
+                    documents=texts,
+                    embeddings=embeddings,
+                    metadatas=metadatas,
+                    ids=ids
+                )
+            self.version += 1
+            Metrics.inc("db_upserted_total", len(texts), collection=self.collection.name)
+            logger.debug("Successfully upserted %d documents to collection.", len(texts))
+            return True
+        except Exception as e:
+            logger.error("Error upserting documents: %s", e)
+            return False
+    
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """
+        Replace the metadata of existing documents, documents and embeddings stay
+        Returns:
+            True if the update succeeded
+        """
+        if not ids:
+            return True
+        try:
+            with Metrics.span("db_update", attrs={"documents": len(ids)}, collection=self.collection.name):
+                self.collection.update(ids=list(ids), metadatas=list(metadatas))
         except Exception as e:
-            print(f"Error upserting documents: {e}")
+            logger.error("Error updating metadata: %s", e)
+            return False
+        self.version += 1
+        return True
     
     def query_by_metadata(self, where: Dict[str, Any], n_results: int = 5):
         """
@@ -63,49 +101,162 @@ class VectorDatabase:
             A dictionary with query results, no distance included
             like {'document_ids': [...], 'documents': [...], 'metadatas': [...]
         """
-        results = self.collection.get(
-            where=where,
-            limit=n_results
-        )
+        with Metrics.span("db_query", kind="metadata", collection=self.collection.name):
+            results = self.collection.get(
+                where=where,
+                limit=n_results
+            )
         return results
     
-    def query_with_vector(self, query_embedding: List[float], n_results: int = 5, where: Dict[str, Any] = None):
+    def iter_pages(self, where: Dict[str, Any] = None, page_size: int = 1000,
+                   include: List[str] = ("metadatas",)):
+        """
+        Walk the collection (or the documents matching `where`) page by page,
+        only the ids and one page of records are held in memory at a time
+        Args:
+            where: Filter conditions, None for the whole collection
+            page_size: documents fetched per chromadb call
+            include: fields fetched besides ids, any of "documents", "metadatas", "embeddings"
+                     (leave documents / embeddings out unless you need them, [] for ids only)
+        Yields:
+            chromadb get() results like {'ids': [...], 'metadatas': [...], ...}
+        The matching ids are read first, ids only, then fetched page_size at a time: writes made
+        while iterating neither shift nor repeat pages (records deleted meanwhile are left out,
+        records added meanwhile are not walked)
+        """
+        ids = self.get_ids(where)
+        for start in range(0, len(ids), page_size):
+            page = self.get_by_ids(ids[start:start + page_size], include)
+            if page["ids"]:
+                yield page
+
+    def get_by_ids(self, ids: List[str], include: List[str] = ("documents", "metadatas")):
+        """
+        Fetch documents by id (no distance included)
+        """
+        if not ids:
+            return {"ids": [], **{key: [] for key in include}}
+        return self.collection.get(ids=list(ids), include=list(include))
+    
+    def query_with_vector(self, query_embedding: List[float], n_results: int = 5, where: Dict[str, Any] = None,
+                          include: List[str] = ("documents", "metadatas", "distances")):
         """
         Query similar documents based on **one** query vector
         Args:
             query_embedding: The embedding vector to query
             n_results: Number of similar chunks to retrieve
             where: Filter conditions, e.g., {"source_type": "pdf"}
+            include: fields to return, add "embeddings" to get the stored vectors (e.g. for MMR)
         Returns:
             A dictionary with query results
             like {'document_ids': [...], 'documents': [...], 'metadatas': [...], 'distances': [...]}
         """
         # since the query support list of vectors but we only need one
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=where 
-        )
+        with Metrics.span("db_query", kind="vector", collection=self.collection.name):
+            results = self.collection.query(
+                query_embeddings=[query_embedding],
+                n_results=n_results,
+                where=where,
+                include=list(include)
+            )
         return results
     
+    def query_with_vectors(self, query_embeddings, n_results: int = 5, where: Dict[str, Any] = None,
+                           batch_size: int = 256, include: List[str] = ("documents", "metadatas", "distances")):
+        """
+        Query similar documents for many query vectors at once
+        Args:
+            query_embeddings: list of vectors or a 2D numpy array
+            n_results: Number of similar chunks to retrieve per query
+            where: Filter conditions, applied to every query
+            batch_size: query vectors sent per chromadb call
+            include: fields to return, as in query_with_vector
+        Returns:
+            A dictionary of per-query lists, same layout as chromadb
+            like {'ids': [[...], [...]], 'documents': [[...], [...]], 'metadatas': ..., 'distances': ...}
+            use RAGRecord.get_records_per_query to turn it into records
+        """
+        query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+        if not query_embeddings.size:
+            return empty_results(include)
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings[None, :]
+        merged = {"ids": []}
+        merged.update((key, []) for key in include)
+        for i in range(0, len(query_embeddings), batch_size):
+            with Metrics.span("db_query", attrs={"queries": len(query_embeddings[i:i + batch_size])},
+                              kind="vectors", collection=self.collection.name):
+                results = self.collection.query(
+                    query_embeddings=query_embeddings[i:i + batch_size],
+                    n_results=n_results,
+                    where=where,
+                    include=list(include)
+                )
+            for key in merged:
+                merged[key].extend(results.get(key) or [])
+        return merged
     
+    def get_ids(self, where: Dict[str, Any] = None):
+        """
+        Ids of the documents matching the filter, nothing else is fetched (one snapshot, no paging)
+        """
+        return self.collection.get(where=where, include=[])["ids"]
+
     def delete_documents(self, where: Dict[str, Any]):
         """
         Delete documents matching the given metadata filter
+        Returns:
+            number of deleted documents
         """
         try:
-            # Get the documents that match the condition to count them
-            results = self.collection.get(where=where)
-            count = len(results['ids']) if results and 'ids' in results else 0
-            
-            if count > 0:
-                self.collection.delete(where=where)
-                print(f"Successfully deleted {count} documents matching {where}.")
-            else:
-                print(f"No documents found matching {where}.")
-                
+            # only ids are fetched to count them, then deleted by id
+            ids = self.get_ids(where)
+            if ids:
+                count = self.delete_by_ids(ids)
+                logger.debug("Successfully deleted %d documents matching %s.", count, where)
+                return count
+            logger.debug("No documents found matching %s.", where)
         except Exception as e:
-            print(f"Error deleting documents: {e}")
+            logger.error("Error deleting documents: %s", e)
+        return 0
+
+    def delete_by_ids(self, ids: List[str], batch_size: int = 5000):
+        """
+        Delete documents by id, ids that don't exist are ignored
+        Returns:
+            number of documents that existed and were deleted
+        """
+        count = 0
+        ids = list(dict.fromkeys(ids))   # chromadb rejects repeated ids
+        try:
+            for i in range(0, len(ids), batch_size):
+                with Metrics.span("db_delete", collection=self.collection.name):
+                    existing = self.collection.get(ids=ids[i:i + batch_size], include=[])["ids"]
+                    if existing:
+                        self.collection.delete(ids=existing)
+                count += len(existing)
+            if count:
+                self.version += 1
+                logger.debug("Successfully deleted %d documents by id.", count)
+        except Exception as e:
+            if count:
+                self.version += 1
+            logger.error("Error deleting documents: %s", e)
+        Metrics.inc("db_deleted_total", count, collection=self.collection.name)
+        return count
+
+    def delete_by_files(self, file_paths: List[str], batch_size: int = 500):
+        """
+        Delete every document of many files (relative paths) with a few $in filters
+        Returns:
+            number of deleted documents
+        """
+        file_paths = list(file_paths)
+        count = 0
+        for i in range(0, len(file_paths), batch_size):
+            ids = self.get_ids({"file_path": {"$in": file_paths[i:i + batch_size]}})
+            count += self.delete_by_ids(ids)
+        return count
 
     def _clear_collection(self):
         """
@@ -118,9 +269,10 @@ class VectorDatabase:
                 name=collection_name,
                 metadata={"hnsw:space": "cosine"} 
             )
-            print("Collection cleared.")
+            self.version += 1
+            logger.info("Collection %s cleared.", collection_name)
         except Exception as e:
-            print(f"Error clearing collection: {e}")
+            logger.error("Error clearing collection: %s", e)
 
     def count(self):
         """
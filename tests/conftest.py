@@ -0,0 +1,46 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, "src"), os.path.join(ROOT, "src", "utils")]
+
+from config import Config   # noqa: E402
+
+# every store of the test session lives in one temporary directory,
+# embeddings come from the offline hashing model (no network)
+TMP_DIR = tempfile.mkdtemp(prefix="eco_rag-tests-")
+Config.EMBEDDING_MODEL = "hash:64"
+Config.DB_PATH = os.path.join(TMP_DIR, "db")
+Config.CACHE_DIR = os.path.join(TMP_DIR, "cache")
+Config.EMBED_CACHE_PATH = os.path.join(TMP_DIR, "cache", "embeddings.sqlite3")
+Config.MANIFEST_PATH = os.path.join(TMP_DIR, "cache", "manifest.sqlite3")
+Config.LEXICAL_INDEX_PATH = os.path.join(TMP_DIR, "cache", "bm25.sqlite3")
+Config.DEDUP_INDEX_PATH = os.path.join(TMP_DIR, "cache", "dedup.sqlite3")
+
+
+import pytest                               # noqa: E402
+from registry import ClientRegistry         # noqa: E402
+
+STORE_PATHS = {
+    "DB_PATH": "db",
+    "EMBED_CACHE_PATH": "embeddings.sqlite3",
+    "MANIFEST_PATH": "manifest.sqlite3",
+    "LEXICAL_INDEX_PATH": "bm25.sqlite3",
+    "DEDUP_INDEX_PATH": "dedup.sqlite3",
+}
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    """
+    Fresh DB, manifest, caches and indexes for one test (the shared clients are reopened)
+    Returns the directory for the test's data files
+    """
+    ClientRegistry.close()
+    for name, file_name in STORE_PATHS.items():
+        monkeypatch.setattr(Config, name, str(tmp_path / "stores" / file_name))
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    yield data_dir
+    ClientRegistry.close()
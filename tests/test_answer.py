@@ -0,0 +1,61 @@
+import os
+import sys
+import random
+import asyncio
+import pytest
+import api
+from assembler import Assembler
+from asyncAssembler import AsyncAssembler
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import fake_llm_server   # noqa: E402
+
+
+@pytest.fixture
+def llm(monkeypatch):
+    server = fake_llm_server.start(ttft_ms=30, token_ms=1, reply_tokens=5)
+    monkeypatch.setattr(api, "BASE_URL", server.base_url)
+    monkeypatch.setattr(api, "API_KEY", "x")
+    monkeypatch.setattr(api, "MODEL", "fake")
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_answer_streams_with_ttft_stats_and_overlap_cut_context(stores, llm):
+    rng = random.Random(0)
+    # one paragraph, several chunks sharing CHUNK_OVERLAP characters with their neighbours
+    text = " ".join("".join(rng.choice("abcdefghij") for _ in range(rng.randint(3, 8))) for _ in range(500))
+    path = stores / "plain.txt"
+    path.write_text(text, encoding="utf-8")
+    Assembler.sync_file(str(path))
+    chunks = Assembler.query_file(str(path))["metadatas"]
+    assert len(chunks) > 2
+    assert any(a["end_offset"] > b["start_offset"] for a, b in zip(chunks, chunks[1:]))
+
+    def check(stream, reply):
+        assert reply == stream.text == "[1] token1 token2 token3 token4"
+        stats = stream.stats
+        assert stats["llm_ttft_ms"] >= 30
+        assert stats["retrieve_ms"] < stats["ttft_ms"] <= stats["total_ms"]
+        assert stats["ttft_ms"] >= stats["llm_ttft_ms"]
+        assert stats["completion_tokens"] == 5 and stats["prompt_tokens"] > stats["context_tokens"]
+        # every chunk packed, the overlaps cut: the file reads once, as one passage
+        assert stats["chunks"] == len(chunks) and stats["dropped"] == 0
+        assert len(stream.sources) == 1 and len(stream.sources[0]["ids"]) == len(chunks)
+        assert stream.packed["context"] == f"[1] plain.txt\n{text}"
+
+    question = text[:40]
+    stream = Assembler.answer(question, n_results=len(chunks), rerank=False)
+    check(stream, "".join(stream))
+    assert stream.stats["cached_tokens"] == 0
+
+    async def main():
+        stream = await AsyncAssembler.answer(question, n_results=len(chunks), rerank=True)
+        reply = "".join([delta async for delta in stream])
+        await AsyncAssembler.aclose()
+        return stream, reply
+    stream, reply = asyncio.run(main())
+    check(stream, reply)
+    # same sources, same prompt prefix: the server's prefix cache hits
+    assert stream.stats["cached_tokens"] > 0
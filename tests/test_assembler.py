@@ -0,0 +1,264 @@
+import random
+from assembler import Assembler
+from embedder import EmbedderFactory
+
+def sections(n=6, seed=0):
+    # random words: sections far apart for near-duplicate detection
+    rng = random.Random(seed)
+
+    def word():
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(3, 8)))
+    return [f"## Section {i}\n\n" + " ".join(word() for _ in range(120)) for i in range(n)]
+
+
+def write_md(path, parts):
+    path.write_text("\n\n".join(parts), encoding="utf-8")
+    return str(path)
+
+
+def failing_embed(monkeypatch, marker):
+    """
+    EmbedderFactory.embed returning None for the texts containing marker
+    """
+    embed = EmbedderFactory.embed
+
+    def patched(data, **kwargs):
+        return [None if marker in text else vector for text, vector in zip(data, embed(data, **kwargs))]
+    monkeypatch.setattr(EmbedderFactory, "embed", staticmethod(patched))
+    return lambda: monkeypatch.setattr(EmbedderFactory, "embed", staticmethod(embed))
+
+
+def test_failed_chunk_keeps_its_record_until_retried(stores, monkeypatch):
+    path = write_md(stores / "a.md", sections())
+    assert Assembler.sync_file(path)["embedded"] == 6
+
+    edited = sections()
+    edited[2] = edited[2][:-6] + "BROKEN"
+    write_md(stores / "a.md", edited)
+    restore = failing_embed(monkeypatch, "BROKEN")
+    assert Assembler.sync_file(path)["embedded"] == 0
+    chunks = Assembler.manifest.get_chunks("a.md")
+    assert len(chunks) == 6 and chunks[2][0] == ""
+
+    # same stat, but the failed chunk is retried
+    restore()
+    assert Assembler.sync_file(path)["embedded"] == 1
+    assert Assembler.db.count() == 6
+    Assembler.delete_file(path)
+    assert Assembler.db.count() == 0
+
+
+def test_query_embedding_cache_is_per_model(stores):
+    vector, cached = Assembler._query_vector("policy  gradient")
+    assert not cached
+    again, cached = Assembler._query_vector("policy gradient")
+    assert cached and again is vector
+    Assembler.query_embeddings.put(("hash:8", "value function"), [1.0] * 8)
+    other, cached = Assembler._query_vector("value function")
+    assert not cached and len(other) == 64
+
+
+def test_query_results_are_dropped_when_another_process_syncs(stores):
+    from config import Config
+    from manifest import IngestManifest
+    write_md(stores / "a.md", sections(3))
+    Assembler.sync_file(str(stores / "a.md"))
+    query = sections(3)[1][20:200]
+    Assembler.query_text(query, 2)
+    Assembler.query_text(query, 2)
+    assert Assembler.last_timings["result_cached"]
+    # another process's sync commits to the manifest, this process's DB version does not move
+    other = IngestManifest(Config.MANIFEST_PATH)
+    other.touch_file("a.md", 1, 1)
+    other.close()
+    Assembler.query_text(query, 2)
+    assert not Assembler.last_timings["result_cached"]
+
+
+def test_concurrent_queries_keep_their_own_timings(stores):
+    import asyncio
+    from asyncAssembler import AsyncAssembler
+    Assembler.sync_file(write_md(stores / "a.md", sections(3)))
+    cached, fresh = sections(3)[0][20:200], sections(3)[2][20:200]
+    Assembler.query_text(cached, 2)
+
+    async def query(text):
+        await AsyncAssembler.query_text(text, 2)
+        await asyncio.sleep(0.05)    # the other query finishes meanwhile
+        return Assembler.last_timings
+
+    async def main():
+        timings = await asyncio.gather(query(cached), query(fresh))
+        await AsyncAssembler.aclose()
+        return timings
+    first, second = asyncio.run(main())
+    assert first["result_cached"] and not second["result_cached"]
+    assert Assembler.last_timings["result_cached"] is False
+
+
+def test_empty_batch_queries(stores):
+    assert Assembler.query_texts([]) == []
+    assert Assembler.query_with_vectors([]) == []
+    assert Assembler.db.query_with_vectors([]) == {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+
+def test_query_text_returns_records_or_own_batch(stores):
+    path = write_md(stores / "q.md", sections())
+    Assembler.sync_file(path)
+    query = sections()[3][20:200]
+    records = Assembler.query_text(query, 3)
+    assert [type(record).__name__ for record in records] == ["RAGRecord"] * 3
+    assert records[0].metadata.source_name == "q.md"
+
+    first = Assembler.query_text(query, 3, columnar=True)
+    first.metadatas[0]["file_path"] = "changed"
+    first.ids.reverse()
+    second = Assembler.query_text(query, 3, columnar=True)
+    assert Assembler.last_timings["result_cached"] and first is not second
+    assert second.ids == [record.id for record in records]
+    assert second.metadatas[0]["file_path"] == "q.md"
+    assert [[r.id for r in hits] for hits in Assembler.query_texts([query], 3)] == [second.ids]
+    assert Assembler.query_hybrid(query, 3, columnar=True).ids[0] == second.ids[0]
+
+
+def test_delete_also_removes_records_the_manifest_lost(stores):
+    path = write_md(stores / "d.md", sections())
+    Assembler.sync_file(path)
+    # a record of the file the manifest does not list (e.g. left by an older version)
+    stray = Assembler._build_records(path, [(99, "stray chunk", [1.0] + [0.0] * 63, {})])
+    Assembler._records_to_db(stray, Assembler.db)
+    assert Assembler.db.count() == 7
+    assert Assembler.delete_file(path) == 7
+    assert Assembler.db.count() == 0
+
+
+def test_text_inserted_above_chunks_only_moves_them(stores):
+    path = write_md(stores / "m.md", sections(8))
+    assert Assembler.sync_file(path)["embedded"] == 8
+    before = {meta["chunk_index"]: meta["start_offset"] for meta in Assembler.query_file(path)["metadatas"]}
+
+    edited = sections(8)
+    edited[0] = edited[0].replace("Section 0", "Section 0abc")
+    write_md(stores / "m.md", edited)
+    result = Assembler.sync_file(path)
+    assert result["embedded"] == 1 and result["moved"] == 7
+    results = Assembler.query_file(path)
+    for document, meta in zip(results["documents"], results["metadatas"]):
+        if meta["chunk_index"] > 0:
+            assert meta["start_offset"] == before[meta["chunk_index"]] + 3
+        assert "\n\n".join(edited)[meta["start_offset"]:meta["end_offset"]] == document
+    assert Assembler.sync_file(path, force=False)["status"] == "skipped"
+
+
+def test_async_sync_file_embeds_groups_as_they_come(stores, monkeypatch):
+    import asyncio
+    from config import Config
+    from asyncAssembler import AsyncAssembler
+    monkeypatch.setattr(Config, "EMBED_STREAM_GROUP", 2)
+    path = write_md(stores / "s.md", sections(7))
+
+    async def main():
+        first = await AsyncAssembler.sync_file(path)
+        edited = sections(7)
+        edited[5] += " tail"
+        write_md(stores / "s.md", edited)
+        return first, await AsyncAssembler.sync_file(path)
+    first, second = asyncio.run(main())
+    assert first["embedded"] == 7 and second["embedded"] == 1 and second["unchanged"] == 6
+    assert len(Assembler.query_file(path)["ids"]) == 7
+
+
+def test_linked_duplicates_are_read_as_chunks_of_their_file(stores):
+    parts, extra = sections(), sections(2, seed=1)
+    a = write_md(stores / "a.md", parts)
+    b = write_md(stores / "b.md", [extra[0], parts[1], parts[3], extra[1]])
+    Assembler.sync_file(a)
+    result = Assembler.sync_file(b)
+    assert result["embedded"] == 2 and result["linked"] == 2
+    shared_id = Assembler.manifest.get_chunks("b.md")[2][1]
+    assert shared_id == Assembler.manifest.get_chunks("a.md")[3][1]
+
+    found = Assembler.query_file(b)
+    assert sorted(meta["chunk_index"] for meta in found["metadatas"]) == [0, 1, 2, 3]
+    assert {meta["file_path"] for meta in found["metadatas"]} == {"b.md"}
+    query = parts[3][20:200]
+    for hits in (Assembler.query_text(query, 2, where={"file_path": "b.md"}, columnar=True),
+                 Assembler.query_hybrid(query, 2, where={"file_path": {"$in": ["b.md"]}}, columnar=True),
+                 Assembler.query_texts([query], 2, where={"file_path": "b.md"}, columnar=True)[0]):
+        assert hits.ids[0] == shared_id
+        assert (hits.metadatas[0]["file_path"], hits.metadatas[0]["chunk_index"]) == ("b.md", 2)
+
+    # deleting the linking file leaves the shared records, deleting the owner moves them over
+    Assembler.delete_file(b)
+    assert Assembler.db.count() == 6 and len(Assembler.query_file(a)["ids"]) == 6
+    Assembler.sync_file(b)
+    Assembler.delete_file(a)
+    found = Assembler.query_file(b)
+    assert sorted(meta["chunk_index"] for meta in found["metadatas"]) == [0, 1, 2, 3]
+    assert Assembler.db.count() == 4
+    assert Assembler.delete_file(b) == 4 and Assembler.db.count() == 0
+
+
+def test_near_duplicates_are_embedded_again_when_their_record_changes(stores, monkeypatch):
+    from config import Config
+    monkeypatch.setattr(Config, "DEDUP_MODE", "near")
+    parts, extra = sections(), sections(1, seed=1)
+    near = parts[1].replace(parts[1].split()[10], "changed", 1)
+    a = write_md(stores / "a.md", parts)
+    b = write_md(stores / "b.md", [extra[0], near, parts[3]])
+    Assembler.sync_file(a)
+    result = Assembler.sync_file(b)
+    assert result["embedded"] == 1 and result["linked"] == 2
+
+    # a's chunks 1 and 3 change: the exact link gets a copy, the near one is left for b's next sync
+    edited = list(parts)
+    edited[1], edited[3] = sections(2, seed=2)
+    write_md(stores / "a.md", edited)
+    Assembler.sync_file(a)
+    chunks = Assembler.manifest.get_chunks("b.md")
+    assert sorted(chunks) == [0, 2] and chunks[2][1] == Assembler._own_record_id("b.md", 2)
+    assert Assembler.manifest.get_file("b.md")["content_hash"] == ""
+    result = Assembler.sync_file(b)
+    assert (result["embedded"], result["unchanged"]) == (1, 2)
+    found = Assembler.query_file(b)
+    assert [doc for doc, meta in zip(found["documents"], found["metadatas"]) if meta["chunk_index"] == 1] == [near]
+    assert Assembler.db.count() == 6 + 3
+
+
+def test_write_through_sync_commits_group_by_group(stores, monkeypatch):
+    import csv
+    import asyncio
+    from config import Config
+    from asyncAssembler import AsyncAssembler
+    monkeypatch.setattr(Config, "EMBED_STREAM_GROUP", 4)
+    rng = random.Random(0)
+    rows = [{"sku": f"S{i}", "name": " ".join(rng.choice(["red", "blue", "cup", "lamp", "desk"]) for _ in range(4)),
+             "price": i} for i in range(30)]
+    path = stores / "items.csv"
+
+    def write(rows):
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, ["sku", "name", "price"])
+            writer.writeheader()
+            writer.writerows(rows)
+    write(rows + rows[3:5])   # two rows again at the end: linked to the first ones
+    job = Assembler._check_file(str(path))
+    assert job.write_through
+    job.chunks = Assembler._iter_chunks(str(path))
+    Assembler._prepare_records(job)
+    # nothing per row is held: the records and manifest rows went out group by group
+    assert len(job.records) == 0 and not (job.inflight or job.rows or job.links or job.moved)
+    result = Assembler._commit_file(job)
+    assert (result["embedded"], result["linked"]) == (30, 2)
+    assert Assembler.db.count() == 30 and len(Assembler.manifest.get_chunks("items.csv")) == 32
+
+    edited = [dict(row) for row in rows[:20]]
+    edited[7]["price"] = 700
+    write(edited)
+    result = asyncio.run(AsyncAssembler.sync_file(str(path)))
+    assert (result["embedded"], result["unchanged"], result["deleted"]) == (1, 19, 10)
+    chunks = Assembler.manifest.get_chunks("items.csv")
+    assert sorted(chunks) == list(range(20)) and all(h for h, _, _ in chunks.values())
+    assert Assembler.db.count() == 20 and len(Assembler.query_file(str(path))["ids"]) == 20
+    assert "700" in Assembler.db.get_by_ids([chunks[7][1]])["documents"][0]
+    assert Assembler.sync_file(str(path))["status"] == "skipped"
@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import numpy as np
+from embedder import HuggingFaceEmbedder, HashingEmbedder, EmbedderFactory, parse_model_spec
+from embeddingCache import EmbeddingCache
+
+
+class StubClient:
+    """
+    feature_extraction like InferenceClient: one vector per text, [len(text), i].
+    fail: texts whose batch raises, failures: how many calls raise before answering
+    """
+    def __init__(self, fail=(), failures=0):
+        self.fail = set(fail)
+        self.failures = failures
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def feature_extraction(self, batch):
+        with self.lock:
+            self.batches.append(list(batch))
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError("stub failure")
+        if self.fail & set(batch):
+            raise ValueError("bad chunk")
+        return np.array([[len(text), float(text.split("-")[-1])] for text in batch], dtype=np.float32)
+
+
+class AsyncStubClient:
+    """
+    AsyncInferenceClient stand-in, records the most requests in flight at once
+    """
+    def __init__(self):
+        self.active = self.peak = 0
+
+    async def feature_extraction(self, batch):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return np.array([[len(text), float(text.split("-")[-1])] for text in batch], dtype=np.float32)
+
+
+def embed(data, client, **kwargs):
+    kwargs = {"batch_size": 4, "max_batch_chars": 10_000, "max_workers": 3, "max_retries": 2, "backoff": 0,
+              **kwargs}
+    return HuggingFaceEmbedder.embed(data, model_id="stub", client=client, cache=False, **kwargs)
+
+
+def test_batches_capped_by_count_and_chars():
+    data = [f"t-{i}" for i in range(10)]
+    assert [len(batch) for _, batch in HuggingFaceEmbedder._make_batches(data, 4, 10_000)] == [4, 4, 2]
+    assert [start for start, _ in HuggingFaceEmbedder._make_batches(data, 4, 10_000)] == [0, 4, 8]
+    # 3 chars each: two fit under 7 chars, a longer chunk still gets its own batch
+    batches = HuggingFaceEmbedder._make_batches(["a-1", "b-2", "c-3", "x" * 20 + "-4"], 10, 7)
+    assert [batch for _, batch in batches] == [["a-1", "b-2"], ["c-3"], ["x" * 20 + "-4"]]
+
+
+def test_order_preserved_across_concurrent_batches():
+    client = StubClient()
+    data = [f"chunk-{i}" for i in range(50)]
+    vectors = embed(data, client)
+    assert [int(v[1]) for v in vectors] == list(range(50))
+    assert vectors[0].dtype == np.float32
+    assert sorted(len(batch) for batch in client.batches) == [2] + [4] * 12
+
+
+def test_retry_after_transient_errors():
+    client = StubClient(failures=2)
+    vectors = embed([f"t-{i}" for i in range(3)], client, max_workers=1)
+    assert [int(v[1]) for v in vectors] == [0, 1, 2]
+    assert len(client.batches) == 3
+
+
+def test_failing_chunk_gets_none_and_keeps_its_batch():
+    client = StubClient(fail={"t-2"})
+    vectors = embed([f"t-{i}" for i in range(4)], client, max_retries=1)
+    assert vectors[2] is None
+    assert [int(v[1]) for i, v in enumerate(vectors) if i != 2] == [0, 1, 3]
+    # 2 tries of the batch, then one request per chunk (2 tries for the bad one)
+    assert len(client.batches) == 2 + 3 + 2
+
+
+def test_hash_spec_through_factory():
+    assert parse_model_spec("hash:32") == ("hash", "32")
+    assert EmbedderFactory.get_embedder("hash:32") == (HashingEmbedder, "32")
+    vectors = EmbedderFactory.embed(["强化学习", "reinforcement learning", "强化学习"], model="hash:32")
+    assert [len(v) for v in vectors] == [32, 32, 32]
+    assert np.allclose(vectors[0], vectors[2]) and not np.allclose(vectors[0], vectors[1])
+    assert np.isclose(np.linalg.norm(vectors[1]), 1.0)
+    # float32 arrays end to end, from the model and from the cache
+    cache = EmbeddingCache(":memory:")
+    for _ in range(2):
+        vectors = EmbedderFactory.embed(["强化学习", "policy"], model="hash:32", cache=cache)
+        assert all(isinstance(v, np.ndarray) and v.dtype == np.float32 for v in vectors)
+    cache.close()
+
+
+def test_concurrent_async_calls_share_one_limit():
+    client = AsyncStubClient()
+
+    async def main():
+        calls = [HuggingFaceEmbedder.aembed([f"c{n}-{i}" for i in range(8)], model_id="stub", client=client,
+                                            cache=False, batch_size=2, max_workers=3, backoff=0)
+                 for n in range(4)]
+        return await asyncio.gather(*calls)
+    results = asyncio.run(main())
+    assert [[int(v[1]) for v in vectors] for vectors in results] == [list(range(8))] * 4
+    assert client.peak == 3
@@ -0,0 +1,24 @@
+from embeddingCache import EmbeddingCache
+from embedder import HashingEmbedder
+
+
+def test_eviction_keeps_count_without_rescanning():
+    cache = EmbeddingCache(":memory:", max_entries=10)
+    for i in range(25):
+        cache.put_many("m", [f"text {i}", f"text {i}"], [[float(i)], [float(i)]])
+        assert cache._count == cache.count() <= 10
+    # replacing an entry does not grow the count
+    cache.put_many("m", ["text 24"], [[1.0]])
+    assert cache._count == cache.count()
+    assert cache.get_many("m", ["text  24", "text 0"]) == [[1.0], None]
+    cache.close()
+
+
+def test_stats_are_per_call():
+    cache = EmbeddingCache(":memory:")
+    first, second = {}, {}
+    HashingEmbedder.embed(["a", "b"], "16", cache=cache, stats=first)
+    HashingEmbedder.embed(["a", "b", "c"], "16", cache=cache, stats=second)
+    assert first == {"hits": 0, "misses": 2}
+    assert second == {"hits": 2, "misses": 1}
+    cache.close()
@@ -0,0 +1,64 @@
+import math
+import random
+from collections import Counter
+from lexicalIndex import LexicalIndex, tokenize
+
+
+def reference_bm25(docs, query, k1=1.5, b=0.75):
+    """
+    docs: {record_id: text} -> {record_id: score}, straight from the formula
+    """
+    counts = {record_id: Counter(tokenize(text)) for record_id, text in docs.items()}
+    avg_length = sum(sum(c.values()) for c in counts.values()) / len(counts)
+    scores = Counter()
+    for term, qtf in Counter(tokenize(query)).items():
+        df = sum(1 for c in counts.values() if term in c)
+        if not df:
+            continue
+        idf = math.log(1 + (len(counts) - df + 0.5) / (df + 0.5))
+        for record_id, c in counts.items():
+            if term in c:
+                norm = k1 * (1 - b + b * sum(c.values()) / avg_length)
+                scores[record_id] += qtf * idf * c[term] * (k1 + 1) / (c[term] + norm)
+    return scores
+
+
+def corpus(n=200, seed=0):
+    rng = random.Random(seed)
+    vocab = ["agent", "reward", "policy", "智能体", "动作", "value", "state", "蜂医", "q-learning", "return"]
+    return {f"id{i}": " ".join(rng.choice(vocab) for _ in range(rng.randint(3, 40))) for i in range(n)}
+
+
+def test_scores_match_the_formula():
+    docs = corpus()
+    index = LexicalIndex(path=None)
+    ids = list(docs)
+    index.add(ids, [docs[i] for i in ids], [{"file_path": f"f{int(i[2:]) % 3}.md"} for i in ids])
+    for query in ["policy reward", "智能体的动作", "q-learning value value", "unknown"]:
+        expected = reference_bm25(docs, query)
+        results = index.search(query, 10)
+        assert len(results) == min(10, len(expected))
+        assert all(math.isclose(score, expected[record_id]) for record_id, score in results)
+        best = sorted(expected.values(), reverse=True)[:10]
+        assert all(math.isclose(score, top) for (_, score), top in zip(results, best))
+    filtered = index.search("policy", 5, where={"file_path": "f1.md"})
+    assert len(filtered) == 5 and all(int(record_id[2:]) % 3 == 1 for record_id, _ in filtered)
+
+
+def test_incremental_writes_persist(tmp_path):
+    path = tmp_path / "bm25.sqlite3"
+    index = LexicalIndex(path)
+    index.add(["a", "b", "c"], ["agent reward", "policy reward", "蜂医 is a medic"],
+              [{"file_path": "x", "chunk_index": 0}, {"file_path": "x", "chunk_index": 1}, {"file_path": "y"}])
+    index.add(["a"], ["agent value"], [{"file_path": "x", "chunk_index": 0}])
+    index.remove_file("x", from_chunk=1)
+    index.save()
+    index.close()
+
+    index = LexicalIndex(path)
+    assert len(index) == 2
+    assert {record_id for record_id, _ in index.search("agent reward 蜂医")} == {"a", "c"}
+    assert index.search("reward") == []
+    index.remove(["c"])
+    assert index.search("蜂医") == [] and len(index) == 1
+    index.close()
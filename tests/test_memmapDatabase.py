@@ -0,0 +1,89 @@
+import pytest
+import numpy as np
+from memmapDatabase import MemmapVectorDatabase, where_to_sql
+
+
+def vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_failed_upsert_keeps_the_previous_record(tmp_path):
+    db = MemmapVectorDatabase("c", tmp_path, storage="float32")
+    data = vectors(3)
+    assert db.add_documents(["a", "b", "c"], data, [{"n": i} for i in range(3)], ["a", "b", "c"])
+    # the records upsert fails after the vectors could have been appended
+    with db._conn:
+        db._conn.execute("CREATE TEMP TRIGGER fail BEFORE UPDATE ON records BEGIN SELECT RAISE(ABORT, 'no'); END")
+    assert not db.add_documents(["new a"], data[2:3], [{"n": 9}], ["a"])
+    found = db.get_by_ids(["a"], include=["documents", "metadatas", "embeddings"])
+    assert (found["documents"], found["metadatas"]) == (["a"], [{"n": 0}])
+    np.testing.assert_allclose(found["embeddings"][0], data[0] / np.linalg.norm(data[0]), atol=1e-6)
+    assert db.query_with_vector(data[0], 1)["ids"] == [["a"]]
+
+
+def test_upsert_tombstone_compaction_and_reopen(tmp_path):
+    db = MemmapVectorDatabase("c", tmp_path, storage="float32")
+    data = vectors(3000)
+    ids = [f"r{i}" for i in range(len(data))]
+    assert db.add_documents(ids, data, [{"i": i} for i in range(len(data))], ids)
+    # upsert: r0 gets r1's vector, its old row is tombstoned
+    assert db.add_documents(["again"], data[1:2], [{"i": -1}], ["r0"])
+    assert set(db.query_with_vector(data[1], 2)["ids"][0]) == {"r0", "r1"}
+    assert db.get_by_ids(["r0"])["documents"] == ["again"]
+    assert db.count() == len(db.index) == 3000
+
+    # enough tombstones to compact the vector file
+    assert db.delete_by_ids(ids[1000:2500] + ["nope"]) == 1500
+    assert db.index._n == len(db.index) == db.count() == 1500
+    assert db.query_with_vector(data[2000], 1)["ids"][0] != ["r2000"]
+    db.close()
+
+    db = MemmapVectorDatabase("c", tmp_path, storage="float32")
+    assert db.count() == len(db.index) == 1500
+    assert db.query_with_vector(data[2600], 1)["ids"] == [["r2600"]]
+    assert set(db.query_with_vector(data[1], 2)["ids"][0]) == {"r0", "r1"}
+    assert [page["ids"][0] for page in db.iter_pages(page_size=1000, include=[])] == ["r0", "r2500"]
+
+
+def test_readonly_reader_sees_the_writer(tmp_path):
+    writer = MemmapVectorDatabase("c", tmp_path, storage="float32")
+    data = vectors(20)
+    ids = [f"r{i}" for i in range(20)]
+    writer.add_documents(ids[:10], data[:10], [{"part": "a"}] * 10, ids[:10])
+    reader = MemmapVectorDatabase("c", tmp_path, storage="float32", readonly=True)
+    where = {"part": "b"}
+    assert reader.count() == 10 and reader.query_with_vector(data[15], 1, where=where)["ids"] == [[]]
+
+    writer.add_documents(ids[10:], data[10:], [{"part": "b"}] * 10, ids[10:])
+    assert reader.query_with_vector(data[15], 1)["ids"] == [["r15"]]
+    # the filter's cached row mask is not reused once the writer changed the records
+    assert reader.query_with_vector(data[15], 1, where=where)["ids"] == [["r15"]]
+    writer.update_metadatas(["r15"], [{"part": "a"}])
+    assert "r15" not in reader.query_with_vector(data[15], 3, where=where)["ids"][0]
+    writer.delete_by_ids(["r16"])
+    assert reader.count() == 19 and "r16" not in reader.query_with_vector(data[16], 3)["ids"][0]
+    writer.index.compact()
+    assert reader.query_with_vector(data[17], 1)["ids"] == [["r17"]] and len(reader.index) == 19
+
+
+def test_where_to_sql_operators(tmp_path):
+    db = MemmapVectorDatabase("c", tmp_path, storage="float32")
+    metadatas = [{"n": i, "kind": "odd" if i % 2 else "even", "odd name": i % 3} for i in range(10)]
+    ids = [f"r{i}" for i in range(10)]
+    db.add_documents(ids, vectors(10), metadatas, ids)
+
+    def found(where):
+        return sorted(int(record_id[1:]) for record_id in db.get_ids(where))
+    assert found({"kind": "odd"}) == found({"kind": {"$eq": "odd"}}) == [1, 3, 5, 7, 9]
+    assert found({"kind": {"$ne": "odd"}}) == [0, 2, 4, 6, 8]
+    assert found({"n": {"$gt": 7}}) == [8, 9] and found({"n": {"$gte": 7}}) == [7, 8, 9]
+    assert found({"n": {"$lt": 2}}) == [0, 1] and found({"n": {"$lte": 2}}) == [0, 1, 2]
+    assert found({"n": {"$in": [1, 4, 40]}}) == [1, 4]
+    assert found({"n": {"$nin": list(range(8))}}) == [8, 9]
+    assert found({"n": {"$gte": 2, "$lt": 5}}) == [2, 3, 4]
+    assert found({"$and": [{"kind": "even"}, {"n": {"$gt": 4}}]}) == [6, 8]
+    assert found({"$or": [{"n": 1}, {"$and": [{"kind": "even"}, {"n": {"$gte": 8}}]}]}) == [1, 8]
+    assert found({"odd name": 0}) == [0, 3, 6, 9]
+    assert where_to_sql(None) == ("1", [])
+    with pytest.raises(ValueError):
+        where_to_sql({"n": {"$regex": "1"}})
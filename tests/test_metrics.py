@@ -0,0 +1,28 @@
+import pytest
+from metrics import Metrics
+
+
+def test_timed_iter_counts_only_real_errors():
+    Metrics.reset()
+    closed = []
+
+    def source():
+        try:
+            yield from range(10)
+        finally:
+            closed.append(True)
+
+    for item in Metrics.timed_iter(source(), "stream", kind="early"):
+        if item == 2:
+            break
+    assert closed == [True]
+    assert Metrics.counter("stream_errors_total", kind="early") == 0
+    assert Metrics.recent_spans("stream")[-1]["ok"] and Metrics.recent_spans("stream")[-1]["items"] == 3
+
+    def failing():
+        yield 1
+        raise ValueError("broken source")
+    with pytest.raises(ValueError):
+        list(Metrics.timed_iter(failing(), "stream", kind="failed"))
+    assert Metrics.counter("stream_errors_total", kind="failed") == 1
+    assert not Metrics.recent_spans("stream")[-1]["ok"]
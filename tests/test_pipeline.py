@@ -0,0 +1,53 @@
+import csv
+from assembler import Assembler
+from test_assembler import sections, write_md
+
+
+def write_files(data_dir):
+    for i in range(4):
+        write_md(data_dir / f"doc{i}.md", sections(4, seed=i))
+    with open(data_dir / "rows.csv", "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["sku", "name"])
+        writer.writerows([f"S{i}", f"item number {i}"] for i in range(50))
+
+
+def embedded(result):
+    return result["stages"]["embed"]["chunks"]
+
+
+def test_store_directory_embeds_once(stores):
+    write_files(stores)
+    result = Assembler.store_directory(str(stores), load_workers=2, embed_workers=3)
+    assert embedded(result) == 4 * 4 + 50 and result["stages"]["write"]["errors"] == 0
+    assert Assembler.db.count() == 4 * 4 + 50 and len(Assembler.manifest.list_files()) == 5
+
+    # nothing changed: every file is skipped at the scan; a new file made of chunks
+    # of another one is linked to their records
+    write_md(stores / "copy.md", sections(4, seed=0)[1:3])
+    result = Assembler.store_directory(str(stores), load_workers=2, embed_workers=3)
+    assert embedded(result) == 0 and result["stages"]["load"]["files"] == 1
+    assert Assembler.db.count() == 4 * 4 + 50
+    found = Assembler.query_file(str(stores / "copy.md"))
+    assert sorted(meta["chunk_index"] for meta in found["metadatas"]) == [0, 1]
+
+
+def test_files_of_a_failed_write_are_retried(stores, monkeypatch):
+    write_files(stores)
+    records_to_db = Assembler._records_to_db
+
+    def failing(records, db):
+        if any(meta["file_path"] in ("doc1.md", "doc3.md") for meta in records.metadatas):
+            return False
+        return records_to_db(records, db)
+    monkeypatch.setattr(Assembler, "_records_to_db", staticmethod(failing))
+    # one file per write batch, the failures stay with their own files
+    result = Assembler.store_directory(str(stores), write_batch=1)
+    assert result["stages"]["write"]["errors"] == 2
+    assert sorted(Assembler.manifest.list_files()) == ["doc0.md", "doc2.md", "rows.csv"]
+    assert Assembler.db.count() == 2 * 4 + 50
+
+    monkeypatch.setattr(Assembler, "_records_to_db", staticmethod(records_to_db))
+    result = Assembler.store_directory(str(stores), write_batch=1)
+    assert embedded(result) == 2 * 4 and result["stages"]["load"]["files"] == 2
+    assert len(Assembler.manifest.list_files()) == 5 and Assembler.db.count() == 4 * 4 + 50
@@ -0,0 +1,70 @@
+import uuid
+import tracemalloc
+import numpy as np
+from quantization import QuantizedIndex, normalize
+
+
+def test_upserts_removes_and_reopen_keep_the_id_map(tmp_path):
+    rng = np.random.default_rng(0)
+    data = normalize(rng.standard_normal((3000, 16)))
+    ids = [str(uuid.uuid4()) for _ in range(len(data))]
+    index = QuantizedIndex(tmp_path / "index", "int8")
+    # enough batches that the recent ids are merged into the sorted hashes on the way
+    for start in range(0, len(data), 500):
+        index.add(ids[start:start + 500], data[start:start + 500])
+    index.add(ids[:10], data[10:20])                     # upsert: row 10..19's vectors under ids 0..9
+    index.add(["a-much-longer-record-id-than-any-uuid"] * 2, data[:2])   # widens the id array
+    assert index.remove(ids[20:30] + ids[20:22] + ["missing"]) == 10
+    assert len(index) == len(data) - 10 + 1
+
+    def check(index):
+        found, _ = index.search(data[10], k=2)[0]
+        assert set(found) == {ids[0], ids[10]}
+        assert index.search(data[25], k=1, allowed=set(ids[20:30]))[0] == ([], [])
+        assert index.search(data[1], k=1)[0][0] == ["a-much-longer-record-id-than-any-uuid"]
+        vectors = index.get_vectors([ids[5], ids[25], "nope"])
+        np.testing.assert_allclose(vectors[0], data[15], atol=1e-6)
+        assert not vectors[1:].any()
+    check(index)
+    index.close()
+    check(QuantizedIndex(tmp_path / "index", "int8", readonly=True))
+
+
+def test_memory_bytes_is_what_the_index_allocates(tmp_path):
+    rng = np.random.default_rng(1)
+    data = normalize(rng.standard_normal((20000, 32)))
+    index = QuantizedIndex(tmp_path / "index", "int8")
+    index.add([str(uuid.uuid4()) for _ in range(len(data))], data)
+    index.close()
+    tracemalloc.start()
+    index = QuantizedIndex(tmp_path / "index", "int8", readonly=True)
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    resident = index.memory_bytes()["resident"]
+    # ids: 36 bytes + hash and row (12), no Python object per row
+    assert 32 + 4 + 1 + 36 + 12 <= index.memory_bytes()["per_vector"] < 100
+    assert 0.9 * allocated < resident < 1.1 * allocated
+
+
+def test_filter_row_mask_is_cached_until_rows_change(tmp_path):
+    rng = np.random.default_rng(2)
+    data = normalize(rng.standard_normal((200, 16)))
+    ids = [str(i) for i in range(len(data))]
+    index = QuantizedIndex(tmp_path / "index", "int8")
+    index.add(ids, data)
+    calls = []
+
+    def allowed():
+        calls.append(1)
+        return ids[:50]
+    for _ in range(3):
+        found, _ = index.search(data[120], k=3, allowed=allowed, allowed_key=("first 50", 1))[0]
+        assert all(int(record_id) < 50 for record_id in found)
+    assert len(calls) == 1
+    # an upsert moves a row: the mask is read again
+    index.add([ids[0]], data[120:121])
+    assert index.search(data[120], k=1, allowed=allowed, allowed_key=("first 50", 1))[0][0] == [ids[0]]
+    assert len(calls) == 2
+    index.remove([ids[0]])
+    assert ids[0] not in index.search(data[120], k=3, allowed=allowed, allowed_key=("first 50", 1))[0][0]
+    assert len(calls) == 3
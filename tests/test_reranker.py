@@ -0,0 +1,23 @@
+import time
+import numpy as np
+from reranker import CrossEncoder
+
+
+def test_budget_starts_after_the_model_load(monkeypatch):
+    def tokenizer(queries, documents, **kwargs):
+        return {"n": np.array([len(d) for d in documents])}
+
+    def slow_load(model_id):
+        time.sleep(0.2)
+        return tokenizer, lambda encoded: encoded["n"].astype(np.float32)
+    monkeypatch.setattr(CrossEncoder, "_get_model", staticmethod(slow_load))
+    scores = CrossEncoder.score("q", ["a", "bb", "ccc"], budget_ms=50, batch_size=1)
+    assert scores.tolist() == [1, 2, 3]
+
+    # a batch that starts past the budget is not run
+    def slow_model(encoded):
+        time.sleep(0.06)
+        return encoded["n"].astype(np.float32)
+    monkeypatch.setattr(CrossEncoder, "_get_model", staticmethod(lambda model_id: (tokenizer, slow_model)))
+    scores = CrossEncoder.score("q", ["a", "bb", "ccc"], budget_ms=50, batch_size=1)
+    assert scores[0] == 1 and np.isnan(scores[1:]).all()
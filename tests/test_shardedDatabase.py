@@ -0,0 +1,58 @@
+import numpy as np
+from shardedDatabase import ShardedVectorDatabase
+
+
+def records(n, dim=64, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dim)).astype(np.float32)
+    ids = [f"id-{i}" for i in range(n)]
+    metadatas = [{"file_path": f"C{i % 3}/f{i % 7}.md", "chunk_index": i} for i in range(n)]
+    return ids, vectors, metadatas
+
+
+def top_k(vectors, query, k, rows=None):
+    rows = np.arange(len(vectors)) if rows is None else np.asarray(rows)
+    unit = vectors[rows] / np.linalg.norm(vectors[rows], axis=1, keepdims=True)
+    return [f"id-{i}" for i in rows[np.argsort(-(unit @ (query / np.linalg.norm(query))))[:k]]]
+
+
+def test_global_top_k_is_the_single_collection_top_k(tmp_path):
+    ids, vectors, metadatas = records(300)
+    for by in ("hash", "subdir"):
+        db = ShardedVectorDatabase("kb", tmp_path / by, by=by, count=4)
+        assert db.add_documents(ids, vectors, metadatas, ids)
+        assert sum(db.shard_counts().values()) == db.count() == 300 and len(db.shards) in (3, 4)
+        queries = np.random.default_rng(1).standard_normal((5, 64)).astype(np.float32)
+        results = db.query_with_vectors(queries, n_results=10)
+        for query, found, distances in zip(queries, results["ids"], results["distances"]):
+            assert found == top_k(vectors, query, 10)
+            assert distances == sorted(distances)
+        where = {"file_path": {"$in": ["C1/f1.md", "C2/f2.md"]}}
+        rows = [i for i, meta in enumerate(metadatas) if meta["file_path"] in where["file_path"]["$in"]]
+        assert db.query_with_vector(queries[0], 5, where=where)["ids"] == [top_k(vectors, queries[0], 5, rows)]
+
+
+def test_filter_subdirs_routing():
+    subdirs = ShardedVectorDatabase._filter_subdirs
+    assert subdirs(None) is None and subdirs({"source_type": "md"}) is None
+    assert subdirs({"file_path": "C1/a.md"}) == {"C1"}
+    assert subdirs({"file_path": {"$eq": "a.md"}}) == {""}
+    assert subdirs({"file_path": {"$in": ["C1/a.md", "C2/b/c.md"]}}) == {"C1", "C2"}
+    assert subdirs({"$and": [{"file_path": {"$in": ["C1/a.md", "C2/b.md"]}}, {"file_path": "C2/b.md"}]}) == {"C2"}
+    assert subdirs({"$and": [{"file_path": "C1/a.md"}, {"chunk_index": {"$gte": 3}}]}) == {"C1"}
+    assert subdirs({"$or": [{"file_path": "C1/a.md"}, {"file_path": {"$in": ["C3/x.md"]}}]}) == {"C1", "C3"}
+    # one branch of an $or may match anywhere
+    assert subdirs({"$or": [{"file_path": "C1/a.md"}, {"source_type": "pdf"}]}) is None
+
+
+def test_delete_by_files_in_both_modes(tmp_path):
+    ids, vectors, metadatas = records(90)
+    for by in ("hash", "subdir"):
+        db = ShardedVectorDatabase("kb", tmp_path / by, by=by, count=3)
+        db.add_documents(ids, vectors, metadatas, ids)
+        gone = ["C0/f0.md", "C1/f1.md", "C5/missing.md"]
+        expected = sum(meta["file_path"] in gone for meta in metadatas)
+        assert db.delete_by_files(gone) == expected
+        assert db.count() == 90 - expected
+        assert not db.get_ids({"file_path": {"$in": gone}})
+        assert db.delete_by_ids(["id-2", "id-2", "nope"]) == 1 and db.count() == 90 - expected - 1